@@ -0,0 +1,207 @@
+import os
+from array import array
+from bisect import bisect_right
+from pathlib import Path
+
+import mp3_frames
+
+AUDIO_FSYNC_EVERY = int(os.environ.get("AUDIO_FSYNC_EVERY", "32"))  # segments per fsync batch
+SEEK_INDEX_INTERVAL = 1.0  # seconds of audio between seek index entries
+
+# Writers of in-progress files by output path, so the finished prefix can be served while converting
+_active_writers = {}
+
+
+def get_active_writer(output_path):
+    return _active_writers.get(str(Path(output_path)))
+
+
+class StreamingAudioWriter:
+    """Append audio segments to a temporary file and move it into place atomically when done.
+
+    Segments are parsed into MP3 frames as they are written so the writer always knows
+    the exact audio time at the end of the file. The first frame of the file is reserved
+    for a Xing/Info header whose seek table is filled in on commit.
+    """
+
+    def __init__(self, output_path, fsync_every=AUDIO_FSYNC_EVERY, resume_offset=0):
+        self.output_path = Path(output_path)
+        self.temp_path = self.output_path.with_name(self.output_path.name + '.part')
+        self.fsync_every = max(1, fsync_every)
+        self.bytes_written = 0
+        self.segments_written = 0
+        self.frame_count = 0
+        self.duration = 0.0
+        self.header_size = 0  # bytes reserved for the Xing/Info frame
+        self.published_bytes = 0  # end of the ordered prefix that readers of temp_path can rely on
+        self._unsynced = 0
+        self._reference_frame = None  # first audio frame; the Xing header copies its format
+        self._bitrates = set()
+        # Sampled (time, byte offset) pairs used to build the seek table
+        self._index_times = array('d')
+        self._index_offsets = array('q')
+        self._next_index_time = 0.0
+
+        if resume_offset:
+            # Continue a checkpointed file, dropping anything written after the checkpoint
+            self._file = open(self.temp_path, 'r+b')
+            self._rescan(resume_offset)
+            self._file.truncate(resume_offset)
+            self._file.seek(resume_offset)
+            self.bytes_written = resume_offset
+            self.published_bytes = resume_offset
+        else:
+            self._file = open(self.temp_path, 'wb')
+        _active_writers[str(self.output_path)] = self
+
+    @staticmethod
+    def can_resume(output_path, resume_offset):
+        """True if a partial file holds at least resume_offset bytes"""
+        output_path = Path(output_path)
+        temp_path = output_path.with_name(output_path.name + '.part')
+        return temp_path.exists() and temp_path.stat().st_size >= resume_offset
+
+    def _rescan(self, limit):
+        """Rebuild frame statistics from the first `limit` bytes of a partial file"""
+        self._file.seek(0)
+        for offset, frame, is_xing in mp3_frames.iter_file_frames(self._file, limit):
+            if is_xing:
+                self.header_size = offset + frame["length"]
+                continue
+            if self._reference_frame is None:
+                self._reference_frame = frame
+            self._account_frame(frame, offset)
+
+    def _account_frame(self, frame, offset):
+        if self.duration >= self._next_index_time:
+            self._index_times.append(self.duration)
+            self._index_offsets.append(offset)
+            self._next_index_time += SEEK_INDEX_INTERVAL
+        self.frame_count += 1
+        self.duration += frame["samples"] / frame["sample_rate"]
+        self._bitrates.add(frame["bitrate"])
+
+    def write(self, audio_bytes):
+        """Append the MP3 frames of one segment; returns the byte offset they were written at"""
+        frames = list(mp3_frames.iter_frames(audio_bytes))
+        if not frames:
+            print(f"  ! Skipping segment without MP3 audio frames ({len(audio_bytes)} bytes)")
+            return self.bytes_written
+
+        if self._reference_frame is None:
+            # Reserve room for the Xing/Info header frame
+            self._reference_frame = frames[0][1]
+            placeholder = mp3_frames.build_xing_frame(self._reference_frame, 0, 0, [0] * 100)
+            self._file.write(placeholder)
+            self.bytes_written += len(placeholder)
+            self.header_size = len(placeholder)
+
+        offset = self.bytes_written
+        frame_bytes = 0
+        for pos, frame in frames:
+            self._account_frame(frame, offset + frame_bytes)
+            frame_bytes += frame["length"]
+
+        if frame_bytes == len(audio_bytes):
+            self._file.write(audio_bytes)
+        else:
+            # Drop tags, stray headers and partial frames so the stream stays seekable
+            self._file.write(b''.join(audio_bytes[pos:pos + frame["length"]] for pos, frame in frames))
+
+        self.bytes_written += frame_bytes
+        self.segments_written += 1
+        self._unsynced += 1
+        if self._unsynced >= self.fsync_every:
+            self.sync()
+        else:
+            self._file.flush()
+        # Whole segments only, so progressive readers never see a torn frame
+        self.published_bytes = self.bytes_written
+        return offset
+
+    @property
+    def cbr(self):
+        return len(self._bitrates) == 1
+
+    def frame_boundary(self, time):
+        """(time, byte offset) of the start of the frame playing at `time`.
+
+        The seek index only samples one frame per SEEK_INDEX_INTERVAL, so the frames after
+        the nearest entry are read back from the file to find the exact one.
+        """
+        index = max(0, bisect_right(self._index_times, time) - 1)
+        start, offset = self._index_times[index], self._index_offsets[index]
+        end = self._index_offsets[index + 1] if index + 1 < len(self._index_offsets) else self.bytes_written
+        if start >= time:
+            return start, offset
+        # Before commit the frames are in the partial file, afterwards in the audiobook
+        path = self.temp_path if self.temp_path.exists() else self.output_path
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            base = offset
+            for frame_offset, frame, is_xing in mp3_frames.iter_file_frames(f, end - base):
+                frame_duration = frame["samples"] / frame["sample_rate"]
+                if start + frame_duration > time:
+                    break
+                start += frame_duration
+                offset = base + frame_offset + frame["length"]
+        return start, offset
+
+    def _build_toc(self):
+        """Xing TOC: for each percent of the duration, the file position as a fraction of 256"""
+        toc = []
+        for i in range(100):
+            index = max(0, bisect_right(self._index_times, self.duration * i / 100) - 1)
+            toc.append(min(255, self._index_offsets[index] * 256 // self.bytes_written))
+        return toc
+
+    def sync(self):
+        """Flush buffered audio to stable storage"""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+
+    def commit(self):
+        """Write the seek header, finish the file and rename it to its final path"""
+        if self._reference_frame is not None and self._index_offsets:
+            header = mp3_frames.build_xing_frame(
+                self._reference_frame,
+                self.frame_count,
+                self.bytes_written,
+                self._build_toc(),
+                cbr=self.cbr,
+            )
+            self._file.seek(0)
+            self._file.write(header)
+            self._file.seek(self.bytes_written)
+        self.sync()
+        self._file.close()
+        os.replace(self.temp_path, self.output_path)
+        self._unregister()
+
+    def _unregister(self):
+        if _active_writers.get(str(self.output_path)) is self:
+            del _active_writers[str(self.output_path)]
+
+    def close(self):
+        """Close the partial file but keep it on disk for a later resume"""
+        if not self._file.closed:
+            self.sync()
+            self._file.close()
+        self._unregister()
+
+    def abort(self):
+        """Discard the partial file"""
+        if not self._file.closed:
+            self._file.close()
+        if self.temp_path.exists():
+            self.temp_path.unlink()
+        self._unregister()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if not self._file.closed:
+            self.abort()
+        return False
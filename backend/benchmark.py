@@ -0,0 +1,412 @@
+"""Offline benchmarks for the text pipeline and server start-up: python benchmark.py <name> [options]"""
+import os
+import re
+import sys
+import time
+import random
+import statistics
+import argparse
+
+import converter
+
+IMPORT_BUDGET_MS = 150  # what `import main` may add on top of FastAPI itself
+# Modules loaded on first use, never by `import main`: parsers, TTS clients and the server runner
+LAZY_MODULES = ["PyPDF2", "epub_reader", "lxml", "ebooklib", "bs4", "tts_engine", "tts_backends",
+                "edge_tts", "aiohttp", "lameenc", "uvicorn"]
+FRAMEWORK_IMPORTS = "import fastapi, fastapi.middleware.cors, fastapi.responses, fastapi.staticfiles, pydantic"
+IMPORT_PROBE = """
+import sys, json, time
+start = time.perf_counter()
+{statement}
+print(json.dumps({{"seconds": time.perf_counter() - start, "modules": sorted(sys.modules)}}))
+"""
+
+WORDS = (
+    "the of and to in was he that it his her with as had for she on at by not be but from "
+    "they you this all were we which there one said so been have would their when into out "
+    "house river morning letter window silence captain garden evening stranger journey answer"
+).split()
+
+
+def synthetic_book(size_mb, seed=1):
+    """A book-sized text with a table of contents, chapter headings, numbered lists and dialogue"""
+    rng = random.Random(seed)
+    target = int(size_mb * 1024 * 1024)
+    chapter_count = max(1, target // 40000)
+    parts = ["Contents\n"]
+    parts.extend(f"Chapter {n}: The {rng.choice(WORDS).capitalize()}\n" for n in range(1, chapter_count + 1))
+    size = sum(len(part) for part in parts)
+    chapter = 0
+    while size < target:
+        chapter += 1
+        block = [f"\nChapter {chapter}: The {rng.choice(WORDS).capitalize()}\n\n"]
+        for paragraph in range(rng.randint(20, 40)):
+            if rng.random() < 0.05:
+                # A numbered list inside a chapter, a classic false positive
+                block.extend(f"{i}. {rng.choice(WORDS).capitalize()} {rng.choice(WORDS)}\n" for i in range(1, rng.randint(3, 8)))
+            sentences = []
+            for _ in range(rng.randint(3, 8)):
+                sentence = " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 18))).capitalize()
+                if rng.random() < 0.3:
+                    sentence = f'"{sentence}," said the {rng.choice(WORDS)}'
+                sentences.append(sentence + ".")
+            block.append(" ".join(sentences) + "\n")
+        text = "".join(block)
+        parts.append(text)
+        size += len(text)
+    return "".join(parts)
+
+
+def timed(func, *args, repeat=3):
+    """Best wall time of `repeat` runs and the last result"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def legacy_detect_chapters(text):
+    """The line-by-line detector that detect_chapters_from_text replaced, kept as a baseline"""
+    chapters = []
+    lines = text.split('\n')
+    char_position = 0
+    
+    # Common chapter patterns
+    patterns = [
+        r'^Chapter\s+(\d+|[IVXLCDM]+)[\s:.\-—]*(.*)$',  # Chapter 1, Chapter I
+        r'^CHAPTER\s+(\d+|[IVXLCDM]+)[\s:.\-—]*(.*)$',  # CHAPTER 1
+        r'^(\d+)[\s:.\-—]+(.+)$',  # 1. Chapter Title or 1 - Chapter Title
+        r'^Part\s+(\d+|[IVXLCDM]+)[\s:.\-—]*(.*)$',  # Part 1
+        r'^Book\s+(\d+|[IVXLCDM]+)[\s:.\-—]*(.*)$',  # Book 1
+        r'^Prologue\s*(.*)$',  # Prologue
+        r'^Epilogue\s*(.*)$',  # Epilogue
+    ]
+    
+    for i, line in enumerate(lines):
+        line = line.strip()
+        
+        # Skip empty lines or very short lines
+        if len(line) < 3:
+            char_position += len(lines[i]) + 1
+            continue
+        
+        # Check if this line matches any chapter pattern
+        for pattern in patterns:
+            match = re.match(pattern, line, re.IGNORECASE)
+            if match:
+                # Extract chapter number and title
+                if 'prologue' in line.lower():
+                    title = 'Prologue'
+                    if match.group(1):
+                        title += f': {match.group(1).strip()}'
+                elif 'epilogue' in line.lower():
+                    title = 'Epilogue'
+                    if match.group(1):
+                        title += f': {match.group(1).strip()}'
+                else:
+                    chapter_num = match.group(1)
+                    chapter_title = match.group(2).strip() if len(match.groups()) > 1 else ''
+                    
+                    # Build title
+                    if 'chapter' in line.lower():
+                        title = f'Chapter {chapter_num}'
+                    elif 'part' in line.lower():
+                        title = f'Part {chapter_num}'
+                    elif 'book' in line.lower():
+                        title = f'Book {chapter_num}'
+                    else:
+                        title = f'Chapter {chapter_num}'
+                    
+                    if chapter_title and len(chapter_title) > 2:
+                        title += f': {chapter_title}'
+                
+                chapters.append({
+                    'title': title,
+                    'char_position': char_position
+                })
+                break
+        
+        char_position += len(lines[i]) + 1
+    
+    return chapters
+
+
+def bench_chapters(args):
+    text = synthetic_book(args.size_mb)
+    print(f"Synthetic book: {len(text) / 1024 / 1024:.1f} MB")
+
+    legacy_time, legacy = timed(legacy_detect_chapters, text, repeat=args.repeat)
+    new_time, detected = timed(converter.detect_chapters_from_text, text, repeat=args.repeat)
+
+    real_headings = text.count("\n\nChapter ")
+    print(f"Legacy detector: {legacy_time * 1000:8.1f} ms, {len(legacy)} chapters")
+    print(f"Compiled single pass: {new_time * 1000:8.1f} ms, {len(detected)} chapters")
+    print(f"Real chapter headings: {real_headings}")
+    print(f"Speedup: {legacy_time / new_time:.1f}x")
+
+
+def legacy_chunk_text(text, max_chars=5000):
+    """The '. '-splitting chunker that iter_text_chunks replaced, kept as a baseline"""
+    chunks = []
+    current_chunk = ""
+    sentences = text.replace('\n', ' ').split('. ')
+    for sentence in sentences:
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        if len(current_chunk) + len(sentence) + 2 > max_chars:
+            if current_chunk:
+                chunks.append(current_chunk)
+                current_chunk = sentence + '. '
+            else:
+                chunks.append(sentence[:max_chars])
+                current_chunk = sentence[max_chars:] + '. '
+        else:
+            current_chunk += sentence + '. '
+    if current_chunk:
+        chunks.append(current_chunk)
+    return chunks
+
+
+def size_summary(chunks):
+    sizes = [len(chunk) for chunk in chunks]
+    return (f"{len(sizes)} chunks, size min {min(sizes)} / mean {statistics.mean(sizes):.0f} / "
+            f"max {max(sizes)}, stdev {statistics.pstdev(sizes):.0f}")
+
+
+def bench_chunks(args):
+    text = synthetic_book(args.size_mb)
+    print(f"Synthetic book: {len(text) / 1024 / 1024:.1f} MB")
+
+    legacy_time, legacy = timed(legacy_chunk_text, text, repeat=args.repeat)
+    new_time, chunks = timed(converter.chunk_text, text, repeat=args.repeat)
+    print(f"Legacy chunker: {legacy_time * 1000:8.1f} ms, {size_summary(legacy)}")
+    print(f"Sentence scanner: {new_time * 1000:8.1f} ms, {size_summary(chunks)} (target {converter.CHUNK_TARGET_CHARS})")
+
+
+def bench_requests(args):
+    """TTS requests per book with and without voice-run coalescing"""
+    if args.input:
+        pieces = (text for text, _ in converter.iter_book_pieces(args.input))
+        print(f"Book: {args.input}")
+    else:
+        pieces = [synthetic_book(args.size_mb)]
+        print(f"Synthetic book: {args.size_mb:.1f} MB")
+
+    def segments():
+        for i, (_, chunk) in enumerate(converter.iter_text_chunks(pieces)):
+            for segment in converter.split_into_narrative_segments(chunk):
+                segment['chunk'] = i
+                segment['voice'] = converter.choose_voice(segment, "narrator", args.dialogue_voice, "emphasis")
+                yield segment
+
+    planner = converter.VoiceRunPlanner()
+    start = time.perf_counter()
+    requests = sum(1 for _ in planner.plan(segments()))
+    elapsed = time.perf_counter() - start
+    print(f"Planned {requests} requests in {elapsed * 1000:.1f} ms")
+    print(planner.report())
+
+
+EPUB_CONTAINER = """<?xml version="1.0"?>
+<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
+  <rootfiles><rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/></rootfiles>
+</container>"""
+
+
+def synthetic_epub(path, size_mb, volumes=5, seed=1):
+    """A multi-volume EPUB 2: a title page per volume, one XHTML file per chapter, a nested NCX,
+    and a manifest listed out of reading order, as omnibus editions often are"""
+    import zipfile
+    from xml.sax.saxutils import escape
+
+    rng = random.Random(seed)
+    text = synthetic_book(size_mb, seed)
+    chapters = re.split(r'\n\n(?=Chapter \d+: )', text)[1:]  # the contents list stays behind
+    per_volume = max(1, -(-len(chapters) // volumes))
+    spine = []
+    nav_points = []
+    for v in range(volumes):
+        volume_chapters = chapters[v * per_volume:(v + 1) * per_volume]
+        if not volume_chapters:
+            break
+        spine.append((f"vol{v + 1}", f"<h1>Volume {v + 1}</h1>"))
+        children = []
+        for chapter in volume_chapters:
+            heading, _, body = chapter.partition("\n")
+            item_id = f"ch{len(spine):05d}"
+            paragraphs = "".join(f"<p>{escape(line)}</p>\n" for line in body.split("\n") if line)
+            spine.append((item_id, f"<h2>{escape(heading)}</h2>\n{paragraphs}"))
+            children.append(f'<navPoint id="n{item_id}"><navLabel><text>{escape(heading)}</text></navLabel>'
+                            f'<content src="text/{item_id}.xhtml"/></navPoint>')
+        nav_points.append(f'<navPoint id="nvol{v + 1}"><navLabel><text>Volume {v + 1}</text></navLabel>'
+                          f'<content src="text/vol{v + 1}.xhtml"/>{"".join(children)}</navPoint>')
+
+    manifest = [f'<item id="{item_id}" href="text/{item_id}.xhtml" media-type="application/xhtml+xml"/>'
+                for item_id, _ in spine]
+    rng.shuffle(manifest)
+    with zipfile.ZipFile(path, 'w') as archive:
+        archive.writestr("mimetype", "application/epub+zip", compress_type=zipfile.ZIP_STORED)
+        archive.writestr("META-INF/container.xml", EPUB_CONTAINER)
+        archive.writestr("OEBPS/content.opf", (
+            '<?xml version="1.0"?><package xmlns="http://www.idpf.org/2007/opf" version="2.0">'
+            '<metadata xmlns:dc="http://purl.org/dc/elements/1.1/"><dc:title>Synthetic Omnibus</dc:title></metadata>'
+            '<manifest><item id="ncx" href="toc.ncx" media-type="application/x-dtbncx+xml"/>'
+            + "".join(manifest) + '</manifest><spine toc="ncx">'
+            + "".join(f'<itemref idref="{item_id}"/>' for item_id, _ in spine) + '</spine></package>'
+        ), compress_type=zipfile.ZIP_DEFLATED)
+        archive.writestr("OEBPS/toc.ncx", (
+            '<?xml version="1.0"?><ncx xmlns="http://www.daisy.org/z3986/2005/ncx/" version="2005-1">'
+            '<navMap>' + "".join(nav_points) + '</navMap></ncx>'
+        ), compress_type=zipfile.ZIP_DEFLATED)
+        for item_id, body in spine:
+            archive.writestr(f"OEBPS/text/{item_id}.xhtml", (
+                '<?xml version="1.0" encoding="utf-8"?>\n<html xmlns="http://www.w3.org/1999/xhtml">'
+                f'<head><title>{item_id}</title><style>p {{ margin: 0 }}</style></head>\n'
+                f'<body>\n{body}</body></html>'
+            ), compress_type=zipfile.ZIP_DEFLATED)
+    return len(spine)
+
+
+def legacy_extract_epub(epub_path):
+    """The ebooklib + html.parser extraction that iter_epub_pieces replaced, kept as a baseline"""
+    import ebooklib
+    from ebooklib import epub
+    from bs4 import BeautifulSoup
+
+    book = epub.read_epub(epub_path)
+    chapter_map = {}
+
+    def map_toc(toc_items):
+        for item in toc_items:
+            if isinstance(item, tuple):
+                map_toc(item)
+            elif hasattr(item, 'title') and hasattr(item, 'href'):
+                chapter_map[item.href.split('#')[0]] = item.title
+
+    map_toc(book.toc)
+    chapters = []
+    text_parts = []
+    char_position = 0
+    for item in book.get_items():
+        if item.get_type() == ebooklib.ITEM_DOCUMENT:
+            item_text = BeautifulSoup(item.get_content(), 'html.parser').get_text() + "\n"
+            if item.get_name() in chapter_map:
+                chapters.append({"title": chapter_map[item.get_name()], "char_position": char_position})
+            text_parts.append(item_text)
+            char_position += len(item_text)
+    return "".join(text_parts), chapters
+
+
+def spine_extract_epub(epub_path, workers):
+    chapters = []
+    text_parts = []
+    char_position = 0
+    for item_text, toc_title in converter.iter_epub_pieces(epub_path, workers=workers):
+        if toc_title:
+            chapters.append({"title": toc_title, "char_position": char_position})
+        text_parts.append(item_text)
+        char_position += len(item_text)
+    return "".join(text_parts), chapters
+
+
+def chapters_in_order(chapters):
+    """Chapters whose number follows the previous chapter's, a check of reading order"""
+    numbers = [int(m.group(1)) for m in (re.match(r'Chapter (\d+)', c['title']) for c in chapters) if m]
+    return sum(1 for a, b in zip(numbers, numbers[1:]) if b == a + 1), max(0, len(numbers) - 1)
+
+
+def bench_epub(args):
+    """EPUB extraction throughput: legacy ebooklib + html.parser against the spine reader"""
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.input
+        if not path:
+            path = os.path.join(tmp, "omnibus.epub")
+            documents = synthetic_epub(path, args.size_mb, args.volumes)
+            print(f"Synthetic EPUB: {args.volumes} volumes, {documents} documents, "
+                  f"{os.path.getsize(path) / 1024 / 1024:.1f} MB compressed")
+        else:
+            print(f"EPUB: {path}")
+
+        runs = []
+        try:
+            runs.append(("Legacy ebooklib + html.parser", timed(legacy_extract_epub, path, repeat=args.repeat)))
+        except ImportError as e:
+            print(f"Legacy baseline skipped: {e}")
+        for workers in args.workers or sorted({1, os.cpu_count() or 1}):
+            runs.append((f"Spine + lxml, {workers} worker(s)", timed(spine_extract_epub, path, workers, repeat=args.repeat)))
+
+        for label, (elapsed, (text, chapters)) in runs:
+            in_order, pairs = chapters_in_order(chapters)
+            print(f"{label:32} {elapsed * 1000:8.1f} ms, {len(text) / 1024 / 1024 / elapsed:6.1f} MB/s of text, "
+                  f"{len(chapters)} chapters, {in_order}/{pairs} consecutive chapter pairs in order")
+
+
+def probe_import(statement, cwd):
+    """Run statement in a fresh interpreter; returns its wall time and the modules it loaded"""
+    import json
+    import subprocess
+
+    backend = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [backend, os.environ.get("PYTHONPATH")])))
+    result = subprocess.run([sys.executable, "-c", IMPORT_PROBE.format(statement=statement)],
+                            cwd=cwd, env=env, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def bench_imports(args):
+    """Cold import of the server against the start-up budget; exits non-zero if it is over"""
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        framework = min(probe_import(FRAMEWORK_IMPORTS, tmp)["seconds"] for _ in range(args.repeat))
+        runs = [probe_import("import main", tmp) for _ in range(args.repeat)]
+        created = sorted(os.listdir(tmp))
+    total = min(run["seconds"] for run in runs)
+    own_ms = (total - framework) * 1000
+    print(f"import main {total * 1000:8.1f} ms, of which FastAPI {framework * 1000:.1f} ms "
+          f"and the app {own_ms:.1f} ms (budget {args.budget_ms:.0f} ms)")
+
+    failures = []
+    if own_ms > args.budget_ms:
+        failures.append(f"the app's imports take {own_ms:.1f} ms, over the {args.budget_ms:.0f} ms budget")
+    loaded = [name for name in LAZY_MODULES if name in runs[-1]["modules"]]
+    if loaded:
+        failures.append(f"import main loaded {', '.join(loaded)}")
+    if created:
+        failures.append(f"import main created {', '.join(created)}; do that in the lifespan hook")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+BENCHMARKS = {
+    "chapters": (bench_chapters, "chapter detection on a synthetic book"),
+    "chunks": (bench_chunks, "chunking speed and chunk size spread"),
+    "requests": (bench_requests, "TTS request count before and after voice-run coalescing"),
+    "epub": (bench_epub, "EPUB extraction throughput and reading order on a multi-volume book"),
+    "imports": (bench_imports, "server import time against its budget, failing if over it"),
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("name", choices=sorted(BENCHMARKS), help="; ".join(f"{name}: {help}" for name, (_, help) in sorted(BENCHMARKS.items())))
+    parser.add_argument("--size-mb", type=float, default=8.0, help="size of the synthetic book")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per measurement; the best is reported")
+    parser.add_argument("--input", help="PDF or EPUB to use instead of a synthetic book, where supported")
+    parser.add_argument("--dialogue-voice", default="dialogue", help='use "narrator" to measure a single-voice book')
+    parser.add_argument("--volumes", type=int, default=5, help="volumes in the synthetic EPUB")
+    parser.add_argument("--workers", type=int, action="append", help="EPUB worker counts to measure (repeatable)")
+    parser.add_argument("--budget-ms", type=float, default=IMPORT_BUDGET_MS, help="import time the app may add to FastAPI's")
+    args = parser.parse_args(argv)
+    return BENCHMARKS[args.name][0](args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
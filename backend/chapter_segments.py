@@ -0,0 +1,86 @@
+import os
+import json
+from pathlib import Path
+
+import mp3_frames
+
+# Every slice of an audiobook reuses the same linear seek table; exact for CBR audio
+LINEAR_TOC = [i * 256 // 100 for i in range(100)]
+
+
+def segments_path(output_path):
+    return Path(output_path).parent / f"{Path(output_path).stem}_segments.json"
+
+
+def audio_version(audio_path):
+    """Changes whenever the audio file is rewritten, e.g. by a repair"""
+    stat = Path(audio_path).stat()
+    return f"{stat.st_size:x}-{stat.st_mtime_ns:x}"
+
+
+def write_segment_manifest(output_path, writer, title, chapter_data):
+    """Save where each chapter of a just committed audiobook starts, in bytes and seconds.
+
+    Chapter segments are frame-aligned byte ranges of the audiobook itself, cut at the start
+    of the frame playing at each chapter marker (so a segment never starts after its
+    chapter's first words). Audio before the first marker belongs to the first chapter, and
+    markers that fall on the same frame leave no empty segment: the later chapter takes over.
+    The manifest records the audio file's version and is only valid while it matches.
+    """
+    output_path = Path(output_path)
+    if not chapter_data or not writer.frame_count:
+        segments_path(output_path).unlink(missing_ok=True)
+        return None
+
+    boundaries = [(0.0, writer.header_size)]
+    for chapter in chapter_data[1:]:
+        boundaries.append(max(boundaries[-1], writer.frame_boundary(chapter["timestamp"]), key=lambda b: b[1]))
+    boundaries.append((writer.duration, writer.bytes_written))
+
+    segments = [{
+        "title": chapter["title"],
+        "start": round(start, 3),
+        "duration": round(end - start, 3),
+        "byte_start": byte_start,
+        "byte_end": byte_end,
+    } for chapter, (start, byte_start), (end, byte_end) in zip(chapter_data, boundaries, boundaries[1:])
+        if byte_end > byte_start]
+
+    path = segments_path(output_path)
+    temp_path = path.with_suffix('.tmp')
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            "title": title,
+            "version": audio_version(output_path),
+            "duration": round(writer.duration, 3),
+            "cbr": writer.cbr,
+            "segments": segments,
+        }, f, indent=2, ensure_ascii=False)
+    os.replace(temp_path, path)
+    return path
+
+
+def read_segment_manifest(audio_path):
+    """The segment manifest of an audiobook, or None if it has none or the audio changed since"""
+    try:
+        with open(segments_path(audio_path), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest["version"] != audio_version(audio_path):
+            return None
+    except (OSError, ValueError, KeyError):
+        return None
+    return manifest
+
+
+def segment_header(audio_path, manifest, first, last):
+    """Info/Xing frame for chapters first..last served on their own, so players know their exact length"""
+    start, end = manifest["segments"][first], manifest["segments"][last]
+    with open(audio_path, 'rb') as f:
+        f.seek(start["byte_start"])
+        reference = mp3_frames.parse_frame_header(f.read(4))
+    if reference is None:
+        return b""
+    duration = end["start"] + end["duration"] - start["start"]
+    frames = round(duration * reference["sample_rate"] / reference["samples"])
+    total_bytes = mp3_frames.xing_frame_size(reference) + end["byte_end"] - start["byte_start"]
+    return mp3_frames.build_xing_frame(reference, frames, total_bytes, LINEAR_TOC, cbr=manifest.get("cbr", True))
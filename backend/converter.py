@@ -1,154 +1,455 @@
 import os
+import re
 from pathlib import Path
-import PyPDF2
-import ebooklib
-from ebooklib import epub
-from bs4 import BeautifulSoup
+from chapter_segments import write_segment_manifest
 
 CHUNK_SIZE = 1024
 MAX_CHARS_PER_REQUEST = 5000  # Keep reasonable chunk size
+CHUNK_TARGET_CHARS = int(os.environ.get("CHUNK_TARGET_CHARS", "2000"))  # chunks are packed toward this size
+PDF_EXTRACT_WORKERS = int(os.environ.get("PDF_EXTRACT_WORKERS", "0"))  # 0 = one per CPU core
+PDF_PAGES_PER_TASK = 25
+EPUB_EXTRACT_WORKERS = int(os.environ.get("EPUB_EXTRACT_WORKERS", "0"))  # 0 = one per CPU core
+EPUB_ITEMS_PER_TASK = 8
+PREVIEW_CHARS = 300  # about 20-30 seconds of audio
+PIPELINE_BUFFER = int(os.environ.get("PIPELINE_BUFFER", "64"))  # items buffered between pipeline stages
+TEXT_PIPELINE_VERSION = 3  # bump when chunking or segmentation changes, so old checkpoints aren't resumed
+EXTRACTOR_VERSION = 2  # bump when text extraction or chapter detection changes, so cached extractions are rebuilt
+# PyPDF2 and epub_reader (lxml) are imported by the functions that parse, so starting the server doesn't load them
 
-def extract_text_from_pdf(pdf_path, progress_callback=None):
-    text = ""
+def _worker_process_context():
+    """How extraction worker processes are started.
+    
+    Pools are created from conversion worker threads, and a child forked from a threaded
+    server inherits whatever locks other threads held at that moment, so workers come from
+    a fork server instead (or are spawned where there is none).
+    """
+    import multiprocessing
+    
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return multiprocessing.get_context(method)
+
+def _join_page_texts(page_texts):
+    """Join extracted pages in order, skipping empty ones"""
+    return "".join(page_text + "\n" for page_text in page_texts if page_text)
+
+def _extract_pdf_page_range(pdf_path, start, end):
+    """Extract pages [start, end) with a private reader (runs in a worker process)"""
+    import PyPDF2
+    
+    page_texts = []
     with open(pdf_path, 'rb') as file:
         reader = PyPDF2.PdfReader(file)
-        num_pages = len(reader.pages)
-        print(f"PDF has {num_pages} pages")
-        
-        for i, page in enumerate(reader.pages):
+        for i in range(start, end):
             try:
-                page_text = page.extract_text()
-                if page_text:
-                    text += page_text + "\n"
+                page_texts.append(reader.pages[i].extract_text() or "")
             except Exception as e:
                 print(f"Error extracting page {i+1}: {e}")
-                
-            if progress_callback and (i % 5 == 0 or i == num_pages - 1):
-                progress_callback(i + 1, num_pages)
-                
-    return text
+                page_texts.append("")
+    return start, page_texts
+
+def iter_pdf_page_texts(pdf_path, progress_callback=None, workers=None):
+    """Yield page texts in page order while worker processes extract the page ranges ahead"""
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor
+    import PyPDF2
+    
+    workers = workers or PDF_EXTRACT_WORKERS or os.cpu_count() or 1
+    
+    with open(pdf_path, 'rb') as file:
+        num_pages = len(PyPDF2.PdfReader(file).pages)
+    print(f"PDF has {num_pages} pages")
+    
+    if workers <= 1 or num_pages < PDF_PAGES_PER_TASK * 2:
+        with open(pdf_path, 'rb') as file:
+            reader = PyPDF2.PdfReader(file)
+            for i, page in enumerate(reader.pages):
+                try:
+                    yield page.extract_text() or ""
+                except Exception as e:
+                    print(f"Error extracting page {i+1}: {e}")
+                    yield ""
+                    
+                if progress_callback and (i % 5 == 0 or i == num_pages - 1):
+                    progress_callback(i + 1, num_pages)
+        return
+    
+    # Small ranges so progress keeps flowing; only a bounded window of ranges is extracted ahead
+    ranges = [(start, min(start + PDF_PAGES_PER_TASK, num_pages)) for start in range(0, num_pages, PDF_PAGES_PER_TASK)]
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=_worker_process_context()) as pool:
+        try:
+            for start, end in ranges:
+                pending.append((start, end, pool.submit(_extract_pdf_page_range, pdf_path, start, end)))
+                if len(pending) < workers * 2:
+                    continue
+                yield from _drain_pdf_range(pending.popleft(), num_pages, progress_callback)
+            while pending:
+                yield from _drain_pdf_range(pending.popleft(), num_pages, progress_callback)
+        finally:
+            for _, _, future in pending:
+                future.cancel()
+
+def _drain_pdf_range(entry, num_pages, progress_callback):
+    start, end, future = entry
+    try:
+        _, range_texts = future.result()
+    except Exception as e:
+        print(f"Error extracting pages {start+1}-{end}: {e}")
+        range_texts = [""] * (end - start)
+    yield from range_texts
+    if progress_callback:
+        progress_callback(end, num_pages)
+
+def extract_text_from_pdf(pdf_path, progress_callback=None, workers=None):
+    """Extract text from a PDF, splitting the page range across worker processes"""
+    return _join_page_texts(iter_pdf_page_texts(pdf_path, progress_callback, workers))
+
+_epub_worker_archive = None
+
+def _open_epub_worker_archive(epub_path):
+    """Worker process initializer: open the archive once, its central directory is slow to read"""
+    global _epub_worker_archive
+    import zipfile
+    _epub_worker_archive = zipfile.ZipFile(epub_path)
+
+def _extract_epub_item_range(names):
+    """Extract the text of spine documents `names` (runs in a worker process)"""
+    from epub_reader import read_document_text
+    return [read_document_text(_epub_worker_archive, name) for name in names]
+
+def iter_epub_pieces(epub_path, progress_callback=None, workers=None):
+    """Yield (text, toc_title) for each spine document in reading order.
+    
+    Worker processes parse ranges of spine documents ahead of the reader, as for PDF pages.
+    """
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor
+    from epub_reader import EpubPackage
+    
+    workers = workers or EPUB_EXTRACT_WORKERS or os.cpu_count() or 1
+    
+    with EpubPackage(epub_path) as package:
+        spine = package.spine
+        toc = package.toc
+        total = len(spine)
+        if workers <= 1 or total < EPUB_ITEMS_PER_TASK * 2:
+            for i, name in enumerate(spine):
+                yield package.read_text(name) + "\n", toc.get(name)
+                if progress_callback:
+                    progress_callback(i + 1, total)
+            return
+    
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=_worker_process_context(),
+                             initializer=_open_epub_worker_archive, initargs=(epub_path,)) as pool:
+        try:
+            for start in range(0, total, EPUB_ITEMS_PER_TASK):
+                names = spine[start:start + EPUB_ITEMS_PER_TASK]
+                pending.append((start, names, pool.submit(_extract_epub_item_range, names)))
+                if len(pending) < workers * 2:
+                    continue
+                yield from _drain_epub_range(pending.popleft(), toc, total, progress_callback)
+            while pending:
+                yield from _drain_epub_range(pending.popleft(), toc, total, progress_callback)
+        finally:
+            for _, _, future in pending:
+                future.cancel()
+
+def _drain_epub_range(entry, toc, total, progress_callback):
+    start, names, future = entry
+    try:
+        texts = future.result()
+    except Exception as e:
+        print(f"Error extracting {names[0]} to {names[-1]}: {e}")
+        texts = [""] * len(names)
+    for name, text in zip(names, texts):
+        yield text + "\n", toc.get(name)
+    if progress_callback:
+        progress_callback(start + len(names), total)
 
 def extract_text_from_epub_with_chapters(epub_path):
     """Extract text and chapter structure from EPUB"""
-    import json
-    
-    book = epub.read_epub(epub_path)
-    text = ""
     chapters = []
     char_position = 0
     
-    # Try to get TOC
-    toc = book.toc
-    chapter_map = {}
-    
-    # Map TOC items to their href
-    def map_toc(toc_items, depth=0):
-        for item in toc_items:
-            if isinstance(item, tuple):
-                map_toc(item, depth + 1)
-            elif isinstance(item, epub.Link):
-                # Get just the file part (remove anchors)
-                href = item.href.split('#')[0]
-                chapter_map[href] = item.title
-            elif hasattr(item, 'title') and hasattr(item, 'href'):
-                href = item.href.split('#')[0]
-                chapter_map[href] = item.title
-    
-    if toc:
-        map_toc(toc)
-    
     # Extract text and track chapters
-    for item in book.get_items():
-        if item.get_type() == ebooklib.ITEM_DOCUMENT:
-            # Get item ID/href
-            item_name = item.get_name()
-            
-            # Check if this is a chapter start
-            if item_name in chapter_map:
-                chapters.append({
-                    "title": chapter_map[item_name],
-                    "char_position": char_position
-                })
-            
-            # Extract text
-            soup = BeautifulSoup(item.get_content(), 'html.parser')
-            item_text = soup.get_text() + "\n"
-            text += item_text
-            char_position += len(item_text)
+    text_parts = []
+    for item_text, toc_title in iter_epub_pieces(epub_path):
+        # Check if this is a chapter start
+        if toc_title:
+            chapters.append({
+                "title": toc_title,
+                "char_position": char_position
+            })
+        
+        text_parts.append(item_text)
+        char_position += len(item_text)
+    
+    return "".join(text_parts), chapters
+
+def iter_book_pieces(input_path, progress_callback=None):
+    """Yield (text, toc_title) pieces of a book in reading order.
     
-    return text, chapters
+    Pieces are PDF pages or EPUB documents and always end with a newline, so no line spans
+    two pieces. toc_title is the EPUB TOC entry starting at that piece, if any.
+    """
+    suffix = Path(input_path).suffix.lower()
+    if suffix == '.pdf':
+        for page_text in iter_pdf_page_texts(input_path, progress_callback):
+            if page_text:
+                yield page_text + "\n", None
+    elif suffix == '.epub':
+        yield from iter_epub_pieces(input_path, progress_callback)
+    else:
+        raise ValueError(f"Unsupported file format: {suffix}")
+
+_extraction_cache = None
+
+def get_extraction_cache():
+    """The shared extraction cache, or None if EXTRACTION_CACHE_DIR is empty"""
+    global _extraction_cache
+    from extraction_cache import ExtractionCache, EXTRACTION_CACHE_DIR
+    
+    if _extraction_cache is None and EXTRACTION_CACHE_DIR:
+        _extraction_cache = ExtractionCache(EXTRACTION_CACHE_DIR, EXTRACTOR_VERSION)
+    return _extraction_cache
+
+def load_cached_extraction(input_path):
+    """The cached pieces and chapters of a book extracted before, or None"""
+    cache = get_extraction_cache()
+    if cache is None:
+        return None
+    try:
+        return cache.load(input_path)
+    except OSError as e:
+        print(f"Extraction cache unavailable: {e}")
+        return None
+
+def iter_cached_pieces(cached, progress_callback=None):
+    """Yield (text, toc_title) pieces from the extraction cache, reporting progress like iter_book_pieces"""
+    total = cached.piece_count
+    for i, piece in enumerate(cached):
+        yield piece
+        if progress_callback:
+            progress_callback(i + 1, total)
 
 def extract_text_from_epub(epub_path):
     """Simple text extraction for backwards compatibility"""
     text, _ = extract_text_from_epub_with_chapters(epub_path)
     return text
 
-def detect_chapters_from_text(text):
-    """Detect chapters from text using pattern matching"""
-    import re
+def iter_pdf_pages(pdf_path):
+    """Lazily yield the text of each PDF page, stopping as soon as the caller stops"""
+    import PyPDF2
     
-    chapters = []
-    lines = text.split('\n')
-    char_position = 0
+    with open(pdf_path, 'rb') as file:
+        reader = PyPDF2.PdfReader(file)
+        for i, page in enumerate(reader.pages):
+            try:
+                page_text = page.extract_text()
+            except Exception as e:
+                print(f"Error extracting page {i+1}: {e}")
+                continue
+            if page_text:
+                yield page_text + "\n"
+
+def iter_document_text(input_path):
+    """Lazily yield text pieces (PDF pages or EPUB documents) in reading order"""
+    cached = load_cached_extraction(input_path)
+    if cached is not None:
+        for text, _ in cached:
+            yield text
+        return
     
-    # Common chapter patterns
-    patterns = [
-        r'^Chapter\s+(\d+|[IVXLCDM]+)[\s:.\-—]*(.*)$',  # Chapter 1, Chapter I
-        r'^CHAPTER\s+(\d+|[IVXLCDM]+)[\s:.\-—]*(.*)$',  # CHAPTER 1
-        r'^(\d+)[\s:.\-—]+(.+)$',  # 1. Chapter Title or 1 - Chapter Title
-        r'^Part\s+(\d+|[IVXLCDM]+)[\s:.\-—]*(.*)$',  # Part 1
-        r'^Book\s+(\d+|[IVXLCDM]+)[\s:.\-—]*(.*)$',  # Book 1
-        r'^Prologue\s*(.*)$',  # Prologue
-        r'^Epilogue\s*(.*)$',  # Epilogue
-    ]
-    
-    for i, line in enumerate(lines):
-        line = line.strip()
-        
-        # Skip empty lines or very short lines
-        if len(line) < 3:
-            char_position += len(lines[i]) + 1
-            continue
+    suffix = Path(input_path).suffix.lower()
+    if suffix == '.pdf':
+        yield from iter_pdf_pages(input_path)
+    elif suffix == '.epub':
+        # In-process, so a preview parses only the documents it reads
+        for item_text, _ in iter_epub_pieces(input_path, workers=1):
+            yield item_text
+    else:
+        raise ValueError(f"Unsupported file format: {suffix}")
+
+def extract_preview_text(input_path, max_chars=PREVIEW_CHARS):
+    """Opening text of a book, reading only as many pages/items as needed"""
+    parts = []
+    total = 0
+    for piece in iter_document_text(input_path):
+        parts.append(piece)
+        total += len(piece)
+        if total >= max_chars:
+            break
+    return "".join(parts)[:max_chars].strip()
+
+# One pass over the whole text: every line that looks like a chapter heading. Matches start
+# at the newline before the line (a literal prefix is much faster to scan for than "^"),
+# so the text is searched with a newline prepended and match.start() is the line start.
+CHAPTER_HEADING_PATTERN = re.compile(r"""
+    \n[^\S\n]*
+    (?:
+        (?P<kind>chapter|part|book)[^\S\n]+(?P<number>\d+|[ivxlcdm]+)\b(?P<title>[^\n]*)     # Chapter 1, Part IV: Title
+      | (?P<special>prologue|epilogue)\b(?P<subtitle>[^\n]*)                            # Prologue
+      | (?P<index>\d{1,3})(?:[^\S\n]|[:.\-—])+(?P<heading>[^\n]+)                      # 1. Chapter Title
+    )$
+""", re.IGNORECASE | re.MULTILINE | re.VERBOSE)
+CHAPTER_TITLE_STRIP = " \t\r:.-—"
+CHAPTER_MAX_HEADING_CHARS = 100  # longer lines are prose that happens to start with "Part 2" etc.
+CHAPTER_MIN_GAP = 500  # headings closer than this are a table of contents or a numbered list...
+CHAPTER_MIN_BODY = 20  # ...unless this many words of text follow a chapter/part/book heading
+CHAPTER_KINDS = ('chapter', 'part', 'book')
+# Numbering of a lower kind may start again under each higher one (Chapter 1 of every Part)
+CHAPTER_NUMBERING_RESETS = {'book': ('part', 'chapter'), 'part': ('chapter',)}
+
+ROMAN_NUMERALS = {'i': 1, 'v': 5, 'x': 10, 'l': 50, 'c': 100, 'd': 500, 'm': 1000}
+
+def chapter_number_value(number):
+    """Numeric value of a heading number such as 12 or "XIV"; None if there is none"""
+    if number is None or isinstance(number, int):
+        return number
+    if number.isdigit():
+        return int(number)
+    values = [ROMAN_NUMERALS[c] for c in number.lower()]
+    return sum(-v if i + 1 < len(values) and v < values[i + 1] else v for i, v in enumerate(values))
+
+class ChapterDetector:
+    """Incremental chapter detector over text fed piece by piece.
+    
+    Candidates come from CHAPTER_HEADING_PATTERN and are filtered with cheap heuristics:
+    headings must be short, bare numbered headings must count up one by one, and headings
+    of the same kind within CHAPTER_MIN_GAP characters of each other are dropped as a table
+    of contents or list, unless their numbering restarts. A chapter, part or book heading
+    followed by CHAPTER_MIN_BODY words of text is a chapter however soon the next heading
+    comes, since a table of contents has no more than a title line between its entries.
+    Chapter, part and book numbers must also go up through the book, so a running page
+    header repeating the chapter heading is not a new chapter. `chapters` only holds
+    headings that can no longer be dropped.
+    """
+    
+    def __init__(self, min_gap=CHAPTER_MIN_GAP, min_body=CHAPTER_MIN_BODY):
+        self.min_gap = min_gap
+        self.min_body = min_body
+        self.chapters = []
+        self._cluster = []  # candidates close to each other, not yet accepted
+        self._gap_end = 0  # words after the last candidate are counted up to here
+        self._gap_words = 0
+        self._last_index = 0  # number of the last accepted bare numbered heading
+        self._last_values = {}  # kind -> number of the last accepted chapter/part/book heading
+    
+    def feed(self, text, base=0):
+        """Scan one piece of text; base is its offset in the whole book"""
+        for match in CHAPTER_HEADING_PATTERN.finditer("\n" + text):
+            if self._cluster:
+                self._count_gap_words(text, base, match.start())
+                if self._gap_is_wide(base + match.start()):
+                    self._close_cluster()
+            candidate = self._candidate(match, base)
+            if candidate is None:
+                continue
+            previous = next((c for c in reversed(self._cluster) if c['kind'] == candidate['kind']), None)
+            if previous is not None and (candidate['value'] or 0) <= (previous['value'] or 0):
+                # Numbering restarted, e.g. the real "Chapter 1" right after a table of contents
+                self._close_cluster()
+            self._cluster.append(candidate)
+            self._gap_end = base + match.end() - 1
+            self._gap_words = 0
+        if self._cluster:
+            self._count_gap_words(text, base, len(text))
+        return self
+    
+    def _count_gap_words(self, text, base, end):
+        """Count words after the last candidate up to offset end of this piece, as far as they matter"""
+        if self._cluster[-1]['kind'] not in CHAPTER_KINDS or self._gap_words >= self.min_body:
+            return
+        start = max(0, self._gap_end - base)
+        end = min(end, self._cluster[-1]['char_position'] + self.min_gap - base)
+        if end > start:
+            self._gap_words += len(text[start:end].split())
+            self._gap_end = base + end
+    
+    def _gap_is_wide(self, position):
+        """True if a heading at position can't belong to the cluster of the candidates before it"""
+        last = self._cluster[-1]
+        if position - last['char_position'] >= self.min_gap:
+            return True
+        # Bare numbered lines with text after them are still mostly list items
+        return last['kind'] in CHAPTER_KINDS and self._gap_words >= self.min_body
+    
+    def finish(self):
+        """Flush pending candidates once the whole text has been fed; returns the chapters"""
+        self._close_cluster()
+        return self.chapters
+    
+    def _expected_index(self):
+        for candidate in reversed(self._cluster):
+            if candidate['kind'] == 'index':
+                return candidate['number'] + 1
+        return self._last_index + 1
+    
+    def _candidate(self, match, base):
+        if match.end() - match.start() - 1 > CHAPTER_MAX_HEADING_CHARS:
+            return None
         
-        # Check if this line matches any chapter pattern
-        for pattern in patterns:
-            match = re.match(pattern, line, re.IGNORECASE)
-            if match:
-                # Extract chapter number and title
-                if 'prologue' in line.lower():
-                    title = 'Prologue'
-                    if match.group(1):
-                        title += f': {match.group(1).strip()}'
-                elif 'epilogue' in line.lower():
-                    title = 'Epilogue'
-                    if match.group(1):
-                        title += f': {match.group(1).strip()}'
-                else:
-                    chapter_num = match.group(1)
-                    chapter_title = match.group(2).strip() if len(match.groups()) > 1 else ''
-                    
-                    # Build title
-                    if 'chapter' in line.lower():
-                        title = f'Chapter {chapter_num}'
-                    elif 'part' in line.lower():
-                        title = f'Part {chapter_num}'
-                    elif 'book' in line.lower():
-                        title = f'Book {chapter_num}'
-                    else:
-                        title = f'Chapter {chapter_num}'
-                    
-                    if chapter_title and len(chapter_title) > 2:
-                        title += f': {chapter_title}'
-                
-                chapters.append({
-                    'title': title,
-                    'char_position': char_position
-                })
-                break
+        if match.group('kind'):
+            kind = match.group('kind').lower()
+            number = match.group('number')
+            title = f'{kind.capitalize()} {number}'
+            subtitle = match.group('title').strip(CHAPTER_TITLE_STRIP)
+            if len(subtitle) > 2:
+                title += f': {subtitle}'
+        elif match.group('special'):
+            kind = match.group('special').lower()
+            number = None
+            title = kind.capitalize()
+            subtitle = match.group('subtitle').strip(CHAPTER_TITLE_STRIP)
+            if subtitle:
+                title += f': {subtitle}'
+        else:
+            # Bare numbered lines are mostly lists; only take "N. Title" counting up from 1
+            kind = 'index'
+            number = int(match.group('index'))
+            heading = match.group('heading').strip(CHAPTER_TITLE_STRIP)
+            if (
+                number != self._expected_index()
+                or len(heading) < 3
+                or not heading[0].isupper()
+                or heading[-1] in ',;'
+            ):
+                return None
+            title = f'Chapter {number}: {heading}'
         
-        char_position += len(lines[i]) + 1
+        return {
+            'title': title,
+            'char_position': base + match.start(),
+            'kind': kind,
+            'number': number,
+            'value': chapter_number_value(number),
+        }
     
-    return chapters
+    def _close_cluster(self):
+        kinds = [candidate['kind'] for candidate in self._cluster]
+        for candidate in self._cluster:
+            # A kind repeated within the cluster is a table of contents or list; "Part One"
+            # directly followed by "Chapter 1" keeps both
+            if kinds.count(candidate['kind']) > 1:
+                continue
+            if candidate['kind'] == 'index':
+                self._last_index = candidate['number']
+            elif candidate['kind'] in CHAPTER_KINDS and candidate['value'] is not None:
+                if candidate['value'] <= self._last_values.get(candidate['kind'], 0):
+                    continue  # a running header, or a chapter mentioned again
+                self._last_values[candidate['kind']] = candidate['value']
+                for kind in CHAPTER_NUMBERING_RESETS.get(candidate['kind'], ()):
+                    self._last_values.pop(kind, None)
+            self.chapters.append({
+                'title': candidate['title'],
+                'char_position': candidate['char_position'],
+            })
+        self._cluster = []
+
+def detect_chapters_from_text(text):
+    """Detect chapters from text using pattern matching"""
+    return ChapterDetector().feed(text).finish()
 
 def split_into_narrative_segments(text):
     """Split text into segments with narration and dialogue markers"""
@@ -199,83 +500,385 @@ def split_into_narrative_segments(text):
     
     return segments
 
-def chunk_text(text, max_chars=MAX_CHARS_PER_REQUEST):
-    """Split text into chunks that respect sentence boundaries"""
-    chunks = []
-    current_chunk = ""
+# A sentence ends at a blank line, or at ., !, ?, … (plus closing quotes/brackets) before whitespace.
+# Stops followed by a lowercase letter or digit ("e.g. this", "p. 5") don't count.
+# Every match starts with one of a few characters, which lets the regex engine skip ahead quickly.
+SENTENCE_BOUNDARY_PATTERN = re.compile(r"""
+    [\n.!?…]
+    (?:
+        (?<=\n)(?P<paragraph>[^\S\n]*\n\s*)
+      | (?<!\n)[.!?…]*["'”’»)\]]*(?=\s+[^\sa-z0-9])
+    )
+""", re.VERBOSE)
+# Where a sentence that is too long for one chunk may be cut, best first
+CLAUSE_BREAK_PATTERN = re.compile(r'[,;:)\]—–](?=\s)|\s[-—–]\s')
+ABBREVIATIONS = {
+    "mr", "mrs", "ms", "dr", "prof", "sr", "jr", "st", "mt", "vs", "etc", "no", "vol",
+    "ch", "fig", "e.g", "i.e", "cf", "approx", "dept", "gen", "col", "capt", "lt", "rev",
+}
+ABBREVIATION_MAX_CHARS = max(len(word) for word in ABBREVIATIONS)
+BOUNDARY_LOOKBACK = 64  # chars before the end of a piece re-scanned once the next piece arrives
+CHUNK_PARAGRAPH_FILL = 0.75  # end a chunk at a paragraph break once it is this full
+
+def _is_sentence_stop(text, start):
+    """False for a full stop at `start` that ends an abbreviation or an initial rather than a sentence"""
+    word_start = text.rfind(' ', max(0, start - ABBREVIATION_MAX_CHARS - 1), start) + 1
+    if not word_start and start > ABBREVIATION_MAX_CHARS:
+        return True  # the word is too long to be an abbreviation
+    word = text[word_start:start].lstrip('"\'“‘(\n')
+    return not (word.lower() in ABBREVIATIONS or (len(word) == 1 and word.isupper()))
+
+def split_long_sentence(text, limit):
+    """Cut a sentence longer than limit at clause breaks, else between words; yields (start, part)"""
+    start = 0
+    while len(text) - start > limit:
+        window = text[start:start + limit + 1]
+        cut = None
+        for match in CLAUSE_BREAK_PATTERN.finditer(window, limit // 2):
+            cut = match.end()
+        if cut is None:
+            space = window.rfind(' ', limit // 2)
+            cut = space if space > 0 else limit
+        yield start, text[start:start + cut]
+        start += cut
+        while start < len(text) and text[start].isspace():
+            start += 1
+    if start < len(text):
+        yield start, text[start:]
+
+def iter_sentences(pieces, limit):
+    """Yield (source_offset, sentence, ends_paragraph) from text pieces in one pass.
     
-    # Split by sentences (simplified)
-    sentences = text.replace('\n', ' ').split('. ')
+    Sentences are stripped but not yet whitespace-normalized, and at most `limit` characters;
+    longer ones are split at clause breaks. Only the unfinished sentence at the end of a piece
+    is carried over to the next one.
+    """
+    pending = ""  # text after the last boundary, carried over to the next piece
+    pending_offset = 0
+    scan_from = 0
     
-    for sentence in sentences:
-        sentence = sentence.strip()
+    def emit(start, end, ends_paragraph):
+        sentence = pending[start:end].strip()
         if not sentence:
-            continue
-            
-        # If adding this sentence would exceed the limit
-        if len(current_chunk) + len(sentence) + 2 > max_chars:
-            if current_chunk:
-                chunks.append(current_chunk)
-                current_chunk = sentence + '. '
+            return
+        offset = pending_offset + pending.index(sentence[0], start)
+        if len(sentence) <= limit:
+            yield offset, sentence, ends_paragraph
+            return
+        parts = list(split_long_sentence(" ".join(sentence.split()), limit))
+        for i, (part_start, part) in enumerate(parts):
+            # Offsets of normalized parts are approximate; they only place chapter markers
+            yield offset + part_start, part, ends_paragraph and i == len(parts) - 1
+    
+    for piece in pieces:
+        pending += piece
+        start = 0
+        for match in SENTENCE_BOUNDARY_PATTERN.finditer(pending, scan_from):
+            end = match.end()
+            if match.group('paragraph') is not None:
+                sentence_end, ends_paragraph = match.start(), True
+            elif end - match.start() > 1 or pending[end - 1] != '.' or _is_sentence_stop(pending, end - 1):
+                sentence_end, ends_paragraph = end, False
             else:
-                # Single sentence is too long, split it
-                chunks.append(sentence[:max_chars])
-                current_chunk = sentence[max_chars:] + '. '
+                continue
+            sentence = pending[start:sentence_end].strip()
+            if len(sentence) <= limit:
+                # Hot path, inlined: most sentences need no splitting
+                if sentence:
+                    yield pending_offset + pending.index(sentence[0], start), sentence, ends_paragraph
+            else:
+                yield from emit(start, sentence_end, ends_paragraph)
+            start = end
+        
+        # A sentence running on for several pieces is cut before it can grow without bound
+        while len(pending) - start > 2 * limit:
+            cut = start + limit
+            space = pending.rfind(' ', start + limit // 2, cut)
+            if space > 0:
+                cut = space
+            yield from emit(start, cut, False)
+            start = cut
+        
+        pending_offset += start
+        pending = pending[start:]
+        scan_from = max(0, len(pending) - BOUNDARY_LOOKBACK)
+    
+    yield from emit(0, len(pending), True)
+
+def iter_text_chunks(pieces, target_chars=CHUNK_TARGET_CHARS, max_chars=MAX_CHARS_PER_REQUEST):
+    """Streaming chunker: yield (source_offset, chunk) from an iterable of text pieces.
+    
+    Whole sentences are packed toward target_chars so TTS requests take similar time;
+    a chunk also ends at a paragraph break once it is mostly full. source_offset is the
+    position of the chunk's first character in the concatenated pieces.
+    """
+    target_chars = min(target_chars, max_chars)
+    parts = []
+    length = 0
+    offset = 0
+    
+    def flush():
+        # Newlines and runs of spaces inside sentences collapse to single spaces
+        return offset, " ".join(" ".join(parts).split())
+    
+    for sentence_offset, sentence, ends_paragraph in iter_sentences(pieces, target_chars):
+        if parts and length + 1 + len(sentence) > target_chars:
+            yield flush()
+            parts = []
+        if not parts:
+            offset = sentence_offset
+            length = len(sentence)
         else:
-            current_chunk += sentence + '. '
+            length += 1 + len(sentence)
+        parts.append(sentence)
+        if ends_paragraph and length >= target_chars * CHUNK_PARAGRAPH_FILL:
+            yield flush()
+            parts = []
+    
+    if parts:
+        yield flush()
+
+def chunk_text(text, target_chars=CHUNK_TARGET_CHARS):
+    """Split text into chunks that respect sentence boundaries"""
+    return [chunk for _, chunk in iter_text_chunks([text], target_chars)]
+
+def iter_in_thread(iterable, maxsize=PIPELINE_BUFFER, name="pipeline-stage"):
+    """Run an iterable in a background thread, handing its items over through a bounded queue"""
+    import queue
+    import threading
     
-    # Add the last chunk
-    if current_chunk:
-        chunks.append(current_chunk)
+    items = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+    done = object()
     
-    return chunks
+    def put(entry):
+        while not stop.is_set():
+            try:
+                items.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def produce():
+        source = iter(iterable)
+        try:
+            for item in source:
+                if not put((None, item)):
+                    return
+            put((None, done))
+        except BaseException as e:
+            put((e, done))
+        finally:
+            if hasattr(source, 'close'):
+                source.close()
+    
+    threading.Thread(target=produce, name=name, daemon=True).start()
+    try:
+        while True:
+            error, item = items.get()
+            if item is done:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
 
 def text_to_speech_chunk(text, voice_id):
-    """Convert a single text chunk to audio bytes using Edge TTS"""
-    import asyncio
-    import edge_tts
-    import io
-    
-    async def _generate_audio():
-        communicate = edge_tts.Communicate(text, voice_id)
-        audio_data = io.BytesIO()
+    """Convert a single text chunk to audio bytes using the shared TTS engine"""
+    from tts_engine import get_engine
+    
+    return get_engine().synthesize(text, voice_id)
+
+def choose_voice(segment, narrator_voice_id, dialogue_voice_id, emphasis_voice_id):
+    """Pick the voice for a narrative segment"""
+    text = segment['text']
+    
+    # Detect emphasis (ALL CAPS, multiple exclamation marks)
+    is_emphasis = (
+        (text.isupper() and len(text.split()) > 2) or  # ALL CAPS text
+        ('!!' in text)  # Multiple exclamation marks
+    )
+    
+    if is_emphasis:
+        return emphasis_voice_id
+    if segment['type'] == 'dialogue':
+        return dialogue_voice_id
+    return narrator_voice_id
+
+class VoiceRunPlanner:
+    """Coalesce voiced segments into as few TTS requests as possible.
+    
+    Adjacent segments with the same voice are joined into one request of up to max_chars,
+    also across chunk boundaries; a request is only cut when the voice changes or it is full.
+    A request may only run across a chunk boundary if the previous boundary was left clean,
+    so at least every other chunk remains a point a conversion can resume from.
+    """
+    
+    def __init__(self, max_chars=MAX_CHARS_PER_REQUEST):
+        self.max_chars = max_chars
+        self.segments_in = 0
+        self.requests_out = 0
+    
+    def plan(self, segments):
+        """Yield request dicts with 'text', 'voice', 'type', 'chunk' (first) and 'end_chunk' (last)"""
+        run = None
+        parts = []
+        run_chars = 0
+        previous_boundary_clean = True
         
-        async for chunk in communicate.stream():
-            if chunk["type"] == "audio":
-                audio_data.write(chunk["data"])
+        def flush():
+            run['text'] = " ".join(parts)
+            self.requests_out += 1
+            return run
         
-        return audio_data.getvalue()
+        try:
+            for segment in segments:
+                self.segments_in += 1
+                text = segment['text']
+                if run is not None:
+                    crosses_boundary = segment['chunk'] != run['end_chunk']
+                    if (
+                        segment['voice'] == run['voice']
+                        and run_chars + 1 + len(text) <= self.max_chars
+                        and (previous_boundary_clean or not crosses_boundary)
+                    ):
+                        parts.append(text)
+                        run_chars += 1 + len(text)
+                        if crosses_boundary:
+                            previous_boundary_clean = False
+                        run['end_chunk'] = segment['chunk']
+                        continue
+                    if crosses_boundary:
+                        previous_boundary_clean = True
+                    yield flush()
+                run = {
+                    'type': segment['type'],
+                    'voice': segment['voice'],
+                    'chunk': segment['chunk'],
+                    'end_chunk': segment['chunk'],
+                }
+                parts = [text]
+                run_chars = len(text)
+            if run is not None:
+                yield flush()
+        finally:
+            if hasattr(segments, 'close'):
+                segments.close()
     
-    try:
-        # Run the async function
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        audio_bytes = loop.run_until_complete(_generate_audio())
-        loop.close()
-        return audio_bytes
-    except Exception as e:
-        print(f"Error generating audio: {e}")
-        return None
+    def report(self):
+        saved = self.segments_in - self.requests_out
+        percent = (saved / self.segments_in * 100) if self.segments_in else 0
+        return f"TTS requests: {self.segments_in} segments coalesced into {self.requests_out} requests ({percent:.0f}% fewer)"
 
 def merge_audio_chunks_binary(audio_chunks, output_path):
     """Merge multiple MP3 chunks by concatenating them"""
+    from audio_writer import StreamingAudioWriter
+    
     if not audio_chunks:
         return False
     
-    with open(output_path, 'wb') as outfile:
+    with StreamingAudioWriter(output_path) as writer:
         for chunk_bytes in audio_chunks:
-            outfile.write(chunk_bytes)
+            writer.write(chunk_bytes)
+        writer.commit()
     
     return True
 
-def convert_to_audiobook(input_path, output_path, narrator_voice_id, dialogue_voice_id, emphasis_voice_id, progress_dict=None, progress_key=None):
+def chapter_timestamps(chapters, chunk_char_positions, chunk_time_offsets):
+    """Map chapter character positions to audio time, interpolating within the containing chunk.
+    
+    Both lists hold one entry per chunk boundary: the start of every chunk plus the end of the last one.
+    """
+    from bisect import bisect_right
+    
+    chapter_data = []
+    last = len(chunk_time_offsets) - 2
+    for chapter in chapters:
+        char_pos = chapter['char_position']
+        i = max(0, min(bisect_right(chunk_char_positions, char_pos) - 1, last))
+        start_char, end_char = chunk_char_positions[i], chunk_char_positions[i + 1]
+        fraction = (char_pos - start_char) / (end_char - start_char) if end_char > start_char else 0
+        fraction = min(1.0, max(0.0, fraction))
+        timestamp = chunk_time_offsets[i] + fraction * (chunk_time_offsets[i + 1] - chunk_time_offsets[i])
+        chapter_data.append({
+            "title": chapter['title'],
+            "timestamp": round(timestamp, 1)
+        })
+    return chapter_data
+
+def source_fingerprint(input_path, engine):
+    """Identify a source file, the text pipeline version and the TTS backend, for matching resume checkpoints"""
+    stat = Path(input_path).stat()
+    return {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "pipeline": TEXT_PIPELINE_VERSION,
+        "extractor": EXTRACTOR_VERSION,
+        "backend": engine.backend.name,
+        "max_request_chars": engine.max_request_chars,
+    }
+
+def write_chapters_file(output_path, title, chapter_data):
+    """Atomically (re)write the _chapters.json next to an audiobook"""
     import json
     
+    chapters_path = Path(output_path).parent / f"{Path(output_path).stem}_chapters.json"
+    temp_path = chapters_path.with_suffix('.tmp')
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            "title": title,
+            "chapters": chapter_data
+        }, f, indent=2, ensure_ascii=False)
+    os.replace(temp_path, chapters_path)
+    return chapters_path
+
+def missing_segments_path(output_path):
+    return Path(output_path).parent / f"{Path(output_path).stem}_missing.json"
+
+def read_missing_segments(output_path):
+    """Segments an audiobook is missing, from its _missing.json; [] if there is none"""
+    import json
+    
+    try:
+        with open(missing_segments_path(output_path), 'r', encoding='utf-8') as f:
+            return json.load(f)["segments"]
+    except FileNotFoundError:
+        return []
+
+def write_missing_segments(output_path, segments):
+    """Atomically write the _missing.json next to an audiobook, or remove it if nothing is missing"""
+    import json
+    
+    missing_path = missing_segments_path(output_path)
+    if not segments:
+        missing_path.unlink(missing_ok=True)
+        return None
+    temp_path = missing_path.with_suffix('.tmp')
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump({"segments": segments}, f, indent=2, ensure_ascii=False)
+    os.replace(temp_path, missing_path)
+    return missing_path
+
+def write_timing_report(output_path, report):
+    """Write the per-job timing report next to the _chapters.json"""
+    import json
+    
+    report_path = Path(output_path).parent / f"{Path(output_path).stem}_timings.json"
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    return report_path
+
+def convert_to_audiobook(input_path, output_path, narrator_voice_id, dialogue_voice_id, emphasis_voice_id, progress_dict=None, progress_key=None, cancel_event=None):
+    """Convert a book as a streaming pipeline: extract -> chunk -> segment -> synthesize -> write.
+    
+    Stages run concurrently and hand over work through bounded queues, so the first audio is
+    written while later pages are still being extracted and memory stays flat for any book size.
+    """
     path = Path(input_path)
-    text = ""
-    chapters = []
     
-    def update_progress(status, progress, current, total, message):
+    def update_progress(status, progress, current, total, message, **extra):
         """Helper to update progress dict"""
         if progress_dict is not None and progress_key is not None:
             progress_dict[progress_key] = {
@@ -283,152 +886,654 @@ def convert_to_audiobook(input_path, output_path, narrator_voice_id, dialogue_vo
                 "progress": progress,
                 "current_chunk": current,
                 "total_chunks": total,
-                "message": message
+                "message": message,
+                **extra
             }
     
+    def is_cancelled():
+        return cancel_event is not None and cancel_event.is_set()
+    
     print(f"Starting conversion for: {path.name}")
     print(f"Using narrator voice: {narrator_voice_id}")
     print(f"Using dialogue voice: {dialogue_voice_id}")
     print(f"Using emphasis voice: {emphasis_voice_id}")
     
-    # Extract text and chapters
-    if path.suffix.lower() == '.pdf':
-        def extraction_progress(current, total):
-            percent = int((current / total) * 10)
-            update_progress("processing", percent, 0, 0, f"Extracting text (Page {current}/{total})...")
-            print(f"Extracting page {current}/{total}...")
-
-        text = extract_text_from_pdf(input_path, extraction_progress)
-        # Try intelligent chapter detection for PDFs
-        chapters = detect_chapters_from_text(text)
-        print(f"Detected {len(chapters)} chapters from PDF")
-    elif path.suffix.lower() == '.epub':
-        text, chapters = extract_text_from_epub_with_chapters(input_path)
-        
-        # If no chapters found from TOC, try intelligent detection
-        if not chapters or len(chapters) == 0:
-            print("No TOC found, analyzing text for chapters...")
-            chapters = detect_chapters_from_text(text)
-            print(f"Detected {len(chapters)} chapters from text analysis")
-        else:
-            print(f"Found {len(chapters)} chapters from TOC")
-    else:
+    if path.suffix.lower() not in ('.pdf', '.epub'):
         print(f"Unsupported file format: {path.suffix}")
         return
-
-    if not text:
-        print("No text extracted.")
-        return
-
-    print(f"Extracted {len(text)} characters")
-    update_progress("processing", 10, 0, 0, "Processing text...")
     
-    # Chunk the text
-    chunks = chunk_text(text)
-    print(f"Split into {len(chunks)} chunks")
-    update_progress("converting", 15, 0, len(chunks), f"Starting conversion of {len(chunks)} chunks...")
+    # Resume from the last checkpoint if an interrupted run of this same job left one
+    from tts_engine import get_engine, ErrorBudget, ErrorBudgetExceeded
+    from audio_writer import StreamingAudioWriter
+    from job_manifest import JobManifest
+    import metrics
     
-    # Convert each chunk to audio with voice switching
-    audio_chunks = []
-    chunk_char_positions = []
-    cumulative_chars = 0
+    timer = metrics.StageTimer()
+    voices = {
+        "narrator": narrator_voice_id,
+        "dialogue": dialogue_voice_id,
+        "emphasis": emphasis_voice_id,
+    }
+    engine = get_engine()
+    source = source_fingerprint(input_path, engine)
+    manifest = JobManifest.load_for(output_path)
+    if (
+        manifest
+        and manifest.matches(input_path, voices, source)
+        and StreamingAudioWriter.can_resume(output_path, manifest.resume_offset)
+    ):
+        manifest.rewind()
+        start_chunk = manifest.completed_chunks
+        print(f"Resuming from checkpoint: {start_chunk} chunks already converted")
+    else:
+        manifest = JobManifest.create(input_path, output_path, voices, source)
+        start_chunk = 0
+    chunk_time_offsets = manifest.data["chunk_time_offsets"]
     
-    for i, chunk in enumerate(chunks):
-        # Update progress
-        progress_percent = 15 + int((i / len(chunks)) * 70)  # 15% to 85%
-        update_progress("converting", progress_percent, i + 1, len(chunks), f"Converting chunk {i+1}/{len(chunks)}...")
-        
-        print(f"Converting chunk {i+1}/{len(chunks)}...")
-        chunk_char_positions.append(cumulative_chars)
-        cumulative_chars += len(chunk)
-        
-        # Split chunk into narrative segments
-        segments = split_into_narrative_segments(chunk)
-        chunk_audio = []
-        
-        for segment in segments:
-            # Detect emphasis (ALL CAPS, multiple exclamation marks)
-            text = segment['text']
-            is_emphasis = (
-                (text.isupper() and len(text.split()) > 2) or  # ALL CAPS text
-                ('!!' in text) or  # Multiple exclamation marks
-                ('!!!' in text)
-            )
+    update_progress("processing", 0, 0, 0, "Extracting text...")
+    
+    # Shared between the stages; each list is only appended to by the extraction stage
+    toc_chapters = []
+    detector = ChapterDetector()
+    chunk_char_positions = []  # source offset of every chunk, plus the end of the text once known
+    extraction = {"fraction": 0.0, "total_chunks": None, "text_length": 0, "logged_tenth": -1}
+    
+    def extraction_progress(current, total):
+        extraction["fraction"] = current / total
+        if len(chunk_time_offsets) - 1 <= start_chunk:  # no chunk converted yet
+            update_progress("processing", int(extraction["fraction"] * 10), 0, 0, f"Extracting text ({current}/{total})...")
+        tenth = current * 10 // total
+        if tenth != extraction["logged_tenth"]:
+            extraction["logged_tenth"] = tenth
+            print(f"Extracting {current}/{total}...")
+    
+    # A book extracted before (under any name) is read back instead of parsed again
+    with timer.timed("extract"):
+        cached = load_cached_extraction(input_path)
+    if cached is not None:
+        print(f"Using cached extraction: {cached.piece_count} pieces, {len(cached.chapters)} chapters")
+    
+    def open_cache_writer():
+        cache = get_extraction_cache()
+        if cached is not None or cache is None:
+            return None
+        try:
+            return cache.writer(input_path)
+        except OSError as e:
+            print(f"Not caching extraction: {e}")
+            return None
+    
+    def cache_step(cache_writer, step, *args):
+        """One write to the extraction cache; a failing cache is dropped, the conversion goes on"""
+        try:
+            with timer.timed("extract"):
+                getattr(cache_writer, step)(*args)
+            return cache_writer
+        except OSError as e:
+            print(f"Not caching extraction: {e}")
+            cache_writer.abort()
+            return None
+    
+    def iter_pieces():
+        """Extraction stage: book pieces, with chapters found as each piece arrives"""
+        base = 0
+        if cached is not None:
+            pieces = iter_cached_pieces(cached, extraction_progress)
+        else:
+            pieces = iter_book_pieces(input_path, extraction_progress)
+        cache_writer = open_cache_writer()
+        try:
+            for piece, toc_title in timer.iterate("extract", pieces):
+                if toc_title:
+                    toc_chapters.append({"title": toc_title, "char_position": base})
+                if cached is None:
+                    with timer.timed("detect"):
+                        detector.feed(piece, base)
+                if cache_writer is not None:
+                    cache_writer = cache_step(cache_writer, "add", piece, toc_title)
+                base += len(piece)
+                metrics.TEXT_CHARACTERS.inc(len(piece))
+                yield piece
+            with timer.timed("detect"):
+                detector.finish()
+            extraction["text_length"] = base
+            if cache_writer is not None:
+                cache_step(cache_writer, "commit", current_chapters())
+                cache_writer = None
+        finally:
+            # Cancelled or failed extractions leave no partial sidecar behind
+            if cache_writer is not None:
+                cache_writer.abort()
+    
+    def iter_chunks():
+        """Chunking stage: (index, chunk), recording each chunk's source offset"""
+        count = 0
+        # Chunks and requests are sized to what the TTS backend accepts in one request
+        chunker = iter_text_chunks(iter_pieces(), min(CHUNK_TARGET_CHARS, engine.max_request_chars))
+        for offset, chunk in timer.iterate("chunk", chunker, exclude=("extract", "detect")):
+            chunk_char_positions.append(offset)
+            yield count, chunk
+            count += 1
+        chunk_char_positions.append(extraction["text_length"])
+        extraction["total_chunks"] = count
+        extraction["fraction"] = 1.0
+        print(f"Extracted {extraction['text_length']} characters, split into {count} chunks")
+    
+    def iter_segments(chunks):
+        """Segmentation stage: voiced segments of the chunks that still need converting"""
+        try:
+            for i, chunk in chunks:
+                if i < start_chunk:
+                    continue
+                with timer.timed("segment"):
+                    segments = split_into_narrative_segments(chunk)
+                    for segment in segments:
+                        segment['chunk'] = i
+                        segment['voice'] = choose_voice(segment, narrator_voice_id, dialogue_voice_id, emphasis_voice_id)
+                yield from segments
+        finally:
+            chunks.close()
+    
+    def current_chapters():
+        if cached is not None:
+            return cached.chapters
+        # TOC chapters win over text analysis, as for fully extracted books
+        return toc_chapters if toc_chapters else detector.chapters
+    
+    def estimated_total():
+        if extraction["total_chunks"] is not None:
+            return extraction["total_chunks"]
+        if extraction["fraction"] > 0:
+            return max(len(chunk_char_positions), int(len(chunk_char_positions) / extraction["fraction"]))
+        return len(chunk_char_positions)
+    
+    # Segments go straight to disk in order through the shared engine; nothing accumulates in memory
+    writer = StreamingAudioWriter(output_path, resume_offset=manifest.resume_offset)
+    current_chunk = start_chunk
+    chapters_written = None
+    
+    def publish_chapters(final=False):
+        """Write markers for chapters that start inside already converted chunks"""
+        nonlocal chapters_written
+        chapters = current_chapters()
+        completed = len(chunk_time_offsets) - 1
+        if final:
+            ready = chapters
+        else:
+            if completed < 1 or len(chunk_char_positions) <= completed:
+                return
+            converted_chars = chunk_char_positions[completed]
+            ready = [chapter for chapter in chapters if chapter['char_position'] < converted_chars]
+        if not ready or ((id(chapters), len(ready)) == chapters_written and not final):
+            return
+        # Chapter timestamps from the exact audio time at each chunk boundary
+        chapter_data = chapter_timestamps(ready, chunk_char_positions[:completed + 1], chunk_time_offsets)
+        chapters_path = write_chapters_file(output_path, path.stem, chapter_data)
+        chapters_written = (id(chapters), len(ready))
+        if final:
+            print(f"Saved chapter data to {chapters_path}")
+        return chapter_data
+    
+    def finish_chunk(i, spanned=False):
+        # Checkpoint only audio that is already on stable storage
+        with timer.timed("merge"):
+            writer.sync()
+            if manifest.data.get("total_chunks") is None and extraction["total_chunks"] is not None:
+                manifest.data["total_chunks"] = extraction["total_chunks"]
+            manifest.record_chunk(writer.bytes_written, writer.duration, spanned=spanned)
+            publish_chapters()
+        total = estimated_total()
+        progress_percent = 15 + int(min(1.0, (i + 1) / max(1, total)) * 70)  # 15% to 85%
+        update_progress("converting", progress_percent, i + 1, total, f"Converted chunk {i+1}/{total}")
+        print(f"Converted chunk {i+1}/{total}")
+    
+    def record_missing(request, reason):
+        """Remember a segment left out of the audio, and where it belongs, so it can be regenerated alone"""
+        nonlocal dropped_segments
+        dropped_segments += 1
+        metrics.DROPPED_SEGMENTS.labels(reason).inc()
+        manifest.record_missing({
+            "chunk": request['chunk'],
+            "type": request['type'],
+            "voice": request['voice'],
+            "text": request['text'],
+            "reason": reason,
+            "byte_offset": writer.bytes_written,
+            "time_offset": round(writer.duration, 3),
+        })
+    
+    def finish_job(outcome):
+        """Record stage timings; completed jobs can also get a timing report file"""
+        report = timer.finish(outcome)
+        if outcome == "completed" and metrics.JOB_TIMING_REPORT:
+            report.update({
+                "backend": engine.backend.name,
+                "characters": extraction["text_length"],
+                "chunks": extraction["total_chunks"],
+                "resumed_from_chunk": start_chunk,
+                "segments": planner.segments_in,
+                "tts_requests": planner.requests_out,
+                "dropped_segments": dropped_segments,
+                "missing_segments": len(manifest.missing_segments),
+                "tts_retries": budget.retries,
+                "audio_bytes": writer.bytes_written,
+                "audio_seconds": round(writer.duration, 1),
+            })
+            print(f"Saved timing report to {write_timing_report(output_path, report)}")
+        print("Stage times: " + ", ".join(f"{stage} {seconds:.1f}s" for stage, seconds in timer.seconds.items()))
+    
+    planner = VoiceRunPlanner(engine.max_request_chars)
+    dropped_segments = 0
+    budget = ErrorBudget()
+    chunks = iter_in_thread(iter_chunks(), name="extract-chunk")
+    requests = iter_in_thread(planner.plan(iter_segments(chunks)), name="segment-plan")
+    try:
+        for request, audio_bytes in timer.iterate("synthesize", engine.synthesize_ordered(requests, cancel_event=cancel_event, budget=budget)):
+            while request['chunk'] > current_chunk:
+                finish_chunk(current_chunk)
+                current_chunk += 1
             
-            # Choose voice based on segment type and emphasis
-            if is_emphasis:
-                voice_to_use = emphasis_voice_id
-            elif segment['type'] == 'dialogue':
-                voice_to_use = dialogue_voice_id
+            if audio_bytes:
+                with timer.timed("merge"):
+                    written_before = writer.bytes_written
+                    segments_before = writer.segments_written
+                    writer.write(audio_bytes)
+                metrics.AUDIO_BYTES.inc(writer.bytes_written - written_before)
+                if writer.segments_written == segments_before:
+                    record_missing(request, "no_audio_frames")
             else:
-                voice_to_use = narrator_voice_id
+                record_missing(request, "tts_failed")
+                print(f"  ! Failed to generate audio for {request['type']} segment: {request['text'][:50]}...")
             
-            print(f"  - Generating audio for segment ({len(segment['text'])} chars, voice: {voice_to_use})")
-            try:
-                audio_bytes = text_to_speech_chunk(segment['text'], voice_to_use)
-                if audio_bytes:
-                    chunk_audio.append(audio_bytes)
-                else:
-                    print(f"  ! Failed to generate audio for segment: {segment['text'][:50]}...")
-            except Exception as e:
-                print(f"  ! Error generating audio segment: {str(e)}")
-                import traceback
-                traceback.print_exc()
-            else:
-                print(f"Failed to convert {segment['type']} segment")
+            # The request ran on into later chunks, so the ones it finished have no clean end
+            while request['end_chunk'] > current_chunk:
+                finish_chunk(current_chunk, spanned=True)
+                current_chunk += 1
         
-        # Merge segments within this chunk
-        if chunk_audio:
-            # Concatenate all segment audio for this chunk
-            merged_chunk = b''.join(chunk_audio)
-            audio_chunks.append(merged_chunk)
+        if not is_cancelled():
+            # Everything has been extracted once the segment stream is exhausted
+            while current_chunk < extraction["total_chunks"]:
+                finish_chunk(current_chunk)
+                current_chunk += 1
+    except ErrorBudgetExceeded as e:
+        # The TTS service keeps failing: stop rather than finish a book full of holes, and
+        # keep the partial file and checkpoint so converting again resumes from here
+        writer.close()
+        manifest.data["status"] = "stopped"
+        manifest.save()
+        print(f"Stopping conversion: {e}")
+        update_progress("failed", 0, current_chunk, estimated_total(),
+                        f"Stopped: {e}. Converting again resumes from chunk {manifest.completed_chunks + 1}.")
+        finish_job("failed")
+        return
+    except Exception:
+        # Keep the partial file and manifest so the job can resume from its last checkpoint
+        writer.close()
+        finish_job("error")
+        raise
+    finally:
+        requests.close()
     
-    if not audio_chunks:
+    print(planner.report())
+    total_chunks = extraction["total_chunks"] or current_chunk
+    
+    if is_cancelled():
+        writer.abort()
+        manifest.delete()
+        print(f"Conversion cancelled: {path.name}")
+        update_progress("cancelled", 0, current_chunk, total_chunks, "Conversion cancelled")
+        finish_job("cancelled")
+        return
+    
+    if not total_chunks:
+        writer.abort()
+        manifest.delete()
+        print("No text extracted.")
+        update_progress("failed", 0, 0, 0, "No text extracted")
+        finish_job("failed")
+        return
+    
+    if not writer.bytes_written:
+        writer.abort()
+        manifest.delete()
         print("No audio generated")
+        update_progress("failed", 0, total_chunks, total_chunks, "No audio generated")
+        finish_job("failed")
         return
     
-    # Calculate chapter timestamps
-    if chapters:
-        # Estimate audio duration per character
-        total_audio_bytes = sum(len(chunk) for chunk in audio_chunks)
-        # Rough estimate: 1 minute of MP3 ≈ 1MB at 128kbps, average reading speed ≈ 150 chars/sec
-        chars_per_second = 15  # Conservative estimate
-        
-        chapter_data = []
-        for chapter in chapters:
-            # Find which chunk this chapter starts in
-            char_pos = chapter['char_position']
-            timestamp = char_pos / chars_per_second
-            chapter_data.append({
-                "title": chapter['title'],
-                "timestamp": round(timestamp, 1)
-            })
-        
-        # Save chapter metadata
-        chapters_path = Path(output_path).with_suffix('').with_suffix('').with_name(
-            Path(output_path).stem + '_chapters.json'
-        )
-        chapters_path = Path(output_path).parent / f"{Path(output_path).stem}_chapters.json"
+    chapter_data = publish_chapters(final=True) if current_chapters() else None
+    
+    print(f"Finalizing {writer.segments_written} audio segments...")
+    update_progress("finalizing", 90, total_chunks, total_chunks, "Finalizing audiobook...")
+    
+    # Atomically move the finished file into the library
+    try:
+        with timer.timed("merge"):
+            writer.commit()
+    except Exception as e:
+        writer.abort()
+        manifest.delete()
+        print(f"Failed to finalize audio file: {e}")
+        update_progress("failed", 0, total_chunks, total_chunks, "Conversion failed")
+        finish_job("failed")
+        return
+    with timer.timed("merge"):
+        write_segment_manifest(output_path, writer, path.stem, chapter_data)
+    missing = manifest.missing_segments
+    if missing:
+        print(f"{len(missing)} segments are missing; listed in {write_missing_segments(output_path, missing)}")
+    else:
+        write_missing_segments(output_path, [])
+    manifest.delete()
+    
+    file_size = Path(output_path).stat().st_size
+    print(f"Audio saved to {output_path}")
+    print(f"File size: {file_size / 1024 / 1024:.2f} MB")
+    if engine.cache is not None:
+        engine.cache.flush()
+        stats = engine.cache.stats()
+        print(f"TTS cache: {stats['hits']} hits, {stats['misses']} misses, {stats['bytes'] / 1024 / 1024:.1f} MB stored")
+    finish_job("completed")
+    if missing:
+        update_progress("completed", 100, total_chunks, total_chunks,
+                        f"Conversion complete, {len(missing)} segments missing", missing_segments=len(missing))
+    else:
+        update_progress("completed", 100, total_chunks, total_chunks, "Conversion complete!")
+
+REPAIR_COPY_BLOCK = 1 << 20  # bytes of existing audio copied per write while splicing
+
+def repair_missing_segments(output_path, progress_dict=None, progress_key=None, cancel_event=None):
+    """Synthesize only the segments listed in an audiobook's _missing.json and splice them in.
+    
+    The existing audio is copied frame by frame around the insertions, so nothing else is
+    sent to the TTS service; chapter markers after an insertion move by its duration.
+    Segments that fail again stay listed, at their new positions.
+    """
+    import json
+    from collections import deque
+    from tts_engine import get_engine, ErrorBudget
+    from audio_writer import StreamingAudioWriter
+    from mp3_frames import iter_file_frames
+    
+    output_path = Path(output_path)
+    
+    def update_progress(status, progress, message, **extra):
+        if progress_dict is not None and progress_key is not None:
+            progress_dict[progress_key] = {
+                "status": status,
+                "progress": progress,
+                "current_chunk": 0,
+                "total_chunks": 0,
+                "message": message,
+                **extra
+            }
+    
+    missing = sorted(read_missing_segments(output_path), key=lambda segment: segment["byte_offset"])
+    if not missing:
+        update_progress("completed", 100, "Nothing to repair")
+        return
+    
+    print(f"Regenerating {len(missing)} missing segments of {output_path.name}")
+    update_progress("converting", 10, f"Regenerating {len(missing)} missing segments...")
+    # Every segment gets its retries; a failure here only leaves that segment listed
+    budget = ErrorBudget(failure_ratio=1.0)
+    results = deque(get_engine().synthesize_ordered(missing, cancel_event=cancel_event, budget=budget))
+    if cancel_event is not None and cancel_event.is_set():
+        update_progress("cancelled", 0, "Repair cancelled")
+        return
+    
+    update_progress("finalizing", 80, "Splicing regenerated audio...")
+    inserted = []  # (original time offset, seconds of audio inserted there)
+    still_missing = []
+    
+    with StreamingAudioWriter(output_path) as writer:
+        with open(output_path, 'rb') as source, open(output_path, 'rb') as scan:
+            def copy_run(start, end):
+                if end > start:
+                    source.seek(start)
+                    writer.write(source.read(end - start))
         
-        with open(chapters_path, 'w', encoding='utf-8') as f:
-            json.dump({
-                "title": path.stem,
-                "chapters": chapter_data
-            }, f, indent=2, ensure_ascii=False)
+            def insert(segment, audio_bytes):
+                duration_before = writer.duration
+                segments_before = writer.segments_written
+                if audio_bytes:
+                    writer.write(audio_bytes)
+                if writer.segments_written == segments_before:
+                    still_missing.append({**segment, "byte_offset": writer.bytes_written, "time_offset": round(writer.duration, 3)})
+                else:
+                    inserted.append((segment["time_offset"], writer.duration - duration_before))
         
-        print(f"Saved chapter data to {chapters_path}")
+            run_start = run_end = None
+            for offset, frame, is_xing in iter_file_frames(scan, output_path.stat().st_size):
+                if is_xing:
+                    continue
+                while results and results[0][0]["byte_offset"] <= offset:
+                    if run_start is not None:
+                        copy_run(run_start, run_end)
+                        run_start = None
+                    insert(*results.popleft())
+                if run_start is None:
+                    run_start = offset
+                elif offset + frame["length"] - run_start > REPAIR_COPY_BLOCK:
+                    copy_run(run_start, run_end)
+                    run_start = offset
+                run_end = offset + frame["length"]
+            if run_start is not None:
+                copy_run(run_start, run_end)
+            while results:
+                insert(*results.popleft())
+        writer.commit()
     
-    print(f"Merging {len(audio_chunks)} audio chunks...")
-    update_progress("finalizing", 90, len(chunks), len(chunks), "Finalizing audiobook...")
+    # Chapters start at chunk boundaries; audio inserted exactly there belongs to the new chapter
+    chapters_path = output_path.parent / f"{output_path.stem}_chapters.json"
+    chapter_file = {"title": output_path.stem, "chapters": []}
+    if chapters_path.exists():
+        with open(chapters_path, 'r', encoding='utf-8') as f:
+            chapter_file = json.load(f)
+    if inserted:
+        for chapter in chapter_file.get("chapters", []):
+            shift = sum(seconds for at, seconds in inserted if at < chapter["timestamp"] - 0.05)
+            chapter["timestamp"] = round(chapter["timestamp"] + shift, 1)
+        if chapters_path.exists():
+            write_chapters_file(output_path, chapter_file.get("title"), chapter_file.get("chapters", []))
+    # The audio was rewritten, so the segment offsets are recomputed even if nothing moved
+    write_segment_manifest(output_path, writer, chapter_file.get("title"), chapter_file.get("chapters", []))
     
-    # Merge all audio chunks using binary concatenation
-    success = merge_audio_chunks_binary(audio_chunks, output_path)
-    
-    if success:
-        file_size = Path(output_path).stat().st_size
-        print(f"Audio saved to {output_path}")
-        print(f"File size: {file_size / 1024 / 1024:.2f} MB")
-        update_progress("completed", 100, len(chunks), len(chunks), "Conversion complete!")
+    write_missing_segments(output_path, still_missing)
+    print(f"Repaired {len(inserted)} segments, {len(still_missing)} still missing")
+    if still_missing:
+        update_progress("completed", 100, f"Repaired {len(inserted)} segments, {len(still_missing)} still missing",
+                        missing_segments=len(still_missing))
     else:
-        print("Failed to merge audio chunks")
-        update_progress("failed", 0, len(chunks), len(chunks), "Conversion failed")
+        update_progress("completed", 100, f"Repaired {len(inserted)} segments")
+
+def on_demand_text_cache(output_path):
+    """Where an on-demand book's extracted text is read from by its chapter jobs.
+    
+    The shared extraction cache if there is one, else a private one next to the book's chapters.
+    """
+    from extraction_cache import ExtractionCache
+    from on_demand import chapter_dir
+    
+    return get_extraction_cache() or ExtractionCache(chapter_dir(output_path) / "text", EXTRACTOR_VERSION)
+
+def extract_to_cache(input_path, cache, progress_callback=None, cancel_event=None):
+    """Extract a book into an extraction cache, with chapters detected as for a conversion.
+    
+    Returns the CachedExtraction, or None if cancelled.
+    """
+    toc_chapters = []
+    detector = ChapterDetector()
+    cache_writer = cache.writer(input_path)
+    pieces = iter_book_pieces(input_path, progress_callback)
+    base = 0
+    try:
+        for piece, toc_title in pieces:
+            if cancel_event is not None and cancel_event.is_set():
+                return None
+            if toc_title:
+                toc_chapters.append({"title": toc_title, "char_position": base})
+            detector.feed(piece, base)
+            cache_writer.add(piece, toc_title)
+            base += len(piece)
+        detector.finish()
+        # TOC chapters win over text analysis, as for converted books
+        cache_writer.commit(toc_chapters or detector.chapters)
+        cache_writer = None
+    finally:
+        pieces.close()
+        if cache_writer is not None:
+            cache_writer.abort()
+    return cache.load(input_path)
+
+def iter_piece_range(cached, start, end):
+    """Yield the text of a cached book between two character offsets, piece by piece"""
+    base = 0
+    for text, _ in cached:
+        piece_end = base + len(text)
+        if piece_end > start:
+            yield text[max(0, start - base):end - base]
+        base = piece_end
+        if base >= end:
+            break
+
+def prepare_on_demand(input_path, output_path, narrator_voice_id, dialogue_voice_id, emphasis_voice_id, progress_dict=None, progress_key=None, cancel_event=None):
+    """Extract a book and plan its chapters for on-demand conversion, without synthesizing anything.
+    
+    Chapters come from the EPUB TOC or chapter detection, as for a full conversion; they are
+    converted one by one later by convert_on_demand_chapter, as the listener gets to them.
+    Returns the plan, or None if nothing could be planned.
+    """
+    import metrics
+    from on_demand import plan_chapters, fold_silent_chapters, write_plan, PLAN_VERSION
+    
+    path = Path(input_path)
+    
+    def update_progress(status, progress, message):
+        if progress_dict is not None and progress_key is not None:
+            progress_dict[progress_key] = {
+                "status": status,
+                "progress": progress,
+                "current_chunk": 0,
+                "total_chunks": 0,
+                "message": message,
+            }
+    
+    def extraction_progress(current, total):
+        update_progress("processing", int(current / total * 90), f"Extracting text ({current}/{total})...")
+    
+    if path.suffix.lower() not in ('.pdf', '.epub'):
+        print(f"Unsupported file format: {path.suffix}")
+        update_progress("failed", 0, "Unsupported file format")
+        return None
+    
+    print(f"Preparing on-demand conversion for: {path.name}")
+    update_progress("processing", 0, "Extracting text...")
+    cache = on_demand_text_cache(output_path)
+    cached = cache.load(input_path)
+    if cached is None:
+        cached = extract_to_cache(input_path, cache, extraction_progress, cancel_event)
+        if cached is None:
+            update_progress("cancelled", 0, "Conversion cancelled")
+            return None
+        metrics.TEXT_CHARACTERS.inc(cached.meta["characters"])
+    
+    chapters = plan_chapters(cached.chapters, [len(text) for text, _ in cached])
+    chapters = fold_silent_chapters(chapters, (text for text, _ in cached))
+    if not chapters:
+        print("No text extracted.")
+        update_progress("failed", 0, "No text extracted")
+        return None
+    
+    plan = {
+        "version": PLAN_VERSION,
+        "title": path.stem,
+        "input_path": str(input_path),
+        "voices": {
+            "narrator": narrator_voice_id,
+            "dialogue": dialogue_voice_id,
+            "emphasis": emphasis_voice_id,
+        },
+        "characters": cached.meta["characters"],
+        "chapters": chapters,
+    }
+    print(f"Planned {len(chapters)} chapters of {plan['characters']} characters in {write_plan(output_path, plan)}")
+    return plan
+
+def convert_on_demand_chapter(output_path, index, cancel_event=None):
+    """Convert one chapter of an on-demand book to its own MP3; True once the chapter is ready.
+    
+    The chapter's text is read back from the extraction cache and goes through the same
+    chunking, segmentation, voice planning and synthesis as a full conversion. Chapters are
+    short enough to be redone if interrupted, so there is no checkpoint.
+    """
+    from tts_engine import get_engine, ErrorBudget, ErrorBudgetExceeded
+    from audio_writer import StreamingAudioWriter
+    from on_demand import read_plan, chapter_audio_path
+    import metrics
+    
+    plan = read_plan(output_path)
+    if plan is None or not 0 <= index < len(plan["chapters"]):
+        print(f"No chapter {index} planned for {Path(output_path).name}")
+        return False
+    audio_path = chapter_audio_path(output_path, index)
+    if audio_path.exists():
+        return True
+    
+    chapter = plan["chapters"][index]
+    voices = plan["voices"]
+    input_path = plan["input_path"]
+    print(f"Converting chapter {index + 1}/{len(plan['chapters'])} of {Path(output_path).name}: {chapter['title']}")
+    
+    cache = on_demand_text_cache(output_path)
+    cached = cache.load(input_path)
+    if cached is None:
+        # The cache was cleared since the book was prepared
+        cached = extract_to_cache(input_path, cache, cancel_event=cancel_event)
+        if cached is None:
+            return False
+    
+    engine = get_engine()
+    
+    def iter_segments():
+        pieces = iter_piece_range(cached, chapter["char_start"], chapter["char_end"])
+        chunks = iter_text_chunks(pieces, min(CHUNK_TARGET_CHARS, engine.max_request_chars))
+        for i, (_, chunk) in enumerate(chunks):
+            for segment in split_into_narrative_segments(chunk):
+                segment['chunk'] = i
+                segment['voice'] = choose_voice(segment, voices["narrator"], voices["dialogue"], voices["emphasis"])
+                yield segment
+    
+    planner = VoiceRunPlanner(engine.max_request_chars)
+    budget = ErrorBudget()
+    dropped_segments = 0
+    with StreamingAudioWriter(audio_path) as writer:
+        try:
+            for request, audio_bytes in engine.synthesize_ordered(planner.plan(iter_segments()), cancel_event=cancel_event, budget=budget):
+                segments_before = writer.segments_written
+                if audio_bytes:
+                    written_before = writer.bytes_written
+                    writer.write(audio_bytes)
+                    metrics.AUDIO_BYTES.inc(writer.bytes_written - written_before)
+                if writer.segments_written == segments_before:
+                    dropped_segments += 1
+                    metrics.DROPPED_SEGMENTS.labels("tts_failed" if not audio_bytes else "no_audio_frames").inc()
+        except ErrorBudgetExceeded as e:
+            print(f"Stopping chapter {index + 1}: {e}")
+            return False
+        
+        if cancel_event is not None and cancel_event.is_set():
+            print(f"Chapter {index + 1} cancelled")
+            return False
+        if not writer.bytes_written:
+            print(f"No audio generated for chapter {index + 1}")
+            return False
+        writer.commit()
+    
+    if engine.cache is not None:
+        engine.cache.flush()
+    print(planner.report())
+    if dropped_segments:
+        print(f"Chapter {index + 1} is missing {dropped_segments} segments")
+    print(f"Chapter {index + 1} saved to {audio_path} ({writer.duration:.1f}s)")
+    return True
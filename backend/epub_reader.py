@@ -0,0 +1,170 @@
+import codecs
+import zipfile
+import posixpath
+import threading
+from urllib.parse import unquote
+from lxml import etree
+
+CONTAINER_PATH = "META-INF/container.xml"
+DOCUMENT_TYPES = {"application/xhtml+xml", "text/html"}
+NCX_TYPE = "application/x-dtbncx+xml"
+
+_ROOTFILE = etree.XPath("//*[local-name()='rootfile']/@full-path")
+_MANIFEST_ITEMS = etree.XPath("//*[local-name()='manifest']/*[local-name()='item']")
+_SPINE = etree.XPath("//*[local-name()='spine']")
+_ITEMREFS = etree.XPath("*[local-name()='itemref']")
+_NAV_TOC = etree.XPath("//*[local-name()='nav'][@*[local-name()='type']='toc']")
+_NAV_ANY = etree.XPath("//*[local-name()='nav']")
+_NAV_LINKS = etree.XPath(".//*[local-name()='a'][@href]")
+_NAV_POINTS = etree.XPath("//*[local-name()='navPoint']")
+_NAV_POINT_LABEL = etree.XPath("string(*[local-name()='navLabel'][1])")
+_NAV_POINT_SRC = etree.XPath("string(*[local-name()='content'][1]/@src)")
+# Everything a reader would hear: the body's text, without scripts and style sheets
+_BODY_TEXT = etree.XPath("//body//text()[not(ancestor::script or ancestor::style)]")
+_ALL_TEXT = etree.XPath("//text()[not(ancestor::head or ancestor::script or ancestor::style)]")
+
+_parsers = threading.local()  # lxml parsers must not be shared between threads
+
+
+def _html_parser(encoding):
+    parser = getattr(_parsers, encoding, None)
+    if parser is None:
+        parser = etree.HTMLParser(encoding=encoding, remove_comments=True, remove_pis=True,
+                                  no_network=True, huge_tree=True)
+        setattr(_parsers, encoding, parser)
+    return parser
+
+
+def _xml_parser():
+    parser = getattr(_parsers, "xml", None)
+    if parser is None:
+        parser = _parsers.xml = etree.XMLParser(recover=True, resolve_entities=False, no_network=True,
+                                                huge_tree=True)
+    return parser
+
+
+def document_text(content):
+    """Spoken text of one XHTML content document.
+
+    libxml2's HTML parser is lenient with the XHTML found in the wild and decodes HTML
+    entities, which a strict XML parse of an EPUB document without its DTD would drop.
+    """
+    if not content.strip():
+        return ""
+    encoding = "utf-16" if content[:2] in (codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE) else "utf-8"
+    root = etree.fromstring(content, _html_parser(encoding))
+    if root is None:
+        return ""
+    texts = _BODY_TEXT(root)
+    if not texts and root.find(".//body") is None:
+        texts = _ALL_TEXT(root)
+    return "".join(texts)
+
+
+def read_document_text(archive, name):
+    """Text of the content document `name` in an open archive; missing or broken ones read as empty"""
+    try:
+        return document_text(archive.read(name))
+    except (KeyError, etree.LxmlError, zipfile.BadZipFile) as e:
+        print(f"Error extracting {name}: {e}")
+        return ""
+
+
+def _resolve(base_path, href):
+    """Archive member name of an href found in the document at base_path"""
+    href = unquote(href.split('#', 1)[0])
+    return posixpath.normpath(posixpath.join(posixpath.dirname(base_path), href))
+
+
+class EpubPackage:
+    """An EPUB opened for reading aloud: the spine in reading order and the TOC titles.
+
+    Only the container, package document and TOC are parsed here; content documents are
+    read from the archive one at a time, so opening a book costs the same at any size.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.archive = zipfile.ZipFile(path)
+        try:
+            self.package_path = _ROOTFILE(self._parse_xml(CONTAINER_PATH))[0]
+            package = self._parse_xml(self.package_path)
+            self.spine, toc_path, nav_path = self._read_package(package)
+            self.toc = {}  # member name -> title of the first TOC entry pointing into it
+            if nav_path:
+                self._read_nav(nav_path)
+            if not self.toc and toc_path:
+                self._read_ncx(toc_path)
+        except Exception:
+            self.archive.close()
+            raise
+
+    def _parse_xml(self, name):
+        return etree.fromstring(self.archive.read(name), _xml_parser())
+
+    def _read_package(self, package):
+        items = {}
+        nav_path = None
+        ncx_path = None
+        for item in _MANIFEST_ITEMS(package):
+            href = item.get("href")
+            if not href:
+                continue
+            name = _resolve(self.package_path, href)
+            media_type = item.get("media-type", "")
+            items[item.get("id")] = (name, media_type)
+            if "nav" in item.get("properties", "").split():
+                nav_path = name
+            if media_type == NCX_TYPE:
+                ncx_path = name
+
+        spine = []
+        spine_elements = _SPINE(package)
+        if spine_elements:
+            toc_id = spine_elements[0].get("toc")
+            if toc_id in items:
+                ncx_path = items[toc_id][0]
+            for itemref in _ITEMREFS(spine_elements[0]):
+                # Non-linear items (footnotes, answer keys) are not part of the reading order
+                if itemref.get("linear") == "no" or itemref.get("idref") not in items:
+                    continue
+                name, media_type = items[itemref.get("idref")]
+                if media_type in DOCUMENT_TYPES:
+                    spine.append(name)
+        return spine, ncx_path, nav_path
+
+    def _add_toc_entry(self, base_path, href, title):
+        title = " ".join(title.split())
+        if href and title:
+            self.toc.setdefault(_resolve(base_path, href), title)
+
+    def _read_nav(self, nav_path):
+        try:
+            nav = self._parse_xml(nav_path)
+        except KeyError:
+            return
+        navs = _NAV_TOC(nav) or _NAV_ANY(nav)[:1]
+        for link in (_NAV_LINKS(navs[0]) if navs else []):
+            self._add_toc_entry(nav_path, link.get("href"), "".join(link.itertext()))
+
+    def _read_ncx(self, ncx_path):
+        try:
+            ncx = self._parse_xml(ncx_path)
+        except KeyError:
+            return
+        # Nested navPoints come back in document order, so volumes precede their chapters
+        for point in _NAV_POINTS(ncx):
+            self._add_toc_entry(ncx_path, _NAV_POINT_SRC(point), _NAV_POINT_LABEL(point))
+
+    def read_text(self, name):
+        return read_document_text(self.archive, name)
+
+    def close(self):
+        self.archive.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
@@ -0,0 +1,148 @@
+import os
+import json
+import asyncio
+
+EVENT_COALESCE_SECONDS = float(os.environ.get("EVENT_COALESCE_SECONDS", "0.5"))
+EVENT_HEARTBEAT_SECONDS = 15
+EVENT_RELAY_SECONDS = float(os.environ.get("EVENT_RELAY_SECONDS", "0.5"))  # how often events of other processes are picked up
+
+
+class Subscription:
+    """One client's pending events; a newer event for the same (type, key) replaces the older one"""
+
+    def __init__(self):
+        self._pending = {}
+        self._wakeup = asyncio.Event()
+
+    def push(self, event_type, key, data):
+        self._pending.pop((event_type, key), None)
+        self._pending[(event_type, key)] = data
+        self._wakeup.set()
+
+    async def next_batch(self, timeout):
+        """Wait for events; returns [(event_type, key, data)] or [] on timeout"""
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            return []
+        self._wakeup.clear()
+        batch = [(event_type, key, data) for (event_type, key), data in self._pending.items()]
+        self._pending = {}
+        return batch
+
+
+class EventHub:
+    """Fans out progress and library events from worker threads to SSE clients on the server loop.
+
+    With a job store attached, events are also logged there and events logged by other server
+    processes are relayed to this one's clients, so every client sees every job.
+    """
+
+    def __init__(self):
+        self._loop = None
+        self._subscribers = set()
+        self._store = None
+        self._origin = None
+        self._relay_task = None
+
+    def bind(self, loop):
+        self._loop = loop
+
+    def attach(self, store, origin):
+        """Share events through store; call from the server loop once it is running"""
+        self._store = store
+        self._origin = origin
+        self._relay_task = asyncio.get_running_loop().create_task(self._relay())
+
+    async def _relay(self):
+        seq, _ = await asyncio.to_thread(self._store.events_since, None)
+        while True:
+            await asyncio.sleep(EVENT_RELAY_SECONDS)
+            try:
+                seq, events = await asyncio.to_thread(self._store.events_since, seq, self._origin)
+            except Exception as e:
+                print(f"Could not read shared events: {e}")
+                continue
+            for event_type, key, data in events:
+                self._dispatch(event_type, key, data)
+
+    def publish(self, event_type, key, data=None):
+        """Thread-safe; dropped locally if no loop is bound yet"""
+        if self._store is not None:
+            self._store.add_event(event_type, key, data, self._origin)
+        if self._loop is None or self._loop.is_closed():
+            return
+        self._loop.call_soon_threadsafe(self._dispatch, event_type, key, data)
+
+    def _dispatch(self, event_type, key, data):
+        for subscription in self._subscribers:
+            subscription.push(event_type, key, data)
+
+    def subscribe(self):
+        subscription = Subscription()
+        self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self._subscribers.discard(subscription)
+
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+
+hub = EventHub()
+
+
+class ProgressDict:
+    """Conversion progress map kept in the job store, publishing every change to the event hub.
+
+    Reads go to the store, so every server process sees the progress of jobs running in any other.
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    def get(self, key, default=None):
+        value = self.store.get_progress(key)
+        return default if value is None else value
+
+    def __getitem__(self, key):
+        value = self.store.get_progress(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.store.get_progress(key) is not None
+
+    def __setitem__(self, key, value):
+        self.store.set_progress(key, value)
+        hub.publish("progress", key, value)
+
+    def __delitem__(self, key):
+        if not self.store.delete_progress(key):
+            raise KeyError(key)
+        hub.publish("removed", key)
+
+    def pop(self, key, *default):
+        value = self.store.get_progress(key)
+        if value is None:
+            if default:
+                return default[0]
+            raise KeyError(key)
+        if self.store.delete_progress(key):
+            hub.publish("removed", key)
+        return value
+
+    def setdefault(self, key, default=None):
+        value = self.store.get_progress(key)
+        if value is None:
+            self[key] = value = default
+        return value
+
+    def items(self):
+        return self.store.all_progress().items()
+
+
+def format_sse(event_type, data):
+    return f"event: {event_type}\ndata: {json.dumps(data)}\n\n"
@@ -0,0 +1,136 @@
+import os
+import gzip
+import json
+import uuid
+import hashlib
+import threading
+from pathlib import Path
+
+# A data directory next to uploads/, audiobooks/ and tts_cache/; empty disables the cache
+EXTRACTION_CACHE_DIR = os.environ.get("EXTRACTION_CACHE_DIR", "extraction_cache")
+EXTRACTION_CACHE_LEVEL = 5  # gzip level; extracted text compresses about 3:1 at a fraction of level 9's cost
+HASH_READ_SIZE = 1024 * 1024
+
+_digests = {}  # (path, size, mtime_ns) -> sha256, so a file is hashed once per process
+_digests_lock = threading.Lock()
+
+
+def file_digest(path):
+    """SHA-256 of a file's content, remembered while the file is unchanged"""
+    path = Path(path)
+    stat = path.stat()
+    key = (str(path.resolve()), stat.st_size, stat.st_mtime_ns)
+    with _digests_lock:
+        digest = _digests.get(key)
+    if digest is None:
+        hasher = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(HASH_READ_SIZE), b""):
+                hasher.update(block)
+        digest = hasher.hexdigest()
+        with _digests_lock:
+            _digests[key] = digest
+    return digest
+
+
+class CachedExtraction:
+    """A book's extracted (text, toc_title) pieces and chapter list, read back from the sidecar.
+
+    The metadata is read up front; the pieces are decompressed lazily as they are iterated,
+    so a preview only inflates the first few and a conversion never holds the whole text.
+    """
+
+    def __init__(self, pieces_path, meta):
+        self.pieces_path = pieces_path
+        self.meta = meta
+
+    @property
+    def piece_count(self):
+        return self.meta["pieces"]
+
+    @property
+    def chapters(self):
+        return self.meta["chapters"]
+
+    def __iter__(self):
+        with gzip.open(self.pieces_path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                text, toc_title = json.loads(line)
+                yield text, toc_title
+
+
+class ExtractionWriter:
+    """Builds a sidecar as pieces stream past; it only becomes visible on commit()"""
+
+    def __init__(self, cache, key):
+        self.cache = cache
+        self.key = key
+        self.pieces = 0
+        self.characters = 0
+        # Created by the first write, so looking books up leaves no empty directory behind
+        cache.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._temp_path = cache.cache_dir / f".{key}-{uuid.uuid4().hex}.tmp"
+        self._file = gzip.open(self._temp_path, 'wt', encoding='utf-8', compresslevel=EXTRACTION_CACHE_LEVEL)
+
+    def add(self, text, toc_title):
+        self._file.write(json.dumps([text, toc_title], ensure_ascii=False) + "\n")
+        self.pieces += 1
+        self.characters += len(text)
+
+    def commit(self, chapters):
+        pieces_path, meta_path = self.cache.paths(self.key)
+        self._file.close()
+        os.replace(self._temp_path, pieces_path)
+        # The metadata is written last and marks the sidecar as complete
+        temp_meta = meta_path.with_suffix('.tmp')
+        with open(temp_meta, 'w', encoding='utf-8') as f:
+            json.dump({
+                "pieces": self.pieces,
+                "characters": self.characters,
+                "chapters": chapters,
+            }, f, ensure_ascii=False)
+        os.replace(temp_meta, meta_path)
+
+    def abort(self):
+        try:
+            self._file.close()
+        except OSError:
+            pass
+        self._temp_path.unlink(missing_ok=True)
+
+
+class ExtractionCache:
+    """Extracted text and chapters per source file, keyed by content hash and extractor version.
+
+    Each entry is a gzipped JSON-lines file of pieces plus a small JSON file with the piece
+    count and chapter list, so later previews and conversions of the same book (under any
+    name) skip PDF/EPUB parsing and chapter detection entirely.
+    """
+
+    def __init__(self, cache_dir, version):
+        self.cache_dir = Path(cache_dir)
+        self.version = version
+
+    def key_for(self, input_path):
+        return f"{file_digest(input_path)}-v{self.version}"
+
+    def paths(self, key):
+        return self.cache_dir / f"{key}.jsonl.gz", self.cache_dir / f"{key}.json"
+
+    def load(self, input_path):
+        """The CachedExtraction for a file, or None if it has not been extracted yet"""
+        pieces_path, meta_path = self.paths(self.key_for(input_path))
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable extraction cache {meta_path}: {e}")
+            return None
+        if not pieces_path.exists():
+            return None
+        return CachedExtraction(pieces_path, meta)
+
+    def writer(self, input_path):
+        return ExtractionWriter(self, self.key_for(input_path))
@@ -0,0 +1,134 @@
+import os
+import json
+import time
+from pathlib import Path
+
+JOB_MANIFEST_DIR = Path(os.environ.get("JOB_MANIFEST_DIR", "jobs"))
+
+
+class JobManifest:
+    """Small on-disk checkpoint of a conversion: voices, completed chunks and byte offsets written"""
+
+    def __init__(self, path, data):
+        self.path = Path(path)
+        self.data = data
+
+    @staticmethod
+    def path_for(output_path):
+        return JOB_MANIFEST_DIR / f"{Path(output_path).name}.json"
+
+    @classmethod
+    def create(cls, input_path, output_path, voices, source):
+        JOB_MANIFEST_DIR.mkdir(parents=True, exist_ok=True)
+        manifest = cls(cls.path_for(output_path), {
+            "input_path": str(input_path),
+            "output_path": str(output_path),
+            "voices": voices,
+            # Identifies the source file and text pipeline, so chunk k means the same text on resume
+            "source": source,
+            "total_chunks": None,  # known once extraction has finished
+            # chunk_byte_offsets[k] is where chunk k starts; its length - 1 is the number of completed chunks
+            "chunk_byte_offsets": [0],
+            "chunk_time_offsets": [0.0],
+            "spanned_boundaries": [],
+            # Segments left out of the audio after their retries, with where they belong
+            "missing_segments": [],
+            "status": "converting",
+            "updated_at": time.time(),
+        })
+        manifest.save()
+        return manifest
+
+    @classmethod
+    def load(cls, path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return cls(path, json.load(f))
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable job manifest {path}: {e}")
+            return None
+
+    @classmethod
+    def load_for(cls, output_path):
+        path = cls.path_for(output_path)
+        return cls.load(path) if path.exists() else None
+
+    @property
+    def completed_chunks(self):
+        """Chunks before the last boundary that a resume can restart from"""
+        spanned = set(self.data.get("spanned_boundaries", []))
+        k = len(self.data["chunk_byte_offsets"]) - 1
+        while k in spanned:
+            k -= 1
+        return k
+
+    @property
+    def resume_offset(self):
+        return self.data["chunk_byte_offsets"][self.completed_chunks]
+
+    @property
+    def missing_segments(self):
+        return self.data.setdefault("missing_segments", [])
+
+    def rewind(self):
+        """Drop checkpoints after the last clean boundary before resuming from it"""
+        k = self.completed_chunks
+        del self.data["chunk_byte_offsets"][k + 1:]
+        del self.data["chunk_time_offsets"][k + 1:]
+        self.data["spanned_boundaries"] = [b for b in self.data.get("spanned_boundaries", []) if b < k]
+        # Segments of the chunks about to be redone get another chance
+        self.data["missing_segments"] = [m for m in self.missing_segments if m["chunk"] < k]
+        self.data["status"] = "converting"
+        self.save()
+
+    def matches(self, input_path, voices, source):
+        """True if this manifest describes the same job, so its partial output can be reused"""
+        return (
+            self.data.get("input_path") == str(input_path)
+            and self.data.get("voices") == voices
+            and self.data.get("source") == source
+            and len(self.data.get("chunk_time_offsets", [])) == len(self.data["chunk_byte_offsets"])
+        )
+
+    def record_chunk(self, next_offset, next_time, spanned=False):
+        """Checkpoint a completed chunk; call only after the audio up to next_offset is fsynced.
+
+        spanned means a TTS request ran across the end of the chunk, so the next chunk's
+        audio has no clean start and a resume must restart from an earlier boundary.
+        """
+        self.data["chunk_byte_offsets"].append(next_offset)
+        self.data["chunk_time_offsets"].append(next_time)
+        if spanned:
+            self.data.setdefault("spanned_boundaries", []).append(len(self.data["chunk_byte_offsets"]) - 1)
+        self.save()
+
+    def record_missing(self, segment):
+        """Note a segment that has no audio; saved with the next checkpoint"""
+        self.missing_segments.append(segment)
+
+    def save(self):
+        self.data["updated_at"] = time.time()
+        temp_path = self.path.with_suffix('.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+
+    def delete(self):
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def find_unfinished_manifests():
+    """Manifests of conversions that were interrupted before completing"""
+    if not JOB_MANIFEST_DIR.exists():
+        return []
+    manifests = []
+    for path in sorted(JOB_MANIFEST_DIR.glob("*.json")):
+        manifest = JobManifest.load(path)
+        if manifest and manifest.data.get("status") == "converting":
+            manifests.append(manifest)
+    return manifests
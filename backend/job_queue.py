@@ -0,0 +1,189 @@
+import os
+import time
+import socket
+import threading
+from collections import deque
+
+from job_store import process_id
+
+CONVERSION_WORKERS = int(os.environ.get("CONVERSION_WORKERS", "2"))  # per server process
+# Idle workers look for jobs queued by other processes, and owners renew their leases, this often
+JOB_POLL_SECONDS = float(os.environ.get("JOB_POLL_SECONDS", "1.0"))
+# A running job whose owner stopped renewing its lease for this long is queued again
+JOB_LEASE_SECONDS = float(os.environ.get("JOB_LEASE_SECONDS", "30"))
+
+
+class ConversionJob:
+    """A queued or running conversion; params are the keyword arguments passed to the runner"""
+
+    def __init__(self, job_id, params, priority=0, enqueued_at=None):
+        self.job_id = job_id
+        self.params = params
+        self.priority = priority
+        self.enqueued_at = enqueued_at or time.time()
+        self.started_at = None
+        self.cancel_event = threading.Event()
+
+
+def _owner_gone(owner):
+    """True if owner was a process on this host that no longer exists"""
+    host, _, rest = owner.partition(":")
+    if host != socket.gethostname():
+        return False
+    try:
+        pid = int(rest.partition(":")[0])
+    except ValueError:
+        return False
+    if pid == os.getpid():
+        # Same pid, other nonce: an earlier run of this server (containers reuse pids)
+        return owner != process_id()
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+    return False
+
+
+class ConversionQueue:
+    """Priority job queue (FIFO within a priority) in the shared job store, drained by worker threads.
+
+    Every server process runs its own workers against the same store, so a job may be queued
+    by one process and converted by another. Each job is claimed by exactly one worker;
+    cancellation reaches the owner within a poll interval, and jobs of a process that died
+    (or stopped renewing its lease) are queued again and resume from their manifest.
+    """
+
+    def __init__(self, runner, store, workers=CONVERSION_WORKERS):
+        self.runner = runner
+        self.store = store
+        self.workers = max(1, workers)
+        self._running = {}  # job_id -> job being converted by this process
+        self._recent_waits = deque(maxlen=100)
+        self._cond = threading.Condition()
+        self._threads = []
+
+    def start(self):
+        """Recover jobs of processes that are gone and start the workers"""
+        self._recover_orphans()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"conversion-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._maintain, name="conversion-lease", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def submit(self, job_id, params, priority=0, enqueued_at=None):
+        """Queue a job; returns None if a job with this id is already queued or running"""
+        if not self.store.enqueue(job_id, params, priority, enqueued_at):
+            return None
+        with self._cond:
+            self._cond.notify()
+        return ConversionJob(job_id, params, priority, enqueued_at)
+
+    def prioritize(self, job_id, priority):
+        """Move a queued job up or down the queue; False if it is not waiting"""
+        return self.store.prioritize(job_id, priority)
+
+    def cancel(self, job_id):
+        """Drop a queued job or ask a running one to stop, wherever it runs; returns True if the job was known"""
+        known = self.store.cancel(job_id)
+        with self._cond:
+            job = self._running.get(job_id)
+        if job:
+            job.cancel_event.set()
+        return known
+
+    def active_job_ids(self):
+        return [job["job_id"] for job in self.store.jobs()]
+
+    def position(self, job_id):
+        """1-based position of a queued job in dispatch order, or None"""
+        queued = [job["job_id"] for job in self.store.jobs() if job["owner"] is None]
+        return queued.index(job_id) + 1 if job_id in queued else None
+
+    def job_info(self, job_id):
+        """Queue details for the status endpoint"""
+        job = next((job for job in self.store.jobs() if job["job_id"] == job_id), None)
+        if not job:
+            return None
+        if job["started_at"] is None:
+            wait = time.time() - job["enqueued_at"]
+        else:
+            wait = job["started_at"] - job["enqueued_at"]
+        return {
+            "state": "running" if job["started_at"] is not None else "queued",
+            "priority": job["priority"],
+            "wait_seconds": round(wait, 1),
+        }
+
+    def stats(self):
+        jobs = self.store.jobs()
+        now = time.time()
+        queued = [job for job in jobs if job["owner"] is None]
+        oldest_wait = max((now - job["enqueued_at"] for job in queued), default=0)
+        with self._cond:
+            avg_wait = sum(self._recent_waits) / len(self._recent_waits) if self._recent_waits else 0
+        return {
+            "queue_depth": len(queued),
+            "active_jobs": len(jobs) - len(queued),
+            "workers": self.workers,
+            "oldest_wait_seconds": round(oldest_wait, 1),
+            "avg_wait_seconds": round(avg_wait, 1),
+        }
+
+    def _next_job(self):
+        while True:
+            claimed = self.store.claim(process_id())
+            if claimed:
+                job = ConversionJob(claimed["job_id"], claimed["params"], claimed["priority"], claimed["enqueued_at"])
+                job.started_at = claimed["started_at"]
+                with self._cond:
+                    self._recent_waits.append(job.started_at - job.enqueued_at)
+                    self._running[job.job_id] = job
+                return job
+            # Woken at once by local submits; jobs queued elsewhere are found on the next poll
+            with self._cond:
+                self._cond.wait(JOB_POLL_SECONDS)
+
+    def _worker(self):
+        while True:
+            job = self._next_job()
+            try:
+                self.runner(job)
+            except Exception as e:
+                print(f"Conversion job {job.job_id} failed: {e}")
+                import traceback
+                traceback.print_exc()
+            finally:
+                with self._cond:
+                    self._running.pop(job.job_id, None)
+                self.store.finish(job.job_id, process_id())
+
+    def _maintain(self):
+        """Renew our leases, pass on cancellations from other processes and recover orphaned jobs"""
+        while True:
+            time.sleep(JOB_POLL_SECONDS)
+            try:
+                with self._cond:
+                    running = dict(self._running)
+                self.store.heartbeat(process_id(), list(running))
+                for job_id in self.store.cancelled(list(running)):
+                    running[job_id].cancel_event.set()
+                self._recover_orphans()
+            except Exception as e:
+                print(f"Job lease maintenance failed: {e}")
+
+    def _recover_orphans(self):
+        now = time.time()
+        for job in self.store.jobs():
+            owner = job["owner"]
+            if owner is None or owner == process_id():
+                continue
+            if now - job["heartbeat_at"] > JOB_LEASE_SECONDS or _owner_gone(owner):
+                if self.store.requeue(job["job_id"], owner):
+                    print(f"Re-queued {job['job_id']}: its worker process {owner} is gone")
+                    with self._cond:
+                        self._cond.notify()
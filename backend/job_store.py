@@ -0,0 +1,317 @@
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import threading
+from pathlib import Path
+
+JOB_STORE_URL = os.environ.get("JOB_STORE_URL", f"sqlite:///{os.environ.get('JOB_MANIFEST_DIR', 'jobs')}/state.db")
+EVENT_RETENTION_SECONDS = 300  # relayed events older than this are pruned
+EVENT_PRUNE_EVERY = 500  # events added between prunes
+
+_process = None  # (pid, id), recomputed in forked children
+
+
+def process_id():
+    """Identifies this server process among all that share a job store: host:pid:nonce"""
+    global _process
+    if _process is None or _process[0] != os.getpid():
+        _process = (os.getpid(), f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}")
+    return _process[1]
+
+
+class JobStore:
+    """Job queue, progress and event state shared by every server process.
+
+    A job is a JSON-serialisable params dict under a unique id. It waits in the queue until
+    one process claims it, is then owned by that process (which renews its lease with
+    heartbeats) and leaves the store when the owner finishes it. Cancelling a running job
+    only sets a flag; its owner sees it and stops the job. Progress is one JSON dict per job,
+    and events are an append-only log that other processes replay to their SSE clients.
+
+    Implementations must make claim() atomic across processes; everything else can be
+    last-writer-wins.
+    """
+
+    name = "base"
+
+    @classmethod
+    def from_url(cls, url):
+        raise NotImplementedError
+
+    def enqueue(self, job_id, params, priority=0, enqueued_at=None):
+        """Queue a job; False if a job with this id is already queued or running"""
+        raise NotImplementedError
+
+    def claim(self, owner):
+        """Take the next queued job (highest priority, then oldest) for owner, or None"""
+        raise NotImplementedError
+
+    def prioritize(self, job_id, priority):
+        """Change the priority of a queued job; False if it is not waiting in the queue"""
+        raise NotImplementedError
+
+    def heartbeat(self, owner, job_ids):
+        """Renew owner's lease on its running jobs"""
+        raise NotImplementedError
+
+    def finish(self, job_id, owner):
+        """Remove a job its owner is done with"""
+        raise NotImplementedError
+
+    def requeue(self, job_id, owner):
+        """Put a job back in the queue if owner (e.g. a dead process) still holds it; True if it did"""
+        raise NotImplementedError
+
+    def cancel(self, job_id):
+        """Drop a queued job or flag a running one for its owner to stop; False if unknown"""
+        raise NotImplementedError
+
+    def cancelled(self, job_ids):
+        """The running jobs among job_ids that were asked to stop"""
+        raise NotImplementedError
+
+    def jobs(self):
+        """Queued and running jobs as dicts (job_id, params, priority, enqueued_at, started_at,
+        owner, heartbeat_at), in dispatch order"""
+        raise NotImplementedError
+
+    def get_progress(self, job_id):
+        raise NotImplementedError
+
+    def set_progress(self, job_id, progress):
+        raise NotImplementedError
+
+    def delete_progress(self, job_id):
+        """Forget a job's progress; True if there was any"""
+        raise NotImplementedError
+
+    def all_progress(self):
+        """{job_id: progress} for every job with progress"""
+        raise NotImplementedError
+
+    def add_event(self, event_type, key, data, origin):
+        raise NotImplementedError
+
+    def events_since(self, seq, exclude_origin=None):
+        """(last_seq, [(event_type, key, data)]) of events after seq, except those from exclude_origin.
+
+        seq=None returns the current last_seq and no events, to start following the log.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class SQLiteJobStore(JobStore):
+    """JobStore in a SQLite database in WAL mode, shared by the processes of one host.
+
+    WAL lets status polls read while a worker writes; writes that read first take the
+    write lock up front (BEGIN IMMEDIATE), which is what makes claim() atomic. Each thread
+    gets its own connection.
+    """
+
+    name = "sqlite"
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            job_id TEXT PRIMARY KEY,
+            params TEXT NOT NULL,
+            priority INTEGER NOT NULL DEFAULT 0,
+            seq INTEGER NOT NULL,
+            enqueued_at REAL NOT NULL,
+            started_at REAL,
+            owner TEXT,
+            heartbeat_at REAL,
+            cancel_requested INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS jobs_dispatch ON jobs (owner, priority DESC, seq);
+        CREATE TABLE IF NOT EXISTS progress (
+            job_id TEXT PRIMARY KEY,
+            data TEXT NOT NULL,
+            updated_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS events (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            event_type TEXT NOT NULL,
+            key TEXT,
+            data TEXT,
+            origin TEXT NOT NULL,
+            created_at REAL NOT NULL
+        );
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._connection().executescript(self.SCHEMA)
+
+    @classmethod
+    def from_url(cls, url):
+        # sqlite:///relative/path or sqlite:////absolute/path, as in SQLAlchemy
+        return cls(url.partition("://")[2][1:])
+
+    def _connection(self):
+        db = getattr(self._local, "db", None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
+
+    def _transaction(self):
+        return _Transaction(self._connection())
+
+    def _query(self, sql, *args):
+        return self._connection().execute(sql, args).fetchall()
+
+    def enqueue(self, job_id, params, priority=0, enqueued_at=None):
+        with self._transaction() as db:
+            cursor = db.execute(
+                "INSERT OR IGNORE INTO jobs (job_id, params, priority, seq, enqueued_at) "
+                "VALUES (?, ?, ?, (SELECT COALESCE(MAX(seq), 0) + 1 FROM jobs), ?)",
+                (job_id, json.dumps(params), priority, enqueued_at or time.time()),
+            )
+            return cursor.rowcount == 1
+
+    def claim(self, owner):
+        with self._transaction() as db:
+            row = db.execute(
+                "SELECT * FROM jobs WHERE owner IS NULL ORDER BY priority DESC, seq LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            db.execute("UPDATE jobs SET owner = ?, started_at = ?, heartbeat_at = ? WHERE job_id = ?",
+                       (owner, now, now, row["job_id"]))
+        return {**_job_dict(row), "owner": owner, "started_at": now, "heartbeat_at": now}
+
+    def prioritize(self, job_id, priority):
+        with self._transaction() as db:
+            cursor = db.execute("UPDATE jobs SET priority = ? WHERE job_id = ? AND owner IS NULL", (priority, job_id))
+            return cursor.rowcount > 0
+
+    def heartbeat(self, owner, job_ids):
+        if job_ids:
+            with self._transaction() as db:
+                db.executemany("UPDATE jobs SET heartbeat_at = ? WHERE job_id = ? AND owner = ?",
+                               [(time.time(), job_id, owner) for job_id in job_ids])
+
+    def finish(self, job_id, owner):
+        with self._transaction() as db:
+            db.execute("DELETE FROM jobs WHERE job_id = ? AND owner = ?", (job_id, owner))
+
+    def requeue(self, job_id, owner):
+        with self._transaction() as db:
+            cursor = db.execute(
+                "UPDATE jobs SET owner = NULL, started_at = NULL, heartbeat_at = NULL "
+                "WHERE job_id = ? AND owner = ? AND cancel_requested = 0",
+                (job_id, owner),
+            )
+            if cursor.rowcount:
+                return True
+            # A job cancelled while its owner was gone has nobody left to stop it
+            db.execute("DELETE FROM jobs WHERE job_id = ? AND owner = ?", (job_id, owner))
+            return False
+
+    def cancel(self, job_id):
+        with self._transaction() as db:
+            if db.execute("DELETE FROM jobs WHERE job_id = ? AND owner IS NULL", (job_id,)).rowcount:
+                return True
+            return db.execute("UPDATE jobs SET cancel_requested = 1 WHERE job_id = ?", (job_id,)).rowcount > 0
+
+    def cancelled(self, job_ids):
+        if not job_ids:
+            return set()
+        placeholders = ", ".join("?" * len(job_ids))
+        rows = self._query(f"SELECT job_id FROM jobs WHERE cancel_requested = 1 AND job_id IN ({placeholders})",
+                           *job_ids)
+        return {row["job_id"] for row in rows}
+
+    def jobs(self):
+        rows = self._query("SELECT * FROM jobs ORDER BY owner IS NULL, priority DESC, seq")
+        return [_job_dict(row) for row in rows]
+
+    def get_progress(self, job_id):
+        rows = self._query("SELECT data FROM progress WHERE job_id = ?", job_id)
+        return json.loads(rows[0]["data"]) if rows else None
+
+    def set_progress(self, job_id, progress):
+        with self._transaction() as db:
+            db.execute("INSERT OR REPLACE INTO progress (job_id, data, updated_at) VALUES (?, ?, ?)",
+                       (job_id, json.dumps(progress), time.time()))
+
+    def delete_progress(self, job_id):
+        with self._transaction() as db:
+            return db.execute("DELETE FROM progress WHERE job_id = ?", (job_id,)).rowcount > 0
+
+    def all_progress(self):
+        return {row["job_id"]: json.loads(row["data"]) for row in self._query("SELECT job_id, data FROM progress")}
+
+    def add_event(self, event_type, key, data, origin):
+        with self._transaction() as db:
+            seq = db.execute(
+                "INSERT INTO events (event_type, key, data, origin, created_at) VALUES (?, ?, ?, ?, ?)",
+                (event_type, key, json.dumps(data), origin, time.time()),
+            ).lastrowid
+            if seq % EVENT_PRUNE_EVERY == 0:
+                db.execute("DELETE FROM events WHERE created_at < ?", (time.time() - EVENT_RETENTION_SECONDS,))
+
+    def events_since(self, seq, exclude_origin=None):
+        if seq is None:
+            rows = self._query("SELECT MAX(seq) AS seq FROM events")
+            return rows[0]["seq"] or 0, []
+        rows = self._query("SELECT * FROM events WHERE seq > ? ORDER BY seq", seq)
+        events = [(row["event_type"], row["key"], json.loads(row["data"]))
+                  for row in rows if row["origin"] != exclude_origin]
+        return (rows[-1]["seq"] if rows else seq), events
+
+    def close(self):
+        db = getattr(self._local, "db", None)
+        if db is not None:
+            db.close()
+            self._local.db = None
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT on an autocommit connection, rolled back on errors"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute("BEGIN IMMEDIATE")
+        return self.db
+
+    def __exit__(self, exc_type, exc, tb):
+        self.db.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+
+def _job_dict(row):
+    job = dict(row)
+    job["params"] = json.loads(job["params"])
+    job["cancel_requested"] = bool(job["cancel_requested"])
+    return job
+
+
+STORES = {
+    "sqlite": SQLiteJobStore,
+}
+
+
+def create_job_store(url=JOB_STORE_URL):
+    """Job store for a URL such as sqlite:///jobs/state.db (relative) or sqlite:////var/lib/app/state.db"""
+    scheme = url.partition("://")[0]
+    try:
+        store_class = STORES[scheme]
+    except KeyError:
+        raise ValueError(f"Unknown job store {scheme!r}; choose one of {', '.join(sorted(STORES))}") from None
+    return store_class.from_url(url)
@@ -0,0 +1,171 @@
+import os
+import json
+import time
+import hashlib
+from pathlib import Path
+
+from shared_index import SharedIndex
+
+LIBRARY_INDEX_PATH = Path(os.environ.get("LIBRARY_INDEX_PATH", "library.json"))
+COVER_EXTENSIONS = [".jpg", ".jpeg", ".png", ".webp"]
+SORT_FIELDS = {"title", "filename", "updated_at", "size", "duration", "chapter_count", "status"}
+
+
+class LibraryIndex(SharedIndex):
+    """Persistent index of audiobooks, updated by upload, convert and delete instead of rescanning the directory.
+
+    Several server processes may share one index file: each reloads it when another has
+    replaced it, and changes are made under a file lock so none are lost.
+    """
+
+    def __init__(self, audio_dir, index_path=LIBRARY_INDEX_PATH):
+        super().__init__(index_path)
+        self.audio_dir = Path(audio_dir)
+        self._books = {}
+
+        if not self._load():
+            self.rebuild()
+
+    def _read(self, data):
+        self._books = {book["filename"]: book for book in data["books"]}
+
+    def _dump(self):
+        return {"books": list(self._books.values())}
+
+    def rebuild(self):
+        """One-off directory scan, used when no index exists yet"""
+        with self._changing():
+            self._books = {}
+            for file in self.audio_dir.glob("*.mp3"):
+                self._books[file.name] = self._describe(file.name, "completed")
+            for plan_file in self.audio_dir.glob("*_ondemand.json"):
+                filename = plan_file.name[:-len("_ondemand.json")] + ".mp3"
+                self._books.setdefault(filename, self._describe(filename, "on_demand"))
+            self._save()
+        print(f"Library index rebuilt with {len(self._books)} books")
+
+    def _find_cover(self, stem):
+        for ext in COVER_EXTENSIONS:
+            image_path = self.audio_dir / (stem + ext)
+            if image_path.exists():
+                return f"/audiobooks/{image_path.name}"
+        return None
+
+    def _describe(self, filename, status):
+        """Build an entry from the files on disk"""
+        from mp3_frames import mp3_duration
+
+        audio_path = self.audio_dir / filename
+        stem = Path(filename).stem
+        book = {
+            "filename": filename,
+            "title": stem,
+            "status": status,
+            "size": 0,
+            "duration": None,
+            "chapter_count": 0,
+            "missing_segments": 0,
+            "cover": self._find_cover(stem),
+            "updated_at": time.time(),
+        }
+        if audio_path.exists():
+            book["size"] = audio_path.stat().st_size
+            try:
+                book["duration"] = round(mp3_duration(audio_path), 1)
+            except (OSError, ValueError) as e:
+                print(f"Could not read duration of {filename}: {e}")
+
+        chapters_path = self.audio_dir / f"{stem}_chapters.json"
+        if chapters_path.exists():
+            try:
+                with open(chapters_path, 'r', encoding='utf-8') as f:
+                    chapter_data = json.load(f)
+                book["chapter_count"] = len(chapter_data.get("chapters", []))
+                book["title"] = chapter_data.get("title") or stem
+            except (OSError, ValueError):
+                pass
+        else:
+            plan_path = self.audio_dir / f"{stem}_ondemand.json"
+            if plan_path.exists():
+                # An on-demand book has its chapters planned before any audio exists
+                try:
+                    with open(plan_path, 'r', encoding='utf-8') as f:
+                        plan = json.load(f)
+                    book["chapter_count"] = len(plan.get("chapters", []))
+                    book["title"] = plan.get("title") or stem
+                except (OSError, ValueError):
+                    pass
+
+        missing_path = self.audio_dir / f"{stem}_missing.json"
+        if missing_path.exists():
+            try:
+                with open(missing_path, 'r', encoding='utf-8') as f:
+                    book["missing_segments"] = len(json.load(f).get("segments", []))
+            except (OSError, ValueError):
+                pass
+        return book
+
+    def refresh(self, filename, status="completed"):
+        """Re-read a book's metadata from disk, e.g. after its conversion finished"""
+        with self._changing():
+            self._books[filename] = self._describe(filename, status)
+            self._save()
+
+    def set_status(self, filename, status):
+        with self._changing():
+            book = self._books.get(filename)
+            if book is None:
+                book = self._describe(filename, status)
+            book["status"] = status
+            book["updated_at"] = time.time()
+            self._books[filename] = book
+            self._save()
+
+    def set_cover(self, filename):
+        with self._changing():
+            book = self._books.get(filename)
+            if book is not None:
+                book["cover"] = self._find_cover(Path(filename).stem)
+                self._save()
+
+    def remove(self, filename):
+        with self._changing():
+            if self._books.pop(filename, None) is not None:
+                self._save()
+
+    def get(self, filename):
+        with self._lock:
+            self._sync()
+            book = self._books.get(filename)
+            return dict(book) if book else None
+
+    def books(self):
+        with self._lock:
+            self._sync()
+            return [dict(book) for book in self._books.values()]
+
+    def query(self, offset=0, limit=None, sort="title", order="asc"):
+        """Return (total, page) of books sorted by `sort`"""
+        if sort not in SORT_FIELDS:
+            sort = "title"
+        with self._lock:
+            self._sync()
+            books = list(self._books.values())
+
+        def sort_key(book):
+            value = book.get(sort)
+            if isinstance(value, str):
+                value = value.lower()
+            return (value is None, value if value is not None else 0)
+
+        books.sort(key=sort_key, reverse=(order == "desc"))
+        end = None if limit is None else offset + limit
+        return len(books), [dict(book) for book in books[offset:end]]
+
+    def etag(self, *query):
+        """Weak ETag for a query; changes whenever the index file does, and is the same in every server process"""
+        with self._lock:
+            self._sync()
+            stamp = self._stamp
+        digest = hashlib.sha1(repr((stamp, query)).encode('utf-8')).hexdigest()[:16]
+        return f'W/"{digest}"'
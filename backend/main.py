@@ -1,18 +1,42 @@
 import os
-import shutil
-from typing import List
-from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks, Form
+from collections import OrderedDict
+from typing import List, Optional
+from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, Response
 from pydantic import BaseModel
-import uvicorn
-from converter import convert_to_audiobook
+from converter import convert_to_audiobook, repair_missing_segments, read_missing_segments, missing_segments_path
+from converter import prepare_on_demand, convert_on_demand_chapter
+from job_queue import ConversionQueue
+from job_store import create_job_store, process_id
+from library_index import LibraryIndex
+from chapter_segments import read_segment_manifest, segment_header, segments_path, audio_version
+import on_demand
+from upload_store import UploadStore, UploadTooLarge, MAX_UPLOAD_BYTES, MAX_COVER_BYTES
+from events import hub, ProgressDict, format_sse, EVENT_COALESCE_SECONDS, EVENT_HEARTBEAT_SECONDS
+import metrics
 from pathlib import Path
 
 from fastapi.staticfiles import StaticFiles
+from contextlib import asynccontextmanager
 from pathlib import Path
 
-app = FastAPI()
+# Load the parsers and open the TTS backend in the background once the server is up
+WARM_UP_ON_START = os.environ.get("WARM_UP_ON_START", "1") == "1"
+
+@asynccontextmanager
+async def lifespan(app):
+    """Open the data directories and the job store on startup rather than at import, so a cold start serves sooner"""
+    open_state()
+    await bind_event_hub()
+    start_conversion_queue()
+    if WARM_UP_ON_START:
+        import threading
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    yield
+    close_tts_backend()
+
+app = FastAPI(lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
@@ -26,25 +50,262 @@ app.add_middleware(
 # Directories
 UPLOAD_DIR = Path("uploads")
 AUDIO_DIR = Path("audiobooks")
-UPLOAD_DIR.mkdir(exist_ok=True)
-AUDIO_DIR.mkdir(exist_ok=True)
 
-# Global progress tracking
-conversion_progress = {}
+# Persistent library index, kept current by upload, convert and delete
+library = None
+
+# Uploads by content hash, so a book uploaded twice is stored and converted once
+uploads = None
+
+# Queue, progress and events shared by every server process (uvicorn --workers, or several instances)
+job_store = None
+
+# Global progress tracking; every change is pushed to /events subscribers
+conversion_progress = None
+
+# Conversion jobs, drained by worker threads of every server process
+conversion_queue = None
+
+def open_state():
+    """Create the data directories and open the library, uploads, job store and queue"""
+    global library, uploads, job_store, conversion_progress, conversion_queue
+    UPLOAD_DIR.mkdir(exist_ok=True)
+    AUDIO_DIR.mkdir(exist_ok=True)
+    library = LibraryIndex(AUDIO_DIR)
+    uploads = UploadStore(UPLOAD_DIR)
+    job_store = create_job_store()
+    conversion_progress = ProgressDict(job_store)
+    conversion_queue = ConversionQueue(run_conversion_job, job_store)
 
 # Serve frontend static files
 FRONTEND_DIST = Path(__file__).parent.parent / "frontend" / "dist"
 if FRONTEND_DIST.exists():
     app.mount("/assets", StaticFiles(directory=FRONTEND_DIST / "assets"), name="assets")
 
-# Serve audiobooks directory for cover images
-app.mount("/audiobooks", StaticFiles(directory=AUDIO_DIR), name="audiobooks")
+# Serve audiobooks directory for cover images (created on startup)
+app.mount("/audiobooks", StaticFiles(directory=AUDIO_DIR, check_dir=False), name="audiobooks")
+
+def run_conversion_job(job):
+    """Queue runner: convert one job, honouring cancellation between segments"""
+    params = job.params
+    if "on_demand_chapter" in params:
+        run_chapter_job(job)
+        return
+    conversion_progress[job.job_id] = {
+        **conversion_progress.get(job.job_id, {}),
+        "status": "starting",
+        "message": "Initializing conversion..."
+    }
+    plan = None
+    if params.get("repair"):
+        repair_missing_segments(params["output_path"], conversion_progress, job.job_id, cancel_event=job.cancel_event)
+    elif params.get("on_demand"):
+        plan = prepare_on_demand(
+            params["input_path"],
+            params["output_path"],
+            params["narrator_voice_id"],
+            params["dialogue_voice_id"],
+            params["emphasis_voice_id"],
+            conversion_progress,
+            job.job_id,
+            cancel_event=job.cancel_event,
+        )
+    else:
+        convert_to_audiobook(
+            params["input_path"],
+            params["output_path"],
+            params["narrator_voice_id"],
+            params["dialogue_voice_id"],
+            params["emphasis_voice_id"],
+            conversion_progress,
+            job.job_id,
+            cancel_event=job.cancel_event,
+        )
+    
+    # Cancelled jobs were deleted by the user; don't leave them behind in the library
+    if job.cancel_event.is_set():
+        conversion_progress.pop(job.job_id, None)
+    elif plan is not None:
+        # Nothing is synthesized until the book is played, except its opening chapters
+        library.refresh(job.job_id, "on_demand")
+        conversion_progress[job.job_id] = on_demand.on_demand_progress(params["output_path"], plan)
+        schedule_on_demand(job.job_id, 0)
+    elif Path(params["output_path"]).exists():
+        library.refresh(job.job_id)
+        if not params.get("repair"):
+            uploads.record_conversion(Path(params["input_path"]).name, job.job_id, conversion_voices(params))
+    else:
+        library.set_status(job.job_id, "failed")
+    hub.publish("library", job.job_id, {"filename": job.job_id, "action": "updated"})
+
+def run_chapter_job(job):
+    """Queue runner for one chapter of an on-demand book"""
+    output_path = Path(job.params["output_path"])
+    ready = convert_on_demand_chapter(output_path, job.params["on_demand_chapter"], cancel_event=job.cancel_event)
+    plan = on_demand.read_plan(output_path)
+    if ready and plan is not None:
+        # Keep the last reported playback position in the book's progress entry
+        previous = conversion_progress.get(output_path.name) or {}
+        playback = {key: previous[key] for key in ("chapter", "position") if key in previous}
+        conversion_progress[output_path.name] = on_demand.on_demand_progress(output_path, plan, **playback)
+
+def schedule_on_demand(filename, chapter):
+    """Queue the chapter being played and the look-ahead window after it, nearest first.
+    
+    Chapters still queued for an earlier position outside the new window are dropped, so
+    skipping around a book only spends TTS on what is listened to.
+    """
+    output_path = AUDIO_DIR / filename
+    plan = on_demand.read_plan(output_path)
+    if plan is None:
+        return []
+    wanted = {}
+    last = min(len(plan["chapters"]) - 1, chapter + on_demand.ON_DEMAND_LOOKAHEAD)
+    for index in range(max(0, chapter), last + 1):
+        if not on_demand.chapter_audio_path(output_path, index).exists():
+            wanted[on_demand.chapter_job_id(filename, index)] = (index, on_demand.ON_DEMAND_PRIORITY - (index - chapter))
+    
+    for job in job_store.jobs():
+        if (job["owner"] is None and job["job_id"] not in wanted
+                and job["params"].get("on_demand_chapter") is not None
+                and job["params"]["output_path"] == str(output_path)):
+            conversion_queue.cancel(job["job_id"])
+    for job_id, (index, priority) in wanted.items():
+        params = {"on_demand_chapter": index, "output_path": str(output_path)}
+        if conversion_queue.submit(job_id, params, priority=priority) is None:
+            conversion_queue.prioritize(job_id, priority)
+    return sorted(index for index, _ in wanted.values())
+
+def conversion_voices(params):
+    return {
+        "narrator": params["narrator_voice_id"],
+        "dialogue": params["dialogue_voice_id"],
+        "emphasis": params["emphasis_voice_id"],
+    }
+
+metrics.gauge("conversion_queue_depth", "Conversions waiting for a worker",
+              callback=lambda: conversion_queue.stats()["queue_depth"])
+metrics.gauge("conversion_active_jobs", "Conversions being processed",
+              callback=lambda: conversion_queue.stats()["active_jobs"])
+metrics.gauge("conversion_oldest_wait_seconds", "How long the oldest queued conversion has waited",
+              callback=lambda: conversion_queue.stats()["oldest_wait_seconds"])
+metrics.gauge("library_books", "Books in the library index", callback=lambda: len(library.books()))
+metrics.gauge("event_subscribers", "Connected /events clients", callback=hub.subscriber_count)
+
+def tts_concurrency_limit():
+    from tts_engine import get_engine
+    return get_engine().concurrency_limit
+
+metrics.gauge("tts_concurrency_limit", "TTS requests allowed in flight after throttling adjustments",
+              callback=tts_concurrency_limit)
+
+def route_template(request):
+    """Route path like /audio/{filename}, so per-file URLs don't explode the metric labels"""
+    from starlette.routing import Match
+    
+    route = request.scope.get("route")
+    if route is None:
+        route = next((r for r in app.router.routes if r.matches(request.scope)[0] == Match.FULL), None)
+    return getattr(route, "path", None) or "unmatched"
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    import time
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        metrics.HTTP_REQUEST_SECONDS.labels(request.method, route_template(request), status).observe(time.perf_counter() - start)
+
+@app.get("/metrics")
+def get_metrics():
+    return Response(metrics.registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+def queued_progress(message="Waiting for a free conversion slot..."):
+    return {
+        "status": "queued",
+        "progress": 0,
+        "total_chunks": 0,
+        "current_chunk": 0,
+        "message": message
+    }
+
+async def bind_event_hub():
+    import asyncio
+    hub.bind(asyncio.get_running_loop())
+    hub.attach(job_store, process_id())
+
+def start_conversion_queue():
+    """Restore queued jobs and continue conversions interrupted by a reload or redeploy"""
+    from job_manifest import find_unfinished_manifests
+    
+    conversion_queue.start()
+    
+    # Manifests whose job was not in the persisted queue (e.g. written before it existed)
+    for manifest in find_unfinished_manifests():
+        input_path = Path(manifest.data["input_path"])
+        output_path = Path(manifest.data["output_path"])
+        if not input_path.exists():
+            print(f"Dropping manifest for missing upload: {input_path}")
+            manifest.delete()
+            continue
+        
+        voices = manifest.data["voices"]
+        conversion_queue.submit(output_path.name, {
+            "input_path": str(input_path),
+            "output_path": str(output_path),
+            "narrator_voice_id": voices["narrator"],
+            "dialogue_voice_id": voices["dialogue"],
+            "emphasis_voice_id": voices["emphasis"],
+        })
+    
+    # Chapter jobs of on-demand books are not library entries of their own
+    active_jobs = [job_id for job_id in conversion_queue.active_job_ids() if not on_demand.is_chapter_job(job_id)]
+    for job_id in active_jobs:
+        conversion_progress.setdefault(job_id, queued_progress("Resuming conversion..."))
+        library.set_status(job_id, "converting")
+    
+    # Books left "converting" by a crash that have no job to finish them
+    for book in library.books():
+        if book["status"] == "converting" and book["filename"] not in active_jobs:
+            if (AUDIO_DIR / book["filename"]).exists():
+                library.refresh(book["filename"])
+            else:
+                library.set_status(book["filename"], "failed")
+
+def close_tts_backend():
+    from tts_engine import close_engine
+    close_engine()
+
+def warm_up():
+    """Import the format parsers and open the TTS backend before the first conversion or preview needs them"""
+    import time
+    import importlib
+    start = time.perf_counter()
+    try:
+        for module in ("PyPDF2", "epub_reader"):
+            importlib.import_module(module)
+        from tts_engine import get_engine
+        get_engine().warm_up()
+    except Exception as e:
+        print(f"Warm-up failed: {e}")
+        return
+    print(f"Warmed up in {time.perf_counter() - start:.2f}s")
 
 class ConversionRequest(BaseModel):
     filename: str
     narrator_voice_id: str = "en-US-GuyNeural"  # Default narrator voice
     dialogue_voice_id: str = "en-US-JennyNeural"  # Default dialogue voice
     emphasis_voice_id: str = "en-US-DavisNeural"  # Default emphasis voice
+    priority: int = 0  # Higher runs first; equal priorities run in submission order
+    on_demand: bool = False  # Only extract and plan chapters now; convert each one when it is played
+
+class PlaybackReport(BaseModel):
+    chapter: int  # index into /segments/{filename}
+    position: float = 0  # seconds into that chapter
 
 @app.get("/")
 def read_root():
@@ -52,8 +313,26 @@ def read_root():
         return FileResponse(FRONTEND_DIST / "index.html")
     return {"message": "Audiobook Converter Backend is running"}
 
+# Multipart framing and form fields on top of the file and cover limits
+UPLOAD_FORM_OVERHEAD = 64 * 1024
+
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    """Refuse oversized uploads from their Content-Length, before the body is received"""
+    if request.method == "POST" and request.url.path == "/upload" and MAX_UPLOAD_BYTES:
+        try:
+            length = int(request.headers.get("content-length", 0))
+        except ValueError:
+            length = 0
+        if length > MAX_UPLOAD_BYTES + MAX_COVER_BYTES + UPLOAD_FORM_OVERHEAD:
+            return JSONResponse({"detail": str(UploadTooLarge(MAX_UPLOAD_BYTES))}, status_code=413)
+    return await call_next(request)
+
 @app.post("/upload")
 async def upload_file(file: UploadFile = File(...), cover_image: UploadFile = File(None), custom_filename: str = Form(None)):
+    from fastapi.concurrency import run_in_threadpool
+    from upload_store import copy_hashed
+    
     try:
         # Use custom filename if provided, otherwise use original
         if custom_filename:
@@ -67,9 +346,8 @@ async def upload_file(file: UploadFile = File(...), cover_image: UploadFile = Fi
         else:
             filename = file.filename
 
-        file_path = UPLOAD_DIR / filename
-        with file_path.open("wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        # Copy and hash in a worker thread; a book that is already stored is not stored again
+        filename, duplicate = await run_in_threadpool(uploads.store, file.file, filename)
             
         # Handle cover image if provided
         if cover_image:
@@ -77,15 +355,26 @@ async def upload_file(file: UploadFile = File(...), cover_image: UploadFile = Fi
             image_ext = Path(cover_image.filename).suffix
             image_filename = Path(filename).stem + image_ext
             image_path = AUDIO_DIR / image_filename
-            with image_path.open("wb") as buffer:
-                shutil.copyfileobj(cover_image.file, buffer)
-                
-        return {"filename": filename, "message": "File uploaded successfully"}
+            await run_in_threadpool(copy_hashed, cover_image.file, image_path, MAX_COVER_BYTES)
+            await run_in_threadpool(library.set_cover, Path(filename).stem + ".mp3")
+        
+        response = {"filename": filename, "message": "File uploaded successfully", "duplicate": duplicate}
+        if duplicate:
+            response["message"] = "This book was already uploaded"
+            converted = await run_in_threadpool(uploads.conversion, filename)
+            if converted is not None and await run_in_threadpool(library.get, converted[0]):
+                response["audiobook"] = converted[0]
+        # The shared store and the index files take locks other processes may hold, so stay off the loop
+        await run_in_threadpool(hub.publish, "library", filename, {"filename": filename, "action": "uploaded"})
+        return response
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/convert")
-async def start_conversion(request: ConversionRequest, background_tasks: BackgroundTasks):
+def start_conversion(request: ConversionRequest):
+    # A plain def runs in the threadpool: the job store and library index block on other processes' locks
     file_path = UPLOAD_DIR / request.filename
     if not file_path.exists():
         raise HTTPException(status_code=404, detail="File not found")
@@ -93,69 +382,162 @@ async def start_conversion(request: ConversionRequest, background_tasks: Backgro
     output_filename = f"{file_path.stem}.mp3"
     output_path = AUDIO_DIR / output_filename
     
-    # Initialize progress tracking
-    conversion_progress[output_filename] = {
-        "status": "starting",
-        "progress": 0,
-        "total_chunks": 0,
-        "current_chunk": 0,
-        "message": "Initializing conversion..."
+    # The same book with the same voices is already in the library
+    voices = {
+        "narrator": request.narrator_voice_id,
+        "dialogue": request.dialogue_voice_id,
+        "emphasis": request.emphasis_voice_id,
     }
+    book = library.get(output_filename)
+    if (uploads.conversion(request.filename) == (output_filename, voices)
+            and output_path.exists() and book and book["status"] == "completed"):
+        return {
+            "message": "Already converted",
+            "output_filename": output_filename,
+            "queue_position": None,
+            "existing": True
+        }
+    plan = on_demand.read_plan(output_path)
+    if (request.on_demand and plan and plan.get("version") == on_demand.PLAN_VERSION
+            and plan["voices"] == voices and plan["input_path"] == str(file_path)
+            and book and book["status"] == "on_demand"):
+        return {
+            "message": "Already prepared for on-demand conversion",
+            "output_filename": output_filename,
+            "queue_position": None,
+            "existing": True
+        }
     
-    # Run conversion in background with all three voices
-    background_tasks.add_task(
-        convert_to_audiobook, 
-        str(file_path), 
-        str(output_path), 
-        request.narrator_voice_id,
-        request.dialogue_voice_id,
-        request.emphasis_voice_id,
-        conversion_progress,
-        output_filename
-    )
+    # Initialize progress tracking before the job can be picked up
+    previous_progress = conversion_progress.get(output_filename)
+    conversion_progress[output_filename] = queued_progress()
+    
+    # Queue the conversion with all three voices
+    params = {
+        "input_path": str(file_path),
+        "output_path": str(output_path),
+        "narrator_voice_id": request.narrator_voice_id,
+        "dialogue_voice_id": request.dialogue_voice_id,
+        "emphasis_voice_id": request.emphasis_voice_id,
+    }
+    if request.on_demand:
+        params["on_demand"] = True
+    job = conversion_queue.submit(output_filename, params, priority=request.priority)
+    
+    if job is None:
+        if previous_progress is not None:
+            conversion_progress[output_filename] = previous_progress
+        raise HTTPException(status_code=409, detail="Conversion already in progress")
+    
+    library.set_status(output_filename, "converting")
+    
+    return {
+        "message": "On-demand preparation queued" if request.on_demand else "Conversion queued",
+        "output_filename": output_filename,
+        "queue_position": conversion_queue.position(output_filename)
+    }
+
+@app.post("/playback/{filename}")
+def report_playback(filename: str, report: PlaybackReport):
+    """Where the listener is in an on-demand book; its chapters are converted from there on"""
+    plan = on_demand.read_plan(AUDIO_DIR / filename)
+    if plan is None:
+        raise HTTPException(status_code=404, detail="Not an on-demand audiobook")
+    if not 0 <= report.chapter < len(plan["chapters"]):
+        raise HTTPException(status_code=404, detail="Chapter not found")
+    
+    queued = schedule_on_demand(filename, report.chapter)
+    conversion_progress[filename] = on_demand.on_demand_progress(
+        AUDIO_DIR / filename, plan, chapter=report.chapter, position=round(report.position, 1))
+    return {"filename": filename, "chapter": report.chapter, "queued_chapters": queued}
+
+@app.post("/repair/{filename}")
+def repair_audiobook(filename: str, priority: int = 0):
+    """Regenerate only the segments a finished audiobook is missing and splice them in"""
+    if not (AUDIO_DIR / filename).exists():
+        raise HTTPException(status_code=404, detail="Audiobook not found")
+    missing = read_missing_segments(AUDIO_DIR / filename)
+    if not missing:
+        return {"message": "No missing segments", "output_filename": filename, "missing_segments": 0}
+    
+    previous_progress = conversion_progress.get(filename)
+    conversion_progress[filename] = queued_progress()
+    job = conversion_queue.submit(filename, {
+        "repair": True,
+        "output_path": str(AUDIO_DIR / filename),
+    }, priority=priority)
+    if job is None:
+        if previous_progress is not None:
+            conversion_progress[filename] = previous_progress
+        raise HTTPException(status_code=409, detail="Conversion already in progress")
     
-    return {"message": "Conversion started", "output_filename": output_filename}
+    library.set_status(filename, "converting")
+    return {
+        "message": "Repair queued",
+        "output_filename": filename,
+        "missing_segments": len(missing),
+        "queue_position": conversion_queue.position(filename)
+    }
+
+# Recent previews keyed by (file, size, mtime[, voice]) so switching voices back and forth is instant
+PREVIEW_MEMO_SIZE = 64
+preview_text_memo = OrderedDict()
+preview_audio_memo = OrderedDict()
+
+def memo_get(memo, key):
+    value = memo.get(key)
+    if value is not None:
+        memo.move_to_end(key)
+    return value
+
+def memo_put(memo, key, value):
+    memo[key] = value
+    memo.move_to_end(key)
+    while len(memo) > PREVIEW_MEMO_SIZE:
+        memo.popitem(last=False)
 
 @app.post("/preview")
 async def generate_preview(request: ConversionRequest):
     """Generate a 30-second preview of the selected voices"""
-    from converter import extract_text_from_pdf, extract_text_from_epub_with_chapters, text_to_speech_chunk
-    import io
+    from converter import extract_preview_text
+    from tts_engine import get_engine
+    from fastapi.concurrency import run_in_threadpool
+    from fastapi.responses import Response
     
     file_path = UPLOAD_DIR / request.filename
     if not file_path.exists():
         raise HTTPException(status_code=404, detail="File not found")
+    if file_path.suffix.lower() not in ('.pdf', '.epub'):
+        raise HTTPException(status_code=400, detail="Unsupported file format")
+    
+    stat = file_path.stat()
+    file_key = (request.filename, stat.st_size, stat.st_mtime_ns)
+    audio_key = file_key + (request.narrator_voice_id,)
     
-    # Extract first portion of text (enough for ~30 seconds)
     try:
-        if file_path.suffix.lower() == '.pdf':
-            from converter import extract_text_from_pdf
-            full_text = extract_text_from_pdf(str(file_path))
-        elif file_path.suffix.lower() == '.epub':
-            from converter import extract_text_from_epub_with_chapters
-            full_text, _ = extract_text_from_epub_with_chapters(str(file_path))
-        else:
-            raise HTTPException(status_code=400, detail="Unsupported file format")
-        
-        # Take first ~300 characters for preview (about 20-30 seconds of audio)
-        preview_text = full_text[:300].strip()
-        
-        if not preview_text:
-            raise HTTPException(status_code=400, detail="No text found in file")
-        
-        # Generate simple preview with narrator voice only
-        print(f"Generating preview: {len(preview_text)} characters")
-        audio_bytes = text_to_speech_chunk(preview_text, request.narrator_voice_id)
-        
-        if not audio_bytes:
-            raise HTTPException(status_code=500, detail="Failed to generate preview audio")
+        audio_bytes = memo_get(preview_audio_memo, audio_key)
+        if audio_bytes is None:
+            # Only read as many pages as the preview needs, off the event loop
+            preview_text = memo_get(preview_text_memo, file_key)
+            if preview_text is None:
+                preview_text = await run_in_threadpool(extract_preview_text, str(file_path))
+                memo_put(preview_text_memo, file_key, preview_text)
+            
+            if not preview_text:
+                raise HTTPException(status_code=400, detail="No text found in file")
+            
+            # Generate simple preview with narrator voice only
+            print(f"Generating preview: {len(preview_text)} characters")
+            audio_bytes = await get_engine().synthesize_async(preview_text, request.narrator_voice_id)
+            
+            if not audio_bytes:
+                raise HTTPException(status_code=500, detail="Failed to generate preview audio")
+            memo_put(preview_audio_memo, audio_key, audio_bytes)
         
-        # Return audio as streaming response
-        from fastapi.responses import StreamingResponse
-        return StreamingResponse(
-            io.BytesIO(audio_bytes),
+        return Response(
+            audio_bytes,
             media_type="audio/mpeg",
-            headers={"Content-Disposition": f"inline; filename=preview.mp3"}
+            headers={"Content-Disposition": "inline; filename=preview.mp3"}
         )
         
     except HTTPException:
@@ -168,73 +550,271 @@ async def generate_preview(request: ConversionRequest):
 
 @app.get("/conversion-status/{filename}")
 def get_conversion_status(filename: str):
-    """Get the conversion progress for a specific file"""
-    if filename in conversion_progress:
-        return conversion_progress[filename]
-    return {"status": "not_found", "progress": 0}
+    """Get the conversion progress for a specific file, with queue depth and wait times"""
+    status = conversion_progress.get(filename)
+    if status is None:
+        return {"status": "not_found", "progress": 0, "queue": conversion_queue.stats()}
+    
+    job_info = conversion_queue.job_info(filename)
+    if job_info:
+        status["queue_position"] = conversion_queue.position(filename)
+        status["wait_seconds"] = job_info["wait_seconds"]
+        status["priority"] = job_info["priority"]
+    status["queue"] = conversion_queue.stats()
+    return status
+
+@app.get("/events")
+async def stream_events(request: Request):
+    """Server-Sent Events: conversion progress and library changes, coalesced per job"""
+    import asyncio
+    from fastapi.concurrency import run_in_threadpool
+    from fastapi.responses import StreamingResponse
+    
+    subscription = hub.subscribe()
+    
+    async def event_stream():
+        try:
+            # Snapshot first so a (re)connecting client needs no extra requests; read off the loop
+            snapshot = await run_in_threadpool(lambda: list(conversion_progress.items()))
+            for filename, progress in snapshot:
+                yield format_sse("progress", {"filename": filename, **progress})
+            while not await request.is_disconnected():
+                batch = await subscription.next_batch(EVENT_HEARTBEAT_SECONDS)
+                if not batch:
+                    yield ": keep-alive\n\n"
+                    continue
+                for event_type, key, data in batch:
+                    if event_type == "progress":
+                        yield format_sse("progress", {"filename": key, **data})
+                    elif event_type == "removed":
+                        yield format_sse("removed", {"filename": key})
+                    else:
+                        yield format_sse(event_type, data)
+                # Let further updates for the same job collapse into one
+                await asyncio.sleep(EVENT_COALESCE_SECONDS)
+        finally:
+            hub.unsubscribe(subscription)
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
 
 @app.get("/library")
-def get_library():
-    files = []
-    
-    # Get completed audiobooks
-    if AUDIO_DIR.exists():
-        for file in AUDIO_DIR.glob("*.mp3"):
-            # If file is currently converting, skip it here
-            if file.name in conversion_progress and conversion_progress[file.name]["status"] != "completed":
-                continue
-                
-            # Check for cover image
-            cover_path = None
-            # Look for common image extensions
-            for ext in [".jpg", ".jpeg", ".png", ".webp"]:
-                image_path = AUDIO_DIR / (file.stem + ext)
-                if image_path.exists():
-                    cover_path = f"/audiobooks/{image_path.name}"
-                    break
+def get_library(request: Request, offset: int = 0, limit: Optional[int] = None, sort: str = "title", order: str = "asc"):
+    """Paginated library listing served from the index; unchanged pages cost a 304"""
+    from fastapi.responses import JSONResponse, Response
+    
+    etag = library.etag(offset, limit, sort, order)
+    cache_headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=cache_headers)
+    
+    total, books = library.query(offset=max(0, offset), limit=limit, sort=sort, order=order)
+    for book in books:
+        book["path"] = f"/audio/{book['filename']}" if book["status"] == "completed" else ""
+    
+    return JSONResponse(books, headers={**cache_headers, "X-Total-Count": str(total)})
 
-            files.append({
-                "filename": file.name,
-                "path": f"/audio/{file.name}",
-                "status": "completed",
-                "cover": cover_path
-            })
+def parse_range_header(range_header, length):
+    """Parse a single 'bytes=' range into inclusive (first, last) offsets; None means the whole body"""
+    if not range_header or not range_header.startswith("bytes="):
+        return None
+    spec = range_header[len("bytes="):].split(",")[0].strip()
+    try:
+        first, _, last = spec.partition("-")
+        if first:
+            first = int(first)
+            last = min(int(last), length - 1) if last else length - 1
+        else:
+            # Suffix range: the final N bytes
+            first = max(0, length - int(last))
+            last = length - 1
+    except ValueError:
+        return None
+    if first > last or first >= length:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{length}"}
+        )
+    return first, last
+
+def byte_range_response(path, start, end, range_header, headers=None, media_type="audio/mpeg", prefix=b""):
+    """Serve bytes [start, end) of a file, after an optional prefix, as a standalone body, honouring Range requests"""
+    from fastapi.responses import StreamingResponse
+    
+    length = len(prefix) + end - start
+    headers = {"Accept-Ranges": "bytes", **(headers or {})}
+    byte_range = parse_range_header(range_header, length)
+    if byte_range is None:
+        first, last, status_code = 0, length - 1, 200
+    else:
+        first, last = byte_range
+        status_code = 206
+        headers["Content-Range"] = f"bytes {first}-{last}/{length}"
+    headers["Content-Length"] = str(last - first + 1)
+    
+    # Open now: an in-progress file may be renamed into place before the body is sent
+    file = open(path, 'rb')
     
-    # Add books currently being converted
-    for filename, progress in conversion_progress.items():
-        # Only add if not already in list
-        if not any(book["filename"] == filename for book in files):
-            # Check for cover image for converting books too
-            cover_path = None
-            stem = Path(filename).stem
-            for ext in [".jpg", ".jpeg", ".png", ".webp"]:
-                image_path = AUDIO_DIR / (stem + ext)
-                if image_path.exists():
-                    cover_path = f"/audiobooks/{image_path.name}"
+    def iter_body():
+        with file:
+            if first < len(prefix):
+                yield prefix[first:last + 1]
+            file.seek(start + max(0, first - len(prefix)))
+            remaining = last + 1 - max(first, len(prefix))
+            while remaining > 0:
+                block = file.read(min(64 * 1024, remaining))
+                if not block:
                     break
-                    
-            files.append({
-                "filename": filename, 
-                "path": "", 
-                "status": "converting",
-                "cover": cover_path
-            })
+                remaining -= len(block)
+                yield block
     
-    print(f"Library returning: {files}")
-    return files
+    return StreamingResponse(iter_body(), status_code=status_code, media_type=media_type, headers=headers)
+
+def in_progress_audio_range(output_path):
+    """Byte range and duration of the finished, ordered prefix of a book that is still converting"""
+    from audio_writer import get_active_writer
+    from job_manifest import JobManifest
+    
+    writer = get_active_writer(output_path)
+    if writer is not None:
+        return writer.header_size, writer.published_bytes, writer.duration
+    
+    # Conversion running elsewhere or paused: fall back to the last checkpoint
+    manifest = JobManifest.load_for(output_path)
+    part_path = output_path.with_name(output_path.name + '.part')
+    if manifest and manifest.completed_chunks and part_path.exists():
+        from mp3_frames import parse_frame_header
+        with open(part_path, 'rb') as f:
+            first_frame = parse_frame_header(f.read(4))
+        header_size = first_frame["length"] if first_frame else 0
+        return header_size, manifest.resume_offset, manifest.data["chunk_time_offsets"][manifest.completed_chunks]
+    return None
 
 @app.get("/audio/{filename}")
-def get_audio(filename: str):
+def get_audio(filename: str, request: Request):
     file_path = AUDIO_DIR / filename
-    if not file_path.exists():
-        raise HTTPException(status_code=404, detail="Audio file not found")
-    return FileResponse(file_path)
+    if file_path.exists():
+        return FileResponse(file_path)
+    
+    # Listen while converting: serve what has been generated so far, in order
+    available = in_progress_audio_range(file_path)
+    if available and available[1] > available[0]:
+        start, end, duration = available
+        try:
+            return byte_range_response(file_path.with_name(filename + '.part'), start, end, request.headers.get("range"), headers={
+                "Cache-Control": "no-store",
+                "X-Conversion-Status": "converting",
+                "X-Available-Duration": f"{duration:.1f}",
+            })
+        except FileNotFoundError:
+            # Finished while we were looking
+            if file_path.exists():
+                return FileResponse(file_path)
+    raise HTTPException(status_code=404, detail="Audio file not found")
+
+@app.get("/audio/{filename}/chapters/{chapters}")
+def get_chapter_audio(filename: str, chapters: str, request: Request, v: Optional[str] = None):
+    """One chapter ("3") or a run of chapters ("3-5") of a finished audiobook as a standalone MP3.
+    
+    Chapter numbers are indexes into /segments/{filename}. Requests carrying the manifest's
+    version (?v=) are immutable and cached for good; the segment URLs in the manifest do.
+    """
+    file_path = AUDIO_DIR / filename
+    manifest = read_segment_manifest(file_path) if file_path.exists() else None
+    if manifest is None:
+        plan = on_demand.read_plan(file_path)
+        if plan is not None:
+            return on_demand_chapter_audio(file_path, plan, chapters, request, v)
+        raise HTTPException(status_code=404, detail="No chapter segments for this audiobook")
+    
+    first, _, last = chapters.partition("-")
+    try:
+        first = int(first)
+        last = int(last) if last else first
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Chapters must be an index or a range such as 3-5")
+    segments = manifest["segments"]
+    if not 0 <= first <= last < len(segments):
+        raise HTTPException(status_code=404, detail="Chapter not found")
+    
+    etag = f'"{manifest["version"]}-{first}-{last}"'
+    cache_control = "public, max-age=31536000, immutable" if v == manifest["version"] else "no-cache"
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    
+    return byte_range_response(
+        file_path, segments[first]["byte_start"], segments[last]["byte_end"], request.headers.get("range"),
+        headers=headers, prefix=segment_header(file_path, manifest, first, last)
+    )
+
+def on_demand_chapter_audio(file_path, plan, chapters, request, v):
+    """One chapter of an on-demand book: its MP3 once converted, the generated part while converting here"""
+    from audio_writer import get_active_writer
+    
+    try:
+        index = int(chapters)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="On-demand audiobooks are served one chapter at a time")
+    if not 0 <= index < len(plan["chapters"]):
+        raise HTTPException(status_code=404, detail="Chapter not found")
+    
+    chapter_path = on_demand.chapter_audio_path(file_path, index)
+    if chapter_path.exists():
+        version = audio_version(chapter_path)
+        etag = f'"{version}"'
+        cache_control = "public, max-age=31536000, immutable" if v == version else "no-cache"
+        headers = {"ETag": etag, "Cache-Control": cache_control}
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers=headers)
+        return byte_range_response(chapter_path, 0, chapter_path.stat().st_size, request.headers.get("range"), headers=headers)
+    
+    # Listen while converting, as for whole books, if this process is converting the chapter
+    writer = get_active_writer(chapter_path)
+    if writer is not None and writer.published_bytes > writer.header_size:
+        try:
+            return byte_range_response(writer.temp_path, writer.header_size, writer.published_bytes, request.headers.get("range"), headers={
+                "Cache-Control": "no-store",
+                "X-Conversion-Status": "converting",
+                "X-Available-Duration": f"{writer.duration:.1f}",
+            })
+        except FileNotFoundError:
+            if chapter_path.exists():
+                return FileResponse(chapter_path)
+    raise HTTPException(status_code=503, detail="Chapter is not converted yet", headers={"Retry-After": "3"})
+
+@app.get("/segments/{filename}")
+def get_segments(filename: str):
+    """Chapter segments of a finished audiobook with their offsets and cacheable URLs.
+    
+    On-demand books list every planned chapter; those not converted yet have no URL and an
+    estimated duration.
+    """
+    manifest = read_segment_manifest(AUDIO_DIR / filename) if (AUDIO_DIR / filename).exists() else None
+    if manifest is None:
+        plan = on_demand.read_plan(AUDIO_DIR / filename)
+        if plan is not None:
+            return on_demand.segment_manifest(AUDIO_DIR / filename, plan)
+        raise HTTPException(status_code=404, detail="No chapter segments for this audiobook")
+    for index, segment in enumerate(manifest["segments"]):
+        segment["url"] = f"/audio/{filename}/chapters/{index}?v={manifest['version']}"
+    return manifest
 
 @app.get("/chapters/{filename}")
 def get_chapters(filename: str):
     chapters_path = AUDIO_DIR / f"{Path(filename).stem}_chapters.json"
     
     if not chapters_path.exists():
+        plan = on_demand.read_plan(AUDIO_DIR / filename)
+        if plan is not None:
+            # Chapters of an on-demand book start where the chapters before them end, estimated until converted
+            manifest = on_demand.segment_manifest(AUDIO_DIR / filename, plan)
+            return {"title": manifest["title"], "chapters": [
+                {"title": segment["title"], "timestamp": round(segment["start"], 1)} for segment in manifest["segments"]
+            ]}
         # Return empty chapters if no metadata found
         return {"title": filename, "chapters": []}
     
@@ -249,12 +829,31 @@ def get_chapters(filename: str):
 def delete_audiobook(filename: str):
     audio_path = AUDIO_DIR / filename
     chapters_path = AUDIO_DIR / f"{Path(filename).stem}_chapters.json"
+    timings_path = AUDIO_DIR / f"{Path(filename).stem}_timings.json"
     
     deleted = False
     
+    # Stop the job if it is queued or running; TTS work stops within one segment
+    if conversion_queue.cancel(filename):
+        deleted = True
+    for job in job_store.jobs():
+        if job["params"].get("on_demand_chapter") is not None and job["params"]["output_path"] == str(audio_path):
+            conversion_queue.cancel(job["job_id"])
+    
     # Check if currently converting and remove from progress
-    if filename in conversion_progress:
-        del conversion_progress[filename]
+    if conversion_progress.pop(filename, None) is not None:
+        deleted = True
+    
+    if library.get(filename):
+        library.remove(filename)
+        deleted = True
+    uploads.forget_conversion(filename)
+    
+    # Forget any checkpoint so the job is not resumed on the next startup
+    from job_manifest import JobManifest
+    manifest = JobManifest.load_for(audio_path)
+    if manifest:
+        manifest.delete()
         deleted = True
     
     # Delete audio file if exists
@@ -272,9 +871,17 @@ def delete_audiobook(filename: str):
         except Exception as e:
             print(f"Failed to delete chapters file: {str(e)}")
     
+    if timings_path.exists():
+        timings_path.unlink()
+    missing_segments_path(audio_path).unlink(missing_ok=True)
+    segments_path(audio_path).unlink(missing_ok=True)
+    if on_demand.delete_on_demand(audio_path):
+        deleted = True
+    
     if not deleted:
         raise HTTPException(status_code=404, detail="Audiobook not found")
     
+    hub.publish("library", filename, {"filename": filename, "action": "deleted"})
     return {"message": "Audiobook deleted successfully", "filename": filename}
 
 if __name__ == "__main__":
@@ -297,4 +904,5 @@ if __name__ == "__main__":
     print(f"Network: http://{local_ip}:8000")
     print(f"{'='*60}\n")
     
+    import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
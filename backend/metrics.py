@@ -0,0 +1,274 @@
+import os
+import time
+import threading
+from bisect import bisect_left
+
+JOB_TIMING_REPORT = os.environ.get("JOB_TIMING_REPORT", "0") == "1"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+STAGE_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 1800, 3600)
+PIPELINE_STAGES = ("extract", "detect", "chunk", "segment", "synthesize", "merge")
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """A metric family; labels(...) returns the child for one combination of label values"""
+
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        values = tuple(str(value) for value in values)
+        with self._lock:
+            child = self._children.get(values)
+            if child is None:
+                child = self._children[values] = self._new_child()
+            return child
+
+    def _default(self):
+        return self.labels() if not self.labelnames else None
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            children = sorted(self._children.items())
+        for values, child in children:
+            lines.extend(self._render_child(values, child))
+        return lines
+
+
+class _Value:
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def set(self, value):
+        self.value = value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+    def _render_child(self, values, child):
+        yield f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"
+
+
+class Gauge(_Metric):
+    """A gauge set directly, or read from a callback at scrape time"""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def _new_child(self):
+        return _Value()
+
+    def set(self, value):
+        self._default().set(value)
+
+    def render(self):
+        if self.callback is not None:
+            try:
+                self.set(self.callback())
+            except Exception as e:
+                print(f"Error reading metric {self.name}: {e}")
+        return super().render()
+
+    def _render_child(self, values, child):
+        yield f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"
+
+
+class _HistogramValue:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self.counts[bisect_left(self.buckets, value)] += 1
+            self.sum += value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self._default().observe(value)
+
+    def _render_child(self, values, child):
+        with child._lock:
+            counts = list(child.counts)
+            total = child.sum
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, values, [("le", _format_value(bound))])
+            yield f"{self.name}_bucket{labels} {cumulative}"
+        labels = _format_labels(self.labelnames, values)
+        yield f"{self.name}_sum{labels} {_format_value(total)}"
+        yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            # Re-registering a name returns the existing family, so module reloads are harmless
+            return self._metrics.setdefault(metric.name, metric)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def counter(name, documentation, labelnames=()):
+    return registry.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name, documentation, labelnames=(), callback=None):
+    return registry.register(Gauge(name, documentation, labelnames, callback))
+
+
+def histogram(name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+    return registry.register(Histogram(name, documentation, labelnames, buckets))
+
+
+STAGE_SECONDS = histogram(
+    "audiobook_stage_seconds", "Time each conversion spent in a pipeline stage", ["stage"], STAGE_BUCKETS)
+JOB_SECONDS = histogram(
+    "audiobook_job_seconds", "Wall time of conversions by outcome", ["outcome"], STAGE_BUCKETS)
+TTS_REQUEST_SECONDS = histogram(
+    "tts_request_seconds", "Latency of TTS backend requests", ["backend", "voice"])
+TTS_FAILED_REQUESTS = counter(
+    "tts_failed_requests_total", "TTS requests that raised an error", ["backend"])
+TTS_RETRIES = counter(
+    "tts_retries_total", "TTS requests retried after an error", ["backend"])
+TTS_HEDGED_REQUESTS = counter(
+    "tts_hedged_requests_total", "Duplicate TTS requests sent for segments in the slow tail", ["backend"])
+TTS_CACHE_HITS = counter(
+    "tts_cache_hits_total", "TTS requests served from the segment cache")
+TEXT_CHARACTERS = counter(
+    "audiobook_text_characters_total", "Characters extracted from uploaded books")
+TTS_CHARACTERS = counter(
+    "tts_characters_total", "Characters sent to the TTS backend", ["backend"])
+AUDIO_BYTES = counter(
+    "audiobook_audio_bytes_total", "MP3 bytes written to audiobooks")
+DROPPED_SEGMENTS = counter(
+    "audiobook_dropped_segments_total", "Segments left out of an audiobook", ["reason"])
+HTTP_REQUEST_SECONDS = histogram(
+    "http_request_duration_seconds", "HTTP request latency until the response starts", ["method", "route", "status"])
+
+
+class StageTimer:
+    """Busy time per pipeline stage for one conversion.
+
+    Stages of the streaming pipeline overlap in time, so each stage's own work is timed
+    where it happens and accumulated here; the report shows where the time goes.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.seconds = dict.fromkeys(PIPELINE_STAGES, 0.0)
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.seconds[stage] += seconds
+
+    def timed(self, stage):
+        return _StageSpan(self, stage)
+
+    def iterate(self, stage, iterable, exclude=()):
+        """Yield from iterable, charging the time spent producing each item to stage.
+
+        Time that upstream stages in `exclude` record meanwhile is not charged twice.
+        """
+        iterator = iter(iterable)
+        while True:
+            upstream = sum(self.seconds[name] for name in exclude)
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                item = StopIteration
+            elapsed = time.perf_counter() - start
+            self.add(stage, elapsed - (sum(self.seconds[name] for name in exclude) - upstream))
+            if item is StopIteration:
+                return
+            yield item
+
+    def finish(self, outcome):
+        """Record the stage times in the metrics; returns the per-job report"""
+        wall = time.perf_counter() - self.started
+        for stage, seconds in self.seconds.items():
+            STAGE_SECONDS.labels(stage).observe(seconds)
+        JOB_SECONDS.labels(outcome).observe(wall)
+        return {
+            "outcome": outcome,
+            "wall_seconds": round(wall, 3),
+            "stage_seconds": {stage: round(seconds, 3) for stage, seconds in self.seconds.items()},
+        }
+
+
+class _StageSpan:
+    def __init__(self, timer, stage):
+        self.timer = timer
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.timer.add(self.stage, time.perf_counter() - self.start)
+        return False
@@ -0,0 +1,174 @@
+import os
+import struct
+
+# Values of the MPEG version field
+MPEG1, MPEG2, MPEG25 = 3, 2, 0
+
+# kbps by bitrate index, Layer III only
+BITRATES = {
+    MPEG1: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 0],
+    MPEG2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160, 0],
+}
+BITRATES[MPEG25] = BITRATES[MPEG2]
+
+SAMPLE_RATES = {
+    MPEG1: [44100, 48000, 32000],
+    MPEG2: [22050, 24000, 16000],
+    MPEG25: [11025, 12000, 8000],
+}
+
+MONO = 3
+
+XING_FLAGS = 0x1 | 0x2 | 0x4  # frames, bytes, TOC
+XING_PAYLOAD_SIZE = 4 + 4 + 4 + 4 + 100  # tag, flags, frames, bytes, TOC
+
+
+def side_info_size(version, channel_mode):
+    if version == MPEG1:
+        return 17 if channel_mode == MONO else 32
+    return 9 if channel_mode == MONO else 17
+
+
+def samples_per_frame(version):
+    return 1152 if version == MPEG1 else 576
+
+
+def frame_length(version, bitrate_kbps, sample_rate, padding):
+    coefficient = 144 if version == MPEG1 else 72
+    return coefficient * bitrate_kbps * 1000 // sample_rate + padding
+
+
+def parse_frame_header(data, pos=0):
+    """Parse the 4-byte Layer III header at data[pos]; returns a dict or None if it isn't one"""
+    if pos + 4 > len(data):
+        return None
+    header, = struct.unpack_from('>I', data, pos)
+    if header >> 21 != 0x7FF:
+        return None
+    version = (header >> 19) & 0x3
+    layer = (header >> 17) & 0x3
+    bitrate_index = (header >> 12) & 0xF
+    sample_rate_index = (header >> 10) & 0x3
+    if version == 1 or layer != 1 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+
+    bitrate = BITRATES[version][bitrate_index]
+    sample_rate = SAMPLE_RATES[version][sample_rate_index]
+    padding = (header >> 9) & 0x1
+    channel_mode = (header >> 6) & 0x3
+    return {
+        "header": header,
+        "version": version,
+        "bitrate": bitrate,
+        "sample_rate": sample_rate,
+        "channel_mode": channel_mode,
+        "length": frame_length(version, bitrate, sample_rate, padding),
+        "samples": samples_per_frame(version),
+    }
+
+
+def is_xing_frame(data, pos, frame):
+    tag_pos = pos + 4 + side_info_size(frame["version"], frame["channel_mode"])
+    return data[tag_pos:tag_pos + 4] in (b'Xing', b'Info')
+
+
+def id3v2_size(data, pos=0):
+    """Length of an ID3v2 tag starting at data[pos], or 0"""
+    if data[pos:pos + 3] != b'ID3' or pos + 10 > len(data):
+        return 0
+    size_bytes = data[pos + 6:pos + 10]
+    size = 0
+    for b in size_bytes:
+        size = (size << 7) | (b & 0x7F)
+    footer = 10 if data[pos + 5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def iter_frames(data):
+    """Yield (offset, frame) for every complete audio frame, skipping tags, Xing/Info frames and garbage"""
+    pos = 0
+    end = len(data)
+    while pos + 4 <= end:
+        tag_size = id3v2_size(data, pos)
+        if tag_size:
+            pos += tag_size
+            continue
+        frame = parse_frame_header(data, pos)
+        if frame is None or pos + frame["length"] > end:
+            if frame is not None:
+                return  # truncated final frame
+            pos += 1  # resync
+            continue
+        if not is_xing_frame(data, pos, frame):
+            yield pos, frame
+        pos += frame["length"]
+
+
+def build_xing_frame(reference, frame_count, total_bytes, toc, cbr=True):
+    """Build a Xing ("Info" for CBR) header frame matching the format of `reference`"""
+    version = reference["version"]
+    sample_rate = reference["sample_rate"]
+    channel_mode = reference["channel_mode"]
+    side_size = side_info_size(version, channel_mode)
+
+    # Pick the smallest bitrate whose frame can hold the header payload
+    for bitrate_index, bitrate in enumerate(BITRATES[version]):
+        if bitrate and frame_length(version, bitrate, sample_rate, 0) >= 4 + side_size + XING_PAYLOAD_SIZE:
+            break
+    else:
+        raise ValueError("No bitrate large enough for a Xing header")
+
+    size = frame_length(version, bitrate, sample_rate, 0)
+    header = (reference["header"] & ~(0xF << 12) & ~(0x1 << 9)) | (bitrate_index << 12) | (1 << 16)
+    frame = bytearray(size)
+    struct.pack_into('>I', frame, 0, header)
+    struct.pack_into(
+        '>4sIII100s', frame, 4 + side_size,
+        b'Info' if cbr else b'Xing', XING_FLAGS, frame_count, total_bytes, bytes(toc)
+    )
+    return bytes(frame)
+
+
+def xing_frame_size(reference):
+    return len(build_xing_frame(reference, 0, 0, [0] * 100))
+
+
+def iter_file_frames(file, limit, block_size=1 << 20):
+    """Yield (offset, frame, is_xing) for frames in the first `limit` bytes of an open file, reading in blocks"""
+    base = 0  # file offset of buf[0]
+    buf = b''
+    pos = 0
+    while base + pos < limit:
+        if len(buf) - pos < 4096 and base + len(buf) < limit:
+            buf = buf[pos:]
+            base += pos
+            pos = 0
+            buf += file.read(min(block_size, limit - base - len(buf)))
+        frame = parse_frame_header(buf, pos)
+        if frame is None:
+            pos += 1
+            continue
+        if pos + frame["length"] > len(buf):
+            return
+        yield base + pos, frame, is_xing_frame(buf, pos, frame)
+        pos += frame["length"]
+
+
+def mp3_duration(path):
+    """Duration in seconds from the Xing/Info header, or estimated from the first frame's bitrate"""
+    with open(path, 'rb') as f:
+        head = f.read(64 * 1024)
+    size = os.path.getsize(path)
+    pos = id3v2_size(head)
+    frame = parse_frame_header(head, pos)
+    if frame is None:
+        return 0.0
+    if is_xing_frame(head, pos, frame):
+        tag_pos = pos + 4 + side_info_size(frame["version"], frame["channel_mode"])
+        flags, = struct.unpack_from('>I', head, tag_pos + 4)
+        if flags & 0x1:
+            frame_count, = struct.unpack_from('>I', head, tag_pos + 8)
+            return frame_count * frame["samples"] / frame["sample_rate"]
+        pos += frame["length"]
+        frame = parse_frame_header(head, pos) or frame
+    return (size - pos) * 8 / (frame["bitrate"] * 1000)
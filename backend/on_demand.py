@@ -0,0 +1,209 @@
+import os
+import re
+import json
+import shutil
+from pathlib import Path
+
+from chapter_segments import audio_version
+
+# Chapters converted ahead of the one being played, so playback runs on without waiting
+ON_DEMAND_LOOKAHEAD = int(os.environ.get("ON_DEMAND_LOOKAHEAD", "2"))
+# Queue priority of the chapter being played; look-ahead chapters get one less per step ahead
+ON_DEMAND_PRIORITY = int(os.environ.get("ON_DEMAND_PRIORITY", "100"))
+ON_DEMAND_PART_CHARS = 30000  # books without chapters are split into parts of about this size
+ESTIMATED_CHARS_PER_SECOND = 15.0  # speech rate for chapters not converted yet, until one is
+PLAN_VERSION = 2  # bump when planning changes, so books prepared before are planned again
+
+CHAPTER_JOB_PATTERN = re.compile(r"^(?P<filename>.+)#chapter-(?P<index>\d+)$")
+SPEAKABLE = re.compile(r"\w")  # a chapter without a single word character has nothing to say
+
+
+def plan_path(output_path):
+    return Path(output_path).parent / f"{Path(output_path).stem}_ondemand.json"
+
+
+def chapter_dir(output_path):
+    """Where the converted chapters of an on-demand book go, one MP3 each (and its text, without an extraction cache)"""
+    return Path(output_path).parent / f"{Path(output_path).stem}_ondemand"
+
+
+def chapter_audio_path(output_path, index):
+    return chapter_dir(output_path) / f"{index:04d}.mp3"
+
+
+def chapter_job_id(filename, index):
+    return f"{filename}#chapter-{index}"
+
+
+def is_chapter_job(job_id):
+    return CHAPTER_JOB_PATTERN.match(job_id) is not None
+
+
+def plan_chapters(chapters, piece_lengths):
+    """Split a book into the units converted on demand: dicts of title, char_start and char_end.
+
+    Each chapter runs to the next one; text before the first chapter belongs to it. A book
+    without chapters is cut into parts of about ON_DEMAND_PART_CHARS at piece (page or
+    document) boundaries, so no sentence is split between two parts.
+    """
+    total = sum(piece_lengths)
+    starts = sorted({chapter["char_position"]: chapter for chapter in chapters}.values(),
+                    key=lambda chapter: chapter["char_position"])
+    if starts:
+        bounds = [0] + [chapter["char_position"] for chapter in starts[1:]] + [total]
+        return [{"title": chapter["title"], "char_start": start, "char_end": end}
+                for chapter, start, end in zip(starts, bounds, bounds[1:])]
+
+    parts = []
+    start = position = 0
+    for length in piece_lengths:
+        position += length
+        if position - start >= ON_DEMAND_PART_CHARS:
+            parts.append((start, position))
+            start = position
+    if position > start:
+        parts.append((start, position))
+    return [{"title": f"Part {i + 1}", "char_start": start, "char_end": end}
+            for i, (start, end) in enumerate(parts)]
+
+
+def fold_silent_chapters(planned, piece_texts):
+    """Merge planned chapters with nothing to speak into the chapter after them.
+
+    An image-only cover or title page in the TOC would otherwise be a chapter that never
+    yields audio, and playback could not get past it. A silent last chapter joins the one
+    before it. piece_texts is the book's text, piece by piece; it is read once.
+    """
+    spoken = [False] * len(planned)
+    index = 0
+    base = 0
+    for text in piece_texts:
+        end = base + len(text)
+        while index < len(planned) and planned[index]["char_start"] < end:
+            chapter = planned[index]
+            if not spoken[index]:
+                spoken[index] = SPEAKABLE.search(text, max(0, chapter["char_start"] - base),
+                                                 max(0, chapter["char_end"] - base)) is not None
+            if chapter["char_end"] > end:
+                break  # continues in the next piece
+            index += 1
+        base = end
+
+    folded = []
+    silent_start = None
+    for chapter, has_text in zip(planned, spoken):
+        if not has_text:
+            if silent_start is None:
+                silent_start = chapter["char_start"]
+            continue
+        if silent_start is not None:
+            chapter = {**chapter, "char_start": silent_start}
+            silent_start = None
+        folded.append(chapter)
+    if silent_start is not None and folded:
+        folded[-1] = {**folded[-1], "char_end": planned[-1]["char_end"]}
+    return folded
+
+
+def write_plan(output_path, plan):
+    """Atomically write an on-demand book's plan; chapters converted with other voices are discarded"""
+    previous = read_plan(output_path)
+    if previous is not None and (previous["voices"] != plan["voices"] or previous["chapters"] != plan["chapters"]):
+        for path in chapter_dir(output_path).glob("*.mp3"):
+            path.unlink()
+    chapter_dir(output_path).mkdir(parents=True, exist_ok=True)
+
+    path = plan_path(output_path)
+    temp_path = path.with_suffix('.tmp')
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(plan, f, indent=2, ensure_ascii=False)
+    os.replace(temp_path, path)
+    return path
+
+
+def read_plan(output_path):
+    """The plan of an on-demand book, or None if it was not prepared for on-demand conversion"""
+    try:
+        with open(plan_path(output_path), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def delete_on_demand(output_path):
+    """Remove an on-demand book's plan and converted chapters; True if there were any"""
+    path = plan_path(output_path)
+    existed = path.exists() or chapter_dir(output_path).exists()
+    path.unlink(missing_ok=True)
+    shutil.rmtree(chapter_dir(output_path), ignore_errors=True)
+    return existed
+
+
+def ready_chapters(output_path, plan):
+    """{index: audio path} of the chapters converted so far"""
+    ready = {}
+    for index in range(len(plan["chapters"])):
+        path = chapter_audio_path(output_path, index)
+        if path.exists():
+            ready[index] = path
+    return ready
+
+
+def segment_manifest(output_path, plan):
+    """A segment manifest (as /segments serves for finished books) over an on-demand book's chapters.
+
+    Converted chapters have their exact duration and a versioned URL; the others have none
+    and a duration estimated from their length, at the speech rate measured so far.
+    """
+    from mp3_frames import mp3_duration
+
+    filename = Path(output_path).name
+    ready = ready_chapters(output_path, plan)
+    durations = {}
+    for index, path in ready.items():
+        try:
+            durations[index] = mp3_duration(path)
+        except (OSError, ValueError):
+            pass
+    measured_chars = sum(plan["chapters"][index]["char_end"] - plan["chapters"][index]["char_start"] for index in durations)
+    measured_seconds = sum(durations.values())
+    rate = measured_chars / measured_seconds if measured_seconds > 0 else ESTIMATED_CHARS_PER_SECOND
+
+    segments = []
+    start = 0.0
+    for index, chapter in enumerate(plan["chapters"]):
+        duration = durations.get(index)
+        segment = {
+            "title": chapter["title"],
+            "start": round(start, 3),
+            "duration": round(duration if duration is not None else (chapter["char_end"] - chapter["char_start"]) / rate, 3),
+            "ready": duration is not None,
+            "url": None,
+        }
+        if duration is not None:
+            segment["url"] = f"/audio/{filename}/chapters/{index}?v={audio_version(ready[index])}"
+        segments.append(segment)
+        start += segment["duration"]
+
+    return {
+        "title": plan["title"],
+        "on_demand": True,
+        "duration": round(start, 3),
+        "cbr": True,
+        "ready_chapters": len(durations),
+        "segments": segments,
+    }
+
+
+def on_demand_progress(output_path, plan, **playback):
+    """The progress entry of an on-demand book: how many of its chapters are ready to play"""
+    ready = len(ready_chapters(output_path, plan))
+    total = len(plan["chapters"])
+    return {
+        "status": "on_demand",
+        "progress": int(ready / total * 100) if total else 100,
+        "current_chunk": ready,
+        "total_chunks": total,
+        "message": f"Converts as you listen: {ready} of {total} chapters ready",
+        **playback,
+    }
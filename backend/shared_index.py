@@ -0,0 +1,79 @@
+import os
+import json
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # no flock on Windows, where only a single server process is supported
+    fcntl = None
+
+
+class SharedIndex:
+    """A JSON index file held in memory by every server process that shares it.
+
+    Each process reloads the file when another has replaced it, and changes are made under
+    a file lock so none are lost. Subclasses keep their state in their own attributes and
+    convert it from and to the file's JSON in _read() and _dump().
+    """
+
+    def __init__(self, index_path):
+        self.index_path = Path(index_path)
+        self._stamp = None  # identity of the index file we last read or wrote
+        self._lock = threading.Lock()
+
+    def _read(self, data):
+        """Take over the state in the parsed file; raise KeyError if it isn't one of ours"""
+        raise NotImplementedError
+
+    def _dump(self):
+        """The state to write, as JSON-serialisable data"""
+        raise NotImplementedError
+
+    def _file_stamp(self):
+        try:
+            stat = self.index_path.stat()
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _load(self):
+        """Read the index file; False, with the state unchanged, if it is missing or unreadable"""
+        try:
+            stamp = self._file_stamp()
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                self._read(json.load(f))
+            self._stamp = stamp
+            return True
+        except (OSError, ValueError, KeyError):
+            return False
+
+    def _sync(self):
+        """Pick up changes saved by other server processes; call with the lock held"""
+        if self._file_stamp() != self._stamp:
+            self._load()
+
+    @contextmanager
+    def _changing(self):
+        """Lock, bring the index up to date and hold other processes off until the change is saved"""
+        with self._lock:
+            if fcntl is None:
+                self._sync()
+                yield
+                return
+            with open(self.index_path.with_suffix('.lock'), 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    self._sync()
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _save(self):
+        """Replace the index file; call inside _changing()"""
+        temp_path = self.index_path.with_suffix('.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._dump(), f, ensure_ascii=False)
+        os.replace(temp_path, self.index_path)
+        self._stamp = self._file_stamp()
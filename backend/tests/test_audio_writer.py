@@ -0,0 +1,98 @@
+import struct
+
+from audio_writer import StreamingAudioWriter
+from mp3_frames import build_xing_frame, iter_file_frames, mp3_duration, parse_frame_header, side_info_size
+from tts_backends import SILENT_MP3_FRAME
+
+REFERENCE = parse_frame_header(SILENT_MP3_FRAME)
+FRAME_SECONDS = REFERENCE["samples"] / REFERENCE["sample_rate"]
+
+
+def frames(count, bitrate_index=None):
+    """`count` silent frames, at another bitrate than SILENT_MP3_FRAME's if bitrate_index is given"""
+    if bitrate_index is None:
+        return SILENT_MP3_FRAME * count
+    header = REFERENCE["header"] & ~(0xF << 12) | bitrate_index << 12
+    length = parse_frame_header(struct.pack('>I', header))["length"]
+    return (struct.pack('>I', header) + b'\x00' * (length - 4)) * count
+
+
+def read_xing(path):
+    """(tag, frame count, byte count, TOC) of the header frame of an MP3 file"""
+    data = path.read_bytes()
+    tag_pos = 4 + side_info_size(REFERENCE["version"], REFERENCE["channel_mode"])
+    tag, flags, frame_count, byte_count, toc = struct.unpack_from('>4sIII100s', data, tag_pos)
+    assert flags == 0x7
+    return tag, frame_count, byte_count, list(toc)
+
+
+def test_commit_fills_in_the_info_header(tmp_path):
+    path = tmp_path / "book.mp3"
+    writer = StreamingAudioWriter(path)
+    for _ in range(10):
+        writer.write(frames(1000))
+    writer.commit()
+
+    tag, frame_count, byte_count, toc = read_xing(path)
+    assert (tag, frame_count, byte_count) == (b'Info', 10000, path.stat().st_size)
+    # Constant bitrate, so the seek table is linear after the header frame, to within
+    # the second of audio between seek index entries
+    header_share = writer.header_size * 256 / byte_count
+    for percent, entry in enumerate(toc):
+        assert abs(entry - (header_share + percent * (256 - header_share) / 100)) <= 2
+    assert mp3_duration(path) == 10000 * FRAME_SECONDS
+
+
+def test_mixed_bitrates_get_a_xing_header(tmp_path):
+    path = tmp_path / "book.mp3"
+    writer = StreamingAudioWriter(path)
+    writer.write(frames(4000))
+    writer.write(frames(4000, bitrate_index=8))
+    writer.commit()
+
+    tag, frame_count, byte_count, toc = read_xing(path)
+    assert (tag, frame_count, byte_count) == (b'Xing', 8000, path.stat().st_size)
+    assert toc == sorted(toc)
+    # The second half of the audio takes more bytes per second
+    assert toc[75] - toc[50] > toc[50] - toc[25] + 4
+
+
+def test_tags_and_headers_inside_segments_are_dropped(tmp_path):
+    id3_tag = b'ID3\x04\x00\x00\x00\x00\x00\x0a' + b'\x00' * 10
+    segment_header = build_xing_frame(REFERENCE, 20, 20 * len(SILENT_MP3_FRAME), [0] * 100)
+    path = tmp_path / "book.mp3"
+    writer = StreamingAudioWriter(path)
+    for _ in range(3):
+        writer.write(id3_tag + segment_header + frames(20) + SILENT_MP3_FRAME[:50])
+    writer.commit()
+
+    with open(path, 'rb') as f:
+        found = list(iter_file_frames(f, path.stat().st_size))
+    assert [is_xing for _, _, is_xing in found] == [True] + [False] * 60
+    assert path.read_bytes()[writer.header_size:] == frames(60)
+    assert read_xing(path)[1:3] == (60, path.stat().st_size)
+
+
+def test_resumed_file_gets_its_frame_index_back(tmp_path):
+    segments = [frames(100 + i) for i in range(6)]
+    uninterrupted = StreamingAudioWriter(tmp_path / "whole.mp3")
+    for segment in segments:
+        uninterrupted.write(segment)
+    uninterrupted.commit()
+
+    # Stop after the checkpoint at segment 3, with one more segment written past it
+    path = tmp_path / "book.mp3"
+    writer = StreamingAudioWriter(path)
+    for segment in segments[:3]:
+        writer.write(segment)
+    checkpoint = writer.bytes_written, writer.duration, writer.frame_count
+    writer.write(segments[3])
+    writer.close()
+
+    resumed = StreamingAudioWriter(path, resume_offset=checkpoint[0])
+    assert (resumed.bytes_written, resumed.duration, resumed.frame_count) == checkpoint
+    assert resumed.frame_boundary(4.5) == uninterrupted.frame_boundary(4.5)
+    for segment in segments[3:]:
+        resumed.write(segment)
+    resumed.commit()
+    assert path.read_bytes() == (tmp_path / "whole.mp3").read_bytes()
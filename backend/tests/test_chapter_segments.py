@@ -0,0 +1,41 @@
+from audio_writer import StreamingAudioWriter
+from chapter_segments import read_segment_manifest, write_segment_manifest
+from mp3_frames import parse_frame_header
+from tts_backends import SILENT_MP3_FRAME
+
+FRAME_SECONDS = (lambda frame: frame["samples"] / frame["sample_rate"])(parse_frame_header(SILENT_MP3_FRAME))
+
+
+def write_book(tmp_path, seconds, chapters):
+    output_path = tmp_path / "book.mp3"
+    writer = StreamingAudioWriter(output_path)
+    for _ in range(round(seconds / FRAME_SECONDS)):
+        writer.write(SILENT_MP3_FRAME)
+    writer.commit()
+    write_segment_manifest(output_path, writer, "book", chapters)
+    return read_segment_manifest(output_path)["segments"]
+
+
+def test_chapters_are_cut_at_the_frame_playing_at_their_marker(tmp_path):
+    # Both markers fall between seek index entries, which are a second apart
+    segments = write_book(tmp_path, 3.0, [
+        {"title": "One", "timestamp": 0.0},
+        {"title": "Two", "timestamp": 0.3},
+        {"title": "Three", "timestamp": 0.7},
+    ])
+    assert [segment["title"] for segment in segments] == ["One", "Two", "Three"]
+    for segment, marker in zip(segments[1:], [0.3, 0.7]):
+        assert marker - FRAME_SECONDS < segment["start"] <= marker
+    for segment, following in zip(segments, segments[1:]):
+        assert segment["byte_start"] < segment["byte_end"] == following["byte_start"]
+    assert all(segment["duration"] > 0 for segment in segments)
+
+
+def test_markers_on_the_same_frame_leave_no_empty_segment(tmp_path):
+    segments = write_book(tmp_path, 2.0, [
+        {"title": "Part One", "timestamp": 0.0},
+        {"title": "Chapter 1", "timestamp": 0.0},
+        {"title": "Chapter 2", "timestamp": 1.5},
+    ])
+    assert [segment["title"] for segment in segments] == ["Chapter 1", "Chapter 2"]
+    assert all(segment["byte_end"] > segment["byte_start"] for segment in segments)
@@ -0,0 +1,64 @@
+import random
+
+from converter import ChapterDetector, detect_chapters_from_text
+
+WORDS = "the river was cold and night came down over the quiet house by the water".split()
+
+
+def paragraph(words, seed):
+    rng = random.Random(seed)
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + ".\n"
+
+
+def short_chapters(count=10, words=40):
+    return "".join(f"\nChapter {n}: The Crossing\n\n{paragraph(words, n)}" for n in range(1, count + 1))
+
+
+def titles(chapters):
+    return [chapter['title'] for chapter in chapters]
+
+
+def test_short_chapters_are_not_taken_for_a_table_of_contents():
+    text = short_chapters()
+    assert len(text) / 10 < 500  # every heading is closer than CHAPTER_MIN_GAP to the next
+    assert titles(detect_chapters_from_text(text)) == [f"Chapter {n}: The Crossing" for n in range(1, 11)]
+
+
+def test_table_of_contents_is_dropped_before_short_chapters():
+    toc = "Contents\n" + "".join(f"Chapter {n}: The Crossing\n" for n in range(1, 11))
+    chapters = detect_chapters_from_text(toc + short_chapters())
+    assert len(chapters) == 10
+    assert all(chapter['char_position'] >= len(toc) for chapter in chapters)
+
+
+def test_running_page_header_is_not_a_new_chapter():
+    text = ""
+    for n in range(1, 6):
+        text += f"\nChapter {n}: The River\n\n"
+        for page in range(4):
+            text += paragraph(400, n * 10 + page) + f"\nChapter {n}: The River\n"
+    assert titles(detect_chapters_from_text(text)) == [f"Chapter {n}: The River" for n in range(1, 6)]
+
+
+def test_chapter_numbers_start_again_in_each_part():
+    text = "".join(f"\nPart {part}\n" + "".join(f"\nChapter {n}\n{paragraph(200, n)}" for n in (1, 2))
+                   for part in (1, 2))
+    assert titles(detect_chapters_from_text(text)) == ["Part 1", "Chapter 1", "Chapter 2",
+                                                       "Part 2", "Chapter 1", "Chapter 2"]
+
+
+def test_numbered_list_is_not_chapters():
+    items = "".join(f"{n}. Item number {n} here\n{paragraph(30, n)}" for n in range(1, 6))
+    assert detect_chapters_from_text(paragraph(100, 0) + items) == []
+
+
+def test_pieces_give_the_same_chapters_as_the_whole_text():
+    text = "Contents\n" + "".join(f"Chapter {n}\n" for n in range(1, 6)) + short_chapters(8)
+    lines = text.splitlines(keepends=True)
+    detector = ChapterDetector()
+    base = 0
+    for i in range(0, len(lines), 3):  # pieces end at line breaks, as pages and documents do
+        piece = "".join(lines[i:i + 3])
+        detector.feed(piece, base)
+        base += len(piece)
+    assert detector.finish() == detect_chapters_from_text(text)
@@ -0,0 +1,16 @@
+from library_index import LibraryIndex
+
+
+def test_server_processes_agree_on_library_etags(tmp_path):
+    # Two indexes over one file stand in for two uvicorn workers behind a load balancer
+    index_path = tmp_path / "library.json"
+    first = LibraryIndex(tmp_path, index_path=index_path)
+    second = LibraryIndex(tmp_path, index_path=index_path)
+    assert first.etag(0, None, "title", "asc") == second.etag(0, None, "title", "asc")
+    assert first.etag(0, None, "title", "asc") != first.etag(0, 10, "title", "asc")
+
+    before = second.etag(0, None, "title", "asc")
+    first.set_status("book.mp3", "converting")
+    assert second.etag(0, None, "title", "asc") != before
+    assert first.etag(0, None, "title", "asc") == second.etag(0, None, "title", "asc")
+    assert [book["filename"] for book in second.books()] == ["book.mp3"]
@@ -0,0 +1,28 @@
+from on_demand import plan_chapters, fold_silent_chapters
+
+
+def plan(pieces, titles):
+    """Plan a book whose chapters start at the pieces named in titles ({piece index: title})"""
+    starts = [sum(len(text) for text in pieces[:i]) for i in range(len(pieces))]
+    chapters = [{"title": title, "char_position": starts[i]} for i, title in titles.items()]
+    planned = plan_chapters(chapters, [len(text) for text in pieces])
+    return fold_silent_chapters(planned, iter(pieces))
+
+
+def test_image_only_cover_joins_the_first_chapter():
+    pieces = ["\n", "Chapter One\nIt was a dark night.\n", "Chapter Two\nMorning came.\n"]
+    chapters = plan(pieces, {0: "Cover", 1: "Chapter One", 2: "Chapter Two"})
+    assert [chapter["title"] for chapter in chapters] == ["Chapter One", "Chapter Two"]
+    assert chapters[0]["char_start"] == 0
+    assert chapters[-1]["char_end"] == sum(len(text) for text in pieces)
+
+
+def test_silent_pages_between_and_after_chapters_are_folded():
+    pieces = ["Chapter One\nText.\n", "  \n", "Chapter Two\nText.\n", "\n"]
+    chapters = plan(pieces, {0: "One", 1: "Plate", 2: "Two", 3: "Back cover"})
+    assert [chapter["title"] for chapter in chapters] == ["One", "Two"]
+    assert [(chapter["char_start"], chapter["char_end"]) for chapter in chapters] == [(0, 18), (18, 40)]
+
+
+def test_a_book_without_text_has_no_chapters():
+    assert plan(["\n", " \n"], {0: "Cover", 1: "Blank"}) == []
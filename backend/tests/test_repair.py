@@ -0,0 +1,69 @@
+import time
+
+import pytest
+
+import tts_engine
+from audio_writer import StreamingAudioWriter
+from converter import read_missing_segments, repair_missing_segments, write_missing_segments
+from tts_backends import SILENT_MP3_FRAME, TTSBackend
+from tts_engine import TTSEngine
+
+
+def audio(tag, frames):
+    """MP3 frames whose payload is unique to the segment, so misplaced audio changes the file"""
+    return b"".join(SILENT_MP3_FRAME[:4] + bytes([tag, i]) + SILENT_MP3_FRAME[6:] for i in range(frames))
+
+
+SEGMENTS = {f"segment {tag}": audio(tag, 3 + tag) for tag in range(1, 6)}
+
+
+class ScriptBackend(TTSBackend):
+    name = "script"
+
+    async def synthesize(self, text, voice_id):
+        return SEGMENTS[text]
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    engine = TTSEngine(ScriptBackend())
+    monkeypatch.setattr(tts_engine, "_engine", engine)
+    yield engine
+    engine._loop.call_soon_threadsafe(engine._loop.stop)
+    while engine._loop.is_running():
+        time.sleep(0.01)
+    engine._loop.close()
+
+
+def write_book(path, texts):
+    """Write the segments of `texts` that are in SEGMENTS; the others are recorded as missing"""
+    missing = []
+    writer = StreamingAudioWriter(path)
+    for text in texts:
+        if text in SEGMENTS:
+            writer.write(SEGMENTS[text])
+        else:
+            missing.append({
+                "chunk": 0,
+                "type": "narration",
+                "voice": "narrator",
+                "text": text.removeprefix("lost "),
+                "reason": "tts_failed",
+                "byte_offset": writer.bytes_written,
+                "time_offset": round(writer.duration, 3),
+            })
+    writer.commit()
+    write_missing_segments(path, missing)
+
+
+def test_repaired_audiobook_is_identical_to_one_converted_without_failures(tmp_path, engine):
+    texts = list(SEGMENTS)
+    write_book(tmp_path / "complete.mp3", texts)
+    # The first, a middle and the last segment failed
+    damaged = [f"lost {text}" if i in (0, 2, 4) else text for i, text in enumerate(texts)]
+    write_book(tmp_path / "damaged.mp3", damaged)
+    assert len(read_missing_segments(tmp_path / "damaged.mp3")) == 3
+
+    repair_missing_segments(tmp_path / "damaged.mp3")
+    assert (tmp_path / "damaged.mp3").read_bytes() == (tmp_path / "complete.mp3").read_bytes()
+    assert read_missing_segments(tmp_path / "damaged.mp3") == []
@@ -0,0 +1,24 @@
+import os
+
+from benchmark import FRAMEWORK_IMPORTS, IMPORT_BUDGET_MS, LAZY_MODULES, probe_import
+
+REPEAT = 5  # best of, to keep a busy machine from failing the budget
+
+
+def test_import_main_stays_within_budget(tmp_path):
+    framework, total = [], []
+    for _ in range(REPEAT):
+        # Interleaved, so a burst of load slows both measurements alike
+        framework.append(probe_import(FRAMEWORK_IMPORTS, tmp_path)["seconds"])
+        total.append(probe_import("import main", tmp_path)["seconds"])
+    assert (min(total) - min(framework)) * 1000 < IMPORT_BUDGET_MS
+
+
+def test_import_main_leaves_parsers_and_tts_clients_unloaded(tmp_path):
+    modules = probe_import("import main", tmp_path)["modules"]
+    assert [name for name in LAZY_MODULES if name in modules] == []
+
+
+def test_import_main_creates_no_files(tmp_path):
+    probe_import("import main", tmp_path)
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,62 @@
+import tts_cache
+from tts_cache import SegmentCache
+
+
+def saved_keys(cache):
+    return [key for key, _ in SegmentCache(cache.cache_dir, cache.max_bytes)._entries.items()]
+
+
+def test_hits_do_not_rewrite_the_index(tmp_path, monkeypatch):
+    cache = SegmentCache(tmp_path, max_bytes=1 << 20)
+    cache.put("voice", "one", b"audio one")
+    cache.flush()
+    saves = []
+    monkeypatch.setattr(cache, "_save_index", saves.append)
+    for _ in range(tts_cache.INDEX_SAVE_EVERY * 3):
+        assert cache.get("voice", "one") == b"audio one"
+    assert saves == []
+
+
+def test_flush_saves_the_recency_of_hits(tmp_path):
+    cache = SegmentCache(tmp_path, max_bytes=1 << 20)
+    for text in ("one", "two", "three"):
+        cache.put("voice", text, f"audio {text}".encode())
+    cache.flush()
+    first = saved_keys(cache)[0]
+
+    cache.get("voice", "one")
+    assert saved_keys(cache)[0] == first  # not saved yet
+    cache.flush()
+    assert saved_keys(cache)[-1] == first  # now most recently used
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = SegmentCache(tmp_path, max_bytes=20)
+    cache.put("voice", "one", b"x" * 8)
+    cache.put("voice", "two", b"y" * 8)
+    cache.get("voice", "one")
+    cache.put("voice", "three", b"z" * 8)
+    assert cache.get("voice", "two") is None
+    assert cache.get("voice", "one") == b"x" * 8
+    assert cache.stats()["evictions"] == 1
+
+
+def test_segments_stored_by_another_process_are_hits(tmp_path):
+    # Two caches over one directory stand in for two uvicorn workers
+    first = SegmentCache(tmp_path, max_bytes=1 << 20)
+    second = SegmentCache(tmp_path, max_bytes=1 << 20)
+    first.put("voice", "hello", b"audio hello")
+    assert second.get("voice", "hello") == b"audio hello"
+    assert second.stats()["entries"] == 1
+
+    second.put("voice", "hello", b"other bytes")
+    assert first.get("voice", "hello") == b"audio hello"  # the stored blob is kept
+
+
+def test_no_temporary_files_are_left_behind(tmp_path):
+    cache = SegmentCache(tmp_path, max_bytes=1 << 20)
+    for text in ("one", "two"):
+        cache.put("voice", text, text.encode())
+    cache.flush()
+    assert sorted(path.name for path in tmp_path.rglob("*") if path.is_file() and path.suffix != ".mp3") == \
+        ["index.json"]
@@ -0,0 +1,159 @@
+import asyncio
+
+import time
+
+import pytest
+
+import tts_engine
+from tts_backends import FakeBackend, TTSRequestError
+from tts_engine import TTS_BUDGET_FLOOR, ErrorBudget, ErrorBudgetExceeded, TTSEngine
+
+
+class TracingBackend(FakeBackend):
+    """Echoes the text back after a random delay of up to `latency`, counting overlapping requests.
+
+    `errors` maps texts to the exceptions their next requests raise; tail_rate of the
+    requests take tail_latency instead.
+    """
+
+    def __init__(self, errors=None, **kwargs):
+        super().__init__(**kwargs)
+        self.errors = errors or {}
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def synthesize(self, text, voice_id):
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.errors.get(text):
+                raise self.errors[text].pop(0)
+            if self._random.random() < self.tail_rate:
+                await asyncio.sleep(self.tail_latency)
+            else:
+                await asyncio.sleep(self._random.uniform(0, self.latency))
+            return text.encode()
+        finally:
+            self.in_flight -= 1
+
+
+async def cancel_tasks():
+    tasks = asyncio.all_tasks() - {asyncio.current_task()}
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+@pytest.fixture
+def make_engine():
+    engines = []
+
+    def make(backend, **kwargs):
+        engines.append(TTSEngine(backend, **kwargs))
+        return engines[-1]
+
+    yield make
+    for engine in engines:
+        loop = engine._loop
+        if loop is not None:
+            # Requests left behind by a stopped job are cancelled before the loop goes
+            asyncio.run_coroutine_threadsafe(cancel_tasks(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            while loop.is_running():
+                time.sleep(0.01)
+            loop.close()
+
+
+@pytest.fixture
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(tts_engine, "TTS_RETRY_BASE_SECONDS", 0.001)
+
+
+def segments(count, voice="narrator"):
+    return [{"text": f"segment {i}", "voice": voice} for i in range(count)]
+
+
+def test_segments_are_yielded_in_order_while_requests_overlap(make_engine):
+    backend = TracingBackend(latency=0.02, seed=1)
+    engine = make_engine(backend, concurrency=8)
+    results = list(engine.synthesize_ordered(segments(200)))
+    assert [segment["text"] for segment, _ in results] == [f"segment {i}" for i in range(200)]
+    assert all(audio_bytes == segment["text"].encode() for segment, audio_bytes in results)
+    assert backend.max_in_flight > 1
+
+
+def test_requests_in_flight_stay_within_the_concurrency(make_engine):
+    backend = TracingBackend(latency=0.01, seed=2)
+    engine = make_engine(backend, concurrency=4)
+    list(engine.synthesize_ordered(segments(100), window=50))
+    assert backend.max_in_flight == 4
+    assert backend.calls == 100
+
+
+def test_concurrency_defaults_to_what_the_backend_declares(make_engine):
+    assert make_engine(TracingBackend()).concurrency == FakeBackend.max_concurrency
+
+
+def test_throttled_requests_are_retried_after_the_delay_asked_for(make_engine, fast_retries):
+    backend = TracingBackend(errors={"hello": [TTSRequestError("Too many requests", status=429, retry_after=0.2)]})
+    engine = make_engine(backend, concurrency=8)
+    start = time.monotonic()
+    assert engine.synthesize("hello", "narrator") == b"hello"
+    assert time.monotonic() - start >= 0.2
+    assert backend.calls == 2
+    assert engine.concurrency_limit == 4
+
+
+def test_permanent_client_errors_are_not_retried(make_engine, fast_retries):
+    backend = TracingBackend(errors={"hello": [TTSRequestError("Bad request", status=400)]})
+    engine = make_engine(backend)
+    budget = ErrorBudget()
+    assert engine.submit("hello", "narrator", budget).result() is None
+    assert backend.calls == 1
+    assert (budget.retries, budget.failures) == (0, 1)
+
+
+def test_retries_stop_when_the_retry_budget_is_spent(make_engine, fast_retries):
+    texts = [segment["text"] for segment in segments(50)]
+    backend = TracingBackend(errors={text: [TTSRequestError("Unavailable", status=503)] * 4 for text in texts})
+    engine = make_engine(backend, concurrency=8)
+    budget = ErrorBudget(failure_ratio=1.0)
+    results = list(engine.synthesize_ordered(segments(50), budget=budget))
+    # Without the budget every segment would have been retried three times
+    assert budget.retries == TTS_BUDGET_FLOOR + 0.1 * 50
+    assert backend.calls == 50 + budget.retries
+    assert all(audio_bytes is None for _, audio_bytes in results)
+
+
+def test_a_few_failed_segments_are_tolerated(make_engine, fast_retries):
+    failing = {f"segment {i}": [TTSRequestError("Bad request", status=400)] for i in range(50, 1000, 100)}
+    engine = make_engine(TracingBackend(errors=failing, latency=0.001), concurrency=16)
+    results = list(engine.synthesize_ordered(segments(1000)))
+    assert len(results) == 1000
+    assert sum(audio_bytes is None for _, audio_bytes in results) == 10
+
+
+def test_the_job_stops_when_more_than_the_failure_budget_fails(make_engine, fast_retries):
+    failing = {f"segment {i}": [TTSRequestError("Bad request", status=400)] for i in range(100, 1000)}
+    backend = TracingBackend(errors=failing, latency=0.001)
+    engine = make_engine(backend, concurrency=16)
+    yielded = []
+    with pytest.raises(ErrorBudgetExceeded):
+        for segment, audio_bytes in engine.synthesize_ordered(segments(1000)):
+            yielded.append(audio_bytes)
+    assert sum(audio_bytes is None for audio_bytes in yielded) <= TTS_BUDGET_FLOOR + 0.02 * backend.calls
+    assert backend.calls < 200
+
+
+def test_hedged_requests_stay_within_five_percent(make_engine, monkeypatch):
+    monkeypatch.setattr(tts_engine, "TTS_HEDGE_QUANTILE", 0.5)
+    monkeypatch.setattr(tts_engine, "TTS_HEDGE_MIN_SECONDS", 0.01)
+    # A fifth of the requests are slow enough to be hedged
+    backend = TracingBackend(latency=0.005, tail_rate=0.2, tail_latency=0.1, seed=3)
+    engine = make_engine(backend, concurrency=32)
+    results = list(engine.synthesize_ordered(segments(600)))
+    assert all(audio_bytes == segment["text"].encode() for segment, audio_bytes in results)
+    assert 0 < engine.hedges <= 1 + 0.05 * engine.requests
+    assert backend.calls <= engine.requests + engine.hedges  # a hedge may be cancelled before it starts
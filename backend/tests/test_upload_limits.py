@@ -0,0 +1,43 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(main, "WARM_UP_ON_START", False)
+    monkeypatch.setattr(main, "MAX_UPLOAD_BYTES", 1000)
+    monkeypatch.setattr(main, "MAX_COVER_BYTES", 1000)
+    with TestClient(main.app) as client:
+        monkeypatch.setattr(main.uploads, "max_bytes", 1000)
+        yield client
+
+
+def upload(client, size):
+    return client.post("/upload", files={"file": ("book.epub", b"x" * size, "application/epub+zip")})
+
+
+def stored_files(tmp_path):
+    return sorted(path.name for path in (tmp_path / "uploads").iterdir())
+
+
+def test_upload_with_an_oversized_content_length_is_refused_before_it_is_read(client, tmp_path):
+    response = upload(client, 200 * 1024)
+    assert response.status_code == 413
+    assert "upload limit" in response.json()["detail"]
+    assert stored_files(tmp_path) == []
+
+
+def test_upload_that_grows_past_the_limit_while_copied_is_refused(client, tmp_path):
+    # Small enough to pass the Content-Length check, which allows for the cover and form
+    response = upload(client, 5000)
+    assert response.status_code == 413
+    assert stored_files(tmp_path) == []
+
+
+def test_upload_within_the_limit_is_stored(client, tmp_path):
+    response = upload(client, 1000)
+    assert response.status_code == 200
+    assert stored_files(tmp_path) == ["book.epub"]
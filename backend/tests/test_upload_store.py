@@ -0,0 +1,24 @@
+import io
+
+from upload_store import UploadStore
+
+
+def test_server_processes_see_each_others_uploads(tmp_path):
+    # Two stores over one index stand in for two uvicorn workers
+    index_path = tmp_path / "uploads.json"
+    first = UploadStore(tmp_path, index_path=index_path)
+    second = UploadStore(tmp_path, index_path=index_path)
+
+    assert first.store(io.BytesIO(b"book one"), "one.epub") == ("one.epub", False)
+    assert second.store(io.BytesIO(b"book two"), "two.epub") == ("two.epub", False)
+    assert second.store(io.BytesIO(b"book one"), "copy.epub") == ("one.epub", True)
+
+    voices = {"narrator": "a", "dialogue": "b", "emphasis": "c"}
+    first.record_conversion("two.epub", "two.mp3", voices)
+    assert second.conversion("two.epub") == ("two.mp3", voices)
+
+    second.forget_conversion("two.mp3")
+    assert first.conversion("two.epub") is None
+    assert UploadStore(tmp_path, index_path=index_path).conversion("one.epub") is None
+    assert sorted(entry["filename"] for entry in UploadStore(tmp_path, index_path=index_path)._entries.values()) == \
+        ["one.epub", "two.epub"]
@@ -0,0 +1,301 @@
+import os
+import re
+import random
+import asyncio
+import hashlib
+import importlib
+import struct
+
+TTS_BACKEND = os.environ.get("TTS_BACKEND", "edge")
+
+# HTTP backend; the defaults talk to ElevenLabs, whose key the app already uses
+TTS_HTTP_URL = os.environ.get("TTS_HTTP_URL", "https://api.elevenlabs.io/v1/text-to-speech/{voice}")
+TTS_HTTP_API_KEY = os.environ.get("TTS_HTTP_API_KEY") or os.environ.get("ELEVENLABS_API_KEY", "")
+TTS_HTTP_AUTH_HEADER = os.environ.get("TTS_HTTP_AUTH_HEADER", "xi-api-key")
+TTS_HTTP_MODEL = os.environ.get("TTS_HTTP_MODEL", "")
+TTS_HTTP_MAX_CHARS = int(os.environ.get("TTS_HTTP_MAX_CHARS", "5000"))
+TTS_HTTP_CONCURRENCY = int(os.environ.get("TTS_HTTP_CONCURRENCY", "4"))
+TTS_HTTP_TIMEOUT = float(os.environ.get("TTS_HTTP_TIMEOUT", "120"))
+
+# Local backend: espeak-ng for speech, lameenc for MP3 encoding
+TTS_LOCAL_COMMAND = os.environ.get("TTS_LOCAL_COMMAND", "espeak-ng")
+TTS_LOCAL_BITRATE = int(os.environ.get("TTS_LOCAL_BITRATE", "48"))
+LOCAL_VOICE_VARIANTS = ["m1", "f2", "m3", "f4", "m7", "f1"]
+
+CONNECTION_KEEPALIVE_SECONDS = 60
+
+# One silent MPEG-2 Layer III frame (24 kHz, 48 kbps, mono), the same format Edge TTS returns
+SILENT_MP3_FRAME = b'\xff\xf3\x64\xc0' + b'\x00' * 140
+
+
+class TTSRequestError(RuntimeError):
+    """A failed TTS request, with what the engine needs to decide whether to retry it.
+
+    status is the service's HTTP status if there was one, and retry_after the delay it
+    asked for. Errors from other libraries are classified by their `status` attribute too.
+    """
+
+    def __init__(self, message, status=None, retry_after=None, retryable=True):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+        self.retryable = retryable
+
+
+class TTSBackend:
+    """A speech service. Backends return MP3 audio for one request and declare their limits.
+
+    max_request_chars is the longest text a single request may carry and max_concurrency the
+    number of requests that may safely be in flight at once; the conversion pipeline sizes
+    its chunks, request plan and engine concurrency from them. Coroutines are always run on
+    the TTS engine's loop, so backends may keep loop-bound resources such as sessions.
+    """
+
+    name = "base"
+    max_request_chars = 5000
+    max_concurrency = 8
+
+    async def synthesize(self, text, voice_id):
+        """Return the MP3 audio for text spoken by voice_id"""
+        raise NotImplementedError
+
+    async def warm_up(self):
+        """Load the client and open what the first request would need, e.g. on server start"""
+        pass
+
+    async def aclose(self):
+        pass
+
+
+def _pooled_connector(limit):
+    """aiohttp connector shared by many short-lived sessions.
+
+    edge_tts opens its own ClientSession per request and that session closes the connector
+    it was given, so close() is a no-op here until the pool itself is shut down.
+    """
+    import aiohttp
+
+    class PooledConnector(aiohttp.TCPConnector):
+        _pool_closing = False
+
+        def close(self, *args, **kwargs):
+            if self._pool_closing:
+                return super().close(*args, **kwargs)
+            return asyncio.sleep(0)
+
+        async def shutdown(self):
+            self._pool_closing = True
+            result = self.close()
+            if result is not None:
+                await result
+
+    return PooledConnector(limit=limit, ttl_dns_cache=300, keepalive_timeout=CONNECTION_KEEPALIVE_SECONDS)
+
+
+class EdgeBackend(TTSBackend):
+    """Microsoft Edge read-aloud voices through edge_tts, over one shared connection pool.
+
+    Each request still gets its own websocket (the service closes it after one utterance),
+    but DNS lookups, TLS setup and the connection limit are shared by all of them.
+    """
+
+    name = "edge"
+    max_request_chars = 3000  # edge_tts splits longer texts into several websockets itself
+    max_concurrency = 8
+
+    def __init__(self):
+        self._connector = None
+
+    async def synthesize(self, text, voice_id):
+        import edge_tts
+
+        if self._connector is None:
+            self._connector = _pooled_connector(self.max_concurrency)
+        communicate = edge_tts.Communicate(text, voice_id, connector=self._connector)
+        audio_data = bytearray()
+        async for chunk in communicate.stream():
+            if chunk["type"] == "audio":
+                audio_data.extend(chunk["data"])
+        return bytes(audio_data)
+
+    async def warm_up(self):
+        importlib.import_module("edge_tts")
+        if self._connector is None:
+            self._connector = _pooled_connector(self.max_concurrency)
+
+    async def aclose(self):
+        if self._connector is not None:
+            await self._connector.shutdown()
+            self._connector = None
+
+
+class HTTPBackend(TTSBackend):
+    """A TTS HTTP API (ElevenLabs-style by default) over one keep-alive session.
+
+    Each request is a POST of {"text": ...} to TTS_HTTP_URL with {voice} filled in, and the
+    response body is the MP3 audio.
+    """
+
+    name = "http"
+
+    def __init__(self, url=TTS_HTTP_URL, api_key=TTS_HTTP_API_KEY, max_request_chars=TTS_HTTP_MAX_CHARS,
+                 max_concurrency=TTS_HTTP_CONCURRENCY):
+        self.url = url
+        self.api_key = api_key
+        self.max_request_chars = max_request_chars
+        self.max_concurrency = max_concurrency
+        self._session = None
+
+    def _get_session(self):
+        import aiohttp
+
+        if self._session is None or self._session.closed:
+            headers = {"Accept": "audio/mpeg"}
+            if self.api_key:
+                if TTS_HTTP_AUTH_HEADER.lower() == "authorization":
+                    headers["Authorization"] = f"Bearer {self.api_key}"
+                else:
+                    headers[TTS_HTTP_AUTH_HEADER] = self.api_key
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.max_concurrency,
+                    ttl_dns_cache=300,
+                    keepalive_timeout=CONNECTION_KEEPALIVE_SECONDS,
+                ),
+                headers=headers,
+                timeout=aiohttp.ClientTimeout(total=TTS_HTTP_TIMEOUT),
+            )
+        return self._session
+
+    async def synthesize(self, text, voice_id):
+        body = {"text": text}
+        if TTS_HTTP_MODEL:
+            body["model_id"] = TTS_HTTP_MODEL
+        async with self._get_session().post(self.url.format(voice=voice_id), json=body) as response:
+            if response.status != 200:
+                detail = (await response.text())[:200]
+                try:
+                    retry_after = float(response.headers.get("Retry-After", ""))
+                except ValueError:
+                    retry_after = None
+                raise TTSRequestError(f"TTS HTTP {response.status}: {detail}", response.status, retry_after)
+            return await response.read()
+
+    async def warm_up(self):
+        # A keep-alive connection (DNS, TCP and TLS) for the first POST to reuse; any response will do
+        from urllib.parse import urlsplit
+
+        url = urlsplit(self.url)
+        async with self._get_session().head(f"{url.scheme}://{url.netloc}/", allow_redirects=False):
+            pass
+
+    async def aclose(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+def _wav_to_pcm(wav):
+    """(pcm, sample_rate, channels) of 16-bit WAV data; tolerates the unset sizes of streamed WAVs"""
+    if wav[:4] != b"RIFF" or wav[8:12] != b"WAVE":
+        raise ValueError("not a WAV stream")
+    channels, sample_rate = struct.unpack_from('<HI', wav, 22)
+    data = wav.find(b"data", 12)
+    if data < 0:
+        raise ValueError("WAV stream without a data chunk")
+    return wav[data + 8:], sample_rate, channels
+
+
+class LocalBackend(TTSBackend):
+    """Offline speech on the local CPU with espeak-ng, encoded to MP3 with lameenc.
+
+    Edge-style voice ids such as "en-US-GuyNeural" map to the espeak-ng voice for their
+    language plus a variant picked from the name, so different roles still sound different.
+    """
+
+    name = "local"
+    max_request_chars = 2000
+
+    def __init__(self, command=TTS_LOCAL_COMMAND):
+        self.command = command
+        self.max_concurrency = os.cpu_count() or 2
+
+    @staticmethod
+    def espeak_voice(voice_id):
+        match = re.match(r'^([a-z]{2,3})-([A-Za-z]{2})-', voice_id)
+        if not match:
+            return voice_id
+        digest = hashlib.sha1(voice_id.encode('utf-8')).digest()
+        variant = LOCAL_VOICE_VARIANTS[digest[0] % len(LOCAL_VOICE_VARIANTS)]
+        return f"{match.group(1)}-{match.group(2).lower()}+{variant}"
+
+    @staticmethod
+    def _encode_mp3(wav):
+        import lameenc
+
+        pcm, sample_rate, channels = _wav_to_pcm(wav)
+        encoder = lameenc.Encoder()
+        encoder.set_bit_rate(TTS_LOCAL_BITRATE)
+        encoder.set_in_sample_rate(sample_rate)
+        encoder.set_channels(channels)
+        encoder.set_quality(5)
+        return bytes(encoder.encode(pcm) + encoder.flush())
+
+    async def warm_up(self):
+        importlib.import_module("lameenc")
+
+    async def synthesize(self, text, voice_id):
+        process = await asyncio.create_subprocess_exec(
+            self.command, "-v", self.espeak_voice(voice_id), "--stdout", "--stdin",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        wav, errors = await process.communicate(text.encode('utf-8'))
+        if process.returncode != 0:
+            # The same input fails the same way again
+            raise TTSRequestError(f"{self.command} failed: {errors.decode('utf-8', 'replace')[:200]}", retryable=False)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._encode_mp3, wav)
+
+
+class FakeBackend(TTSBackend):
+    """Silent audio after a fixed delay; for benchmarks and development without a TTS service.
+
+    failure_rate and tail_rate make that fraction of requests fail with HTTP 429 or take
+    tail_latency instead, to exercise retries, throttling and hedging.
+    """
+
+    name = "fake"
+    max_concurrency = 32
+
+    def __init__(self, latency=0.05, frames_per_char=0.5, failure_rate=0.0, tail_rate=0.0, tail_latency=1.0, seed=None):
+        self.latency = latency
+        self.frames_per_char = frames_per_char
+        self.failure_rate = failure_rate
+        self.tail_rate = tail_rate
+        self.tail_latency = tail_latency
+        self._random = random.Random(seed)
+
+    async def synthesize(self, text, voice_id):
+        roll = self._random.random()
+        if roll < self.failure_rate:
+            await asyncio.sleep(self.latency)
+            raise TTSRequestError("Fake throttling", status=429)
+        await asyncio.sleep(self.tail_latency if roll < self.failure_rate + self.tail_rate else self.latency)
+        return SILENT_MP3_FRAME * max(1, int(len(text) * self.frames_per_char))
+
+
+BACKENDS = {
+    "edge": EdgeBackend,
+    "http": HTTPBackend,
+    "local": LocalBackend,
+    "fake": FakeBackend,
+}
+
+
+def create_backend(name=TTS_BACKEND):
+    try:
+        return BACKENDS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown TTS backend {name!r}; choose one of {', '.join(sorted(BACKENDS))}") from None
@@ -0,0 +1,195 @@
+import os
+import json
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+TTS_CACHE_DIR = Path(os.environ.get("TTS_CACHE_DIR", "tts_cache"))
+TTS_CACHE_MAX_BYTES = int(os.environ.get("TTS_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))  # 0 disables the cache
+TTS_OUTPUT_FORMAT = "audio-24khz-48kbitrate-mono-mp3"  # Edge TTS default output
+
+INDEX_SAVE_EVERY = 64  # entries added or removed between index rewrites; hits are only saved with them
+
+
+def normalize_segment_text(text):
+    """Collapse whitespace so trivially different extractions share a cache entry"""
+    return " ".join(text.split())
+
+
+def segment_cache_key(voice_id, text, output_format=TTS_OUTPUT_FORMAT):
+    payload = f"{voice_id}\0{output_format}\0{normalize_segment_text(text)}"
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class SegmentCache:
+    """Content-addressed on-disk cache of synthesized segments with a byte budget and LRU eviction.
+
+    Recency is kept in memory: a hit only reorders the in-memory index, which is written out
+    when entries have been added or removed INDEX_SAVE_EVERY times, and on flush().
+
+    Server processes may share a cache directory: a blob another process wrote is adopted
+    into this one's index the first time it is looked up, and every file is written under a
+    unique temporary name and renamed into place, so concurrent writers never mix their bytes.
+    """
+
+    def __init__(self, cache_dir=TTS_CACHE_DIR, max_bytes=TTS_CACHE_MAX_BYTES, output_format=TTS_OUTPUT_FORMAT):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.output_format = output_format
+        self.index_path = self.cache_dir / "index.json"
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.total_bytes = 0
+        self._entries = OrderedDict()  # key -> size, least recently used first
+        self._dirty = 0  # entries added or removed since the index was saved
+        self._reordered = False  # hits since the index was saved
+        self._generation = 0  # of the last index snapshot taken
+        self._saved_generation = 0
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._load_index()
+
+    def _blob_path(self, key):
+        # Two-level sharding keeps directories small
+        return self.cache_dir / key[:2] / f"{key[2:]}.mp3"
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)["entries"]
+        except (OSError, ValueError, KeyError):
+            entries = self._scan_blobs()
+
+        for key, size in entries:
+            self._entries[key] = size
+            self.total_bytes += size
+
+    def _scan_blobs(self):
+        """Rebuild the index from the blobs on disk, oldest first"""
+        blobs = []
+        for blob in self.cache_dir.glob("??/*.mp3"):
+            stat = blob.stat()
+            blobs.append((stat.st_mtime, blob.parent.name + blob.stem, stat.st_size))
+        blobs.sort()
+        return [(key, size) for _, key, size in blobs]
+
+    def _snapshot(self):
+        """Take the index for _save_index; call with the lock held"""
+        self._dirty = 0
+        self._reordered = False
+        self._generation += 1
+        return self._generation, list(self._entries.items())
+
+    def _save_index(self, snapshot):
+        """Write a snapshot without holding the lock, so lookups carry on meanwhile"""
+        generation, entries = snapshot
+        with self._save_lock:
+            if generation < self._saved_generation:
+                return  # a newer snapshot is already on disk
+            data = json.dumps({"entries": entries}, separators=(',', ':')).encode('utf-8')
+            _write_atomic(self.index_path, data)
+            self._saved_generation = generation
+
+    def _mark_dirty(self):
+        """Count an added or removed entry; returns a snapshot to save once enough have changed"""
+        self._dirty += 1
+        return self._snapshot() if self._dirty >= INDEX_SAVE_EVERY else None
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self.total_bytes -= size
+            self.evictions += 1
+            try:
+                self._blob_path(key).unlink()
+            except FileNotFoundError:
+                pass
+
+    def _adopt(self, key, size):
+        """Index a blob another process wrote; returns a snapshot to save, as _mark_dirty does"""
+        self._entries[key] = size
+        self.total_bytes += size
+        self._evict()
+        return self._mark_dirty()
+
+    def get(self, voice_id, text):
+        """Return cached audio bytes or None"""
+        key = segment_cache_key(voice_id, text, self.output_format)
+        snapshot = None
+        with self._lock:
+            try:
+                audio_bytes = self._blob_path(key).read_bytes()
+            except FileNotFoundError:
+                audio_bytes = None
+                if key in self._entries:
+                    # Evicted by another process
+                    self.total_bytes -= self._entries.pop(key)
+                    snapshot = self._mark_dirty()
+                self.misses += 1
+            else:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    self._reordered = True
+                else:
+                    snapshot = self._adopt(key, len(audio_bytes))
+                self.hits += 1
+        if snapshot is not None:
+            self._save_index(snapshot)
+        return audio_bytes
+
+    def put(self, voice_id, text, audio_bytes):
+        """Store audio for a segment, evicting least recently used entries past the budget"""
+        if not audio_bytes or len(audio_bytes) > self.max_bytes:
+            return
+        key = segment_cache_key(voice_id, text, self.output_format)
+        blob_path = self._blob_path(key)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self._reordered = True
+                return
+            try:
+                size = blob_path.stat().st_size  # another process stored the same segment first
+            except FileNotFoundError:
+                blob_path.parent.mkdir(exist_ok=True)
+                _write_atomic(blob_path, audio_bytes)
+                size = len(audio_bytes)
+            snapshot = self._adopt(key, size)
+        if snapshot is not None:
+            self._save_index(snapshot)
+
+    def flush(self):
+        """Persist the index now, including the recency of entries hit since the last save"""
+        with self._lock:
+            if not self._dirty and not self._reordered:
+                return
+            snapshot = self._snapshot()
+        self._save_index(snapshot)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+def _write_atomic(path, data):
+    """Write data to path through a temporary file of its own, so no other writer can interleave"""
+    fd, temp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(temp_name, path)
+    except BaseException:
+        Path(temp_name).unlink(missing_ok=True)
+        raise
@@ -0,0 +1,320 @@
+import os
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+
+import metrics
+
+TTS_CONCURRENCY = int(os.environ.get("TTS_CONCURRENCY", "0"))  # 0 = what the backend declares safe
+
+# Retries: attempts per segment, with full-jitter exponential backoff between them
+TTS_MAX_ATTEMPTS = int(os.environ.get("TTS_MAX_ATTEMPTS", "4"))
+TTS_RETRY_BASE_SECONDS = float(os.environ.get("TTS_RETRY_BASE_SECONDS", "0.5"))
+TTS_RETRY_MAX_SECONDS = float(os.environ.get("TTS_RETRY_MAX_SECONDS", "30"))
+# Per-job error budget: retries may add this fraction of the job's requests, and the job
+# stops once more than this fraction of its segments failed for good (each plus a small floor)
+TTS_RETRY_BUDGET = float(os.environ.get("TTS_RETRY_BUDGET", "0.1"))
+TTS_FAILURE_BUDGET = float(os.environ.get("TTS_FAILURE_BUDGET", "0.02"))
+TTS_BUDGET_FLOOR = 5
+# Hedging: a second request for segments slower than this latency quantile, for at most
+# this fraction of requests (a quantile of 1 or more turns hedging off)
+TTS_HEDGE_QUANTILE = float(os.environ.get("TTS_HEDGE_QUANTILE", "0.95"))
+TTS_HEDGE_MIN_SECONDS = float(os.environ.get("TTS_HEDGE_MIN_SECONDS", "1.0"))
+TTS_HEDGE_MAX_FRACTION = 0.05
+LATENCY_WINDOW = 200  # recent request latencies the hedge delay is taken from
+AIMD_COOLDOWN_SECONDS = 2.0  # at most one halving of the concurrency limit per cooldown
+
+THROTTLE_STATUSES = {429, 503}
+PERMANENT_STATUSES = {400, 401, 403, 404, 413, 422}
+
+
+def classify_error(error):
+    """(throttled, retryable) for an exception raised by a TTS backend"""
+    status = getattr(error, "status", None)
+    throttled = status in THROTTLE_STATUSES
+    retryable = getattr(error, "retryable", True) and status not in PERMANENT_STATUSES
+    return throttled, retryable
+
+
+def backoff_delay(attempt, retry_after=None):
+    """Full-jitter exponential backoff before retry number `attempt` (1-based)"""
+    delay = random.uniform(0, min(TTS_RETRY_MAX_SECONDS, TTS_RETRY_BASE_SECONDS * 2 ** (attempt - 1)))
+    return max(delay, retry_after or 0)
+
+
+class ErrorBudgetExceeded(RuntimeError):
+    pass
+
+
+class ErrorBudget:
+    """Retry and failure allowance of one conversion job.
+
+    Retries are capped relative to the requests the job has made, so an outage doesn't
+    multiply the load on a struggling service; a job that keeps losing segments is
+    stopped (and can resume later) rather than finished with holes.
+    """
+
+    def __init__(self, retry_ratio=TTS_RETRY_BUDGET, failure_ratio=TTS_FAILURE_BUDGET, floor=TTS_BUDGET_FLOOR):
+        self.retry_ratio = retry_ratio
+        self.failure_ratio = failure_ratio
+        self.floor = floor
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+
+    def take_retry(self):
+        if self.retries >= self.floor + self.retry_ratio * self.requests:
+            return False
+        self.retries += 1
+        return True
+
+    @property
+    def exhausted(self):
+        return self.failures > self.floor + self.failure_ratio * self.requests
+
+
+class AdaptiveLimiter:
+    """AIMD limit on requests in flight, used like a semaphore on the engine loop.
+
+    Each success raises the limit by 1/limit (about one more slot per round of requests)
+    up to the backend's maximum; throttling responses halve it, at most once per cooldown.
+    """
+
+    def __init__(self, maximum):
+        self.maximum = maximum
+        self.limit = float(maximum)
+        self.in_flight = 0
+        self._condition = asyncio.Condition()
+        self._last_decrease = 0.0
+
+    async def __aenter__(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def __aexit__(self, exc_type, exc, tb):
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def on_success(self):
+        self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+    def on_throttle(self):
+        now = time.monotonic()
+        if now - self._last_decrease >= AIMD_COOLDOWN_SECONDS:
+            self._last_decrease = now
+            self.limit = max(1.0, self.limit / 2)
+            print(f"TTS service is throttling; concurrency limit lowered to {int(self.limit)}")
+
+
+class TTSEngine:
+    """Shared async synthesis engine with an adaptive number of TTS requests in flight.
+
+    Failed requests are retried with backoff within the job's error budget, and requests
+    in the slow tail get a hedged duplicate; whichever answers first wins.
+    """
+
+    def __init__(self, backend=None, concurrency=TTS_CONCURRENCY, cache=None):
+        if backend is None:
+            from tts_backends import create_backend
+            backend = create_backend()
+        self.backend = backend
+        self.concurrency = max(1, concurrency or backend.max_concurrency)
+        self.max_request_chars = backend.max_request_chars
+        self.cache = cache
+        self._loop = None
+        self._limiter = None
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self.requests = 0
+        self.hedges = 0
+        self._lock = threading.Lock()
+
+    def _get_loop(self):
+        # All streams share one long-lived loop on a daemon thread
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="tts-engine", daemon=True).start()
+                self._limiter = AdaptiveLimiter(self.concurrency)
+                self._loop = loop
+        return self._loop
+
+    def warm_up(self, timeout=30):
+        """Start the engine loop and let the backend load its client and connect before the first request"""
+        asyncio.run_coroutine_threadsafe(self.backend.warm_up(), self._get_loop()).result(timeout)
+
+    @property
+    def concurrency_limit(self):
+        return int(self._limiter.limit) if self._limiter is not None else self.concurrency
+
+    async def _request(self, text, voice_id):
+        """One backend request within the concurrency limit"""
+        async with self._limiter:
+            start = time.perf_counter()
+            audio_bytes = await self.backend.synthesize(text, voice_id)
+            elapsed = time.perf_counter() - start
+        if not audio_bytes:
+            from tts_backends import TTSRequestError
+            raise TTSRequestError("No audio received")
+        self._latencies.append(elapsed)
+        self._limiter.on_success()
+        metrics.TTS_REQUEST_SECONDS.labels(self.backend.name, voice_id).observe(elapsed)
+        metrics.TTS_CHARACTERS.labels(self.backend.name).inc(len(text))
+        return audio_bytes
+
+    def _hedge_delay(self):
+        """How long to wait for a request before hedging it; None until enough latencies are known"""
+        if TTS_HEDGE_QUANTILE >= 1 or len(self._latencies) < LATENCY_WINDOW // 4:
+            return None
+        latencies = sorted(self._latencies)
+        return max(TTS_HEDGE_MIN_SECONDS, latencies[int(TTS_HEDGE_QUANTILE * (len(latencies) - 1))])
+
+    async def _hedged_request(self, text, voice_id):
+        primary = asyncio.ensure_future(self._request(text, voice_id))
+        hedge = None
+        try:
+            delay = self._hedge_delay()
+            if delay is not None:
+                done, _ = await asyncio.wait({primary}, timeout=delay)
+                if not done and self.hedges < 1 + TTS_HEDGE_MAX_FRACTION * self.requests:
+                    self.hedges += 1
+                    metrics.TTS_HEDGED_REQUESTS.labels(self.backend.name).inc()
+                    hedge = asyncio.ensure_future(self._request(text, voice_id))
+                    pending = {primary, hedge}
+                    while pending:
+                        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                        for task in done:
+                            if task.exception() is None:
+                                return task.result()
+            # No hedge, or both requests failed: the first request's outcome stands
+            return await primary
+        finally:
+            primary.cancel()
+            if hedge is not None:
+                hedge.cancel()
+
+    async def _generate_audio(self, text, voice_id, budget):
+        loop = asyncio.get_running_loop()
+        # The same voice id can mean different voices on different backends
+        cache_voice = f"{self.backend.name}:{voice_id}"
+        if self.cache is not None:
+            cached = await loop.run_in_executor(None, self.cache.get, cache_voice, text)
+            if cached is not None:
+                metrics.TTS_CACHE_HITS.inc()
+                return cached
+
+        self.requests += 1
+        budget.requests += 1
+        attempt = 0
+        while True:
+            try:
+                audio_bytes = await self._hedged_request(text, voice_id)
+                break
+            except Exception as e:
+                throttled, retryable = classify_error(e)
+                if throttled:
+                    self._limiter.on_throttle()
+                attempt += 1
+                if not retryable or attempt >= TTS_MAX_ATTEMPTS or not budget.take_retry():
+                    raise
+                delay = backoff_delay(attempt, getattr(e, "retry_after", None))
+                metrics.TTS_RETRIES.labels(self.backend.name).inc()
+                print(f"TTS request failed ({e}); retry {attempt}/{TTS_MAX_ATTEMPTS - 1} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+        if self.cache is not None:
+            await loop.run_in_executor(None, self.cache.put, cache_voice, text, audio_bytes)
+        return audio_bytes
+
+    async def _safe_generate_audio(self, text, voice_id, budget):
+        try:
+            return await self._generate_audio(text, voice_id, budget)
+        except Exception as e:
+            budget.failures += 1
+            metrics.TTS_FAILED_REQUESTS.labels(self.backend.name).inc()
+            print(f"Error generating audio: {e}")
+            return None
+
+    def submit(self, text, voice_id, budget=None):
+        """Schedule one segment on the engine loop and return a concurrent Future"""
+        loop = self._get_loop()
+        return asyncio.run_coroutine_threadsafe(self._safe_generate_audio(text, voice_id, budget or ErrorBudget()), loop)
+
+    def synthesize(self, text, voice_id):
+        """Blocking synthesis of a single segment; returns audio bytes or None"""
+        return self.submit(text, voice_id).result()
+
+    async def synthesize_async(self, text, voice_id):
+        """Awaitable synthesis for use from another event loop (e.g. FastAPI handlers)"""
+        return await asyncio.wrap_future(self.submit(text, voice_id))
+
+    def synthesize_ordered(self, segments, window=None, cancel_event=None, budget=None):
+        """Synthesize segment dicts concurrently and yield (segment, audio_bytes) in input order.
+
+        Each segment needs 'text' and 'voice' keys. At most `window` segments are
+        scheduled ahead of the one being yielded, so memory stays bounded. Setting
+        `cancel_event` stops the iteration and cancels the requests still in flight.
+        audio_bytes is None for a segment that failed after its retries; once more have
+        failed than `budget` allows, ErrorBudgetExceeded is raised instead.
+        """
+        window = window or self.concurrency * 2
+        budget = budget or ErrorBudget()
+        pending = deque()
+        segments = iter(segments)
+        exhausted = False
+
+        while True:
+            if cancel_event is not None and cancel_event.is_set():
+                for _, future in pending:
+                    future.cancel()
+                return
+
+            while not exhausted and len(pending) < window:
+                segment = next(segments, None)
+                if segment is None:
+                    exhausted = True
+                    break
+                pending.append((segment, self.submit(segment['text'], segment['voice'], budget)))
+
+            if not pending:
+                return
+
+            segment, future = pending.popleft()
+            audio_bytes = future.result()
+            if audio_bytes is None and budget.exhausted:
+                for _, future in pending:
+                    future.cancel()
+                raise ErrorBudgetExceeded(f"{budget.failures} of {budget.requests} TTS requests failed")
+            yield segment, audio_bytes
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """Return the process-wide TTS engine shared by /convert and /preview"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            from tts_cache import SegmentCache, TTS_CACHE_MAX_BYTES
+            cache = SegmentCache() if TTS_CACHE_MAX_BYTES > 0 else None
+            _engine = TTSEngine(cache=cache)
+        return _engine
+
+
+def close_engine():
+    """Save the segment cache index and release the backend's connections, e.g. on server shutdown"""
+    with _engine_lock:
+        engine = _engine
+    if engine is not None and engine.cache is not None:
+        engine.cache.flush()  # recency of cache hits is only saved with the index
+    if engine is None or engine._loop is None:
+        return
+    try:
+        asyncio.run_coroutine_threadsafe(engine.backend.aclose(), engine._loop).result(timeout=5)
+    except Exception as e:
+        print(f"Error closing TTS backend: {e}")
@@ -0,0 +1,127 @@
+import os
+import time
+import uuid
+import hashlib
+from pathlib import Path
+
+from shared_index import SharedIndex
+
+UPLOAD_INDEX_PATH = Path(os.environ.get("UPLOAD_INDEX_PATH", "uploads.json"))
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", str(512 * 1024 * 1024)))
+MAX_COVER_BYTES = int(os.environ.get("MAX_COVER_BYTES", str(10 * 1024 * 1024)))
+UPLOAD_COPY_CHUNK = 1024 * 1024
+
+
+class UploadTooLarge(ValueError):
+    def __init__(self, limit):
+        super().__init__(f"File is larger than the {limit // (1024 * 1024)} MB upload limit")
+        self.limit = limit
+
+
+def copy_hashed(source, dest_path, max_bytes):
+    """Copy a file object to dest_path in chunks, hashing on the way; returns (sha256, size).
+
+    Blocking, so call it from a worker thread. Nothing is left at dest_path if the copy
+    fails or the source is larger than max_bytes.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(dest_path, 'wb') as f:
+            while True:
+                block = source.read(UPLOAD_COPY_CHUNK)
+                if not block:
+                    break
+                size += len(block)
+                if max_bytes and size > max_bytes:
+                    raise UploadTooLarge(max_bytes)
+                digest.update(block)
+                f.write(block)
+    except BaseException:
+        Path(dest_path).unlink(missing_ok=True)
+        raise
+    return digest.hexdigest(), size
+
+
+class UploadStore(SharedIndex):
+    """Uploaded books indexed by content hash, so the same book is stored and converted once.
+
+    Each entry records the upload's filename and, once converted, the audiobook and voices
+    it was converted with. Server processes share the index file as they share the library
+    index: each reloads it when another has replaced it, and changes are made under a file
+    lock so none are lost.
+    """
+
+    def __init__(self, upload_dir, index_path=UPLOAD_INDEX_PATH, max_bytes=MAX_UPLOAD_BYTES):
+        super().__init__(index_path)
+        self.upload_dir = Path(upload_dir)
+        self.max_bytes = max_bytes
+        self._entries = {}  # sha256 -> entry
+        self._by_filename = {}  # upload filename -> sha256
+        self._load()
+
+    def _read(self, data):
+        entries = data["uploads"]
+        self._by_filename = {entry["filename"]: digest for digest, entry in entries.items()}
+        self._entries = entries
+
+    def _dump(self):
+        return {"uploads": self._entries}
+
+    def store(self, source, filename):
+        """Stream an upload into the upload directory; blocking, so run it in a worker thread.
+
+        Returns (filename, duplicate). If a file with the same content is already stored,
+        the new copy is discarded and the existing file's name is returned with duplicate=True.
+        """
+        temp_path = self.upload_dir / f".upload-{uuid.uuid4().hex}.part"
+        digest, size = copy_hashed(source, temp_path, self.max_bytes)
+
+        with self._changing():
+            existing = self._entries.get(digest)
+            if existing is not None:
+                existing_path = self.upload_dir / existing["filename"]
+                if existing_path.exists() and existing_path.stat().st_size == size:
+                    temp_path.unlink(missing_ok=True)
+                    return existing["filename"], True
+
+            os.replace(temp_path, self.upload_dir / filename)
+            # Replacing a file by name orphans whatever content it held before
+            previous = self._by_filename.pop(filename, None)
+            if previous is not None:
+                self._entries.pop(previous, None)
+            if existing is not None:
+                self._by_filename.pop(existing["filename"], None)
+            self._entries[digest] = {"filename": filename, "size": size, "uploaded_at": time.time()}
+            self._by_filename[filename] = digest
+            self._save()
+        return filename, False
+
+    def record_conversion(self, filename, audiobook, voices):
+        """Remember that the upload was converted to audiobook with voices"""
+        with self._changing():
+            digest = self._by_filename.get(filename)
+            if digest is not None:
+                self._entries[digest].update({"audiobook": audiobook, "voices": voices})
+                self._save()
+
+    def conversion(self, filename):
+        """(audiobook, voices) the upload was converted with, or None"""
+        with self._lock:
+            self._sync()
+            entry = self._entries.get(self._by_filename.get(filename))
+            if entry is None or "audiobook" not in entry:
+                return None
+            return entry["audiobook"], entry["voices"]
+
+    def forget_conversion(self, audiobook):
+        """Called when an audiobook is deleted, so its upload gets converted again next time"""
+        with self._changing():
+            changed = False
+            for entry in self._entries.values():
+                if entry.get("audiobook") == audiobook:
+                    entry.pop("audiobook")
+                    entry.pop("voices", None)
+                    changed = True
+            if changed:
+                self._save()
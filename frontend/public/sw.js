@@ -1,4 +1,7 @@
-const CACHE_NAME = 'audiobook-converter-v1';
+const CACHE_NAME = 'audiobook-converter-v2';
+// Chapter audio fetched by the player ahead of playback, kept for offline listening
+const CHAPTER_CACHE = 'audiobook-chapters-v1';
+const MAX_CACHED_CHAPTERS = 40;
 const urlsToCache = [
     '/',
     '/index.html',
@@ -11,7 +14,74 @@ self.addEventListener('install', event => {
     );
 });
 
+self.addEventListener('activate', event => {
+    event.waitUntil(
+        caches.keys().then(names => Promise.all(
+            names
+                .filter(name => name !== CACHE_NAME && name !== CHAPTER_CACHE)
+                .map(name => caches.delete(name))
+        ))
+    );
+});
+
+// Chapter segment URLs carry the audio version (?v=), so a cached copy never goes stale
+const isChapterSegment = url =>
+    /\/audio\/[^/]+\/chapters\/[^/]+$/.test(url.pathname) && url.searchParams.has('v');
+
+async function trimChapterCache(cache) {
+    const keys = await cache.keys();
+    // Keys come back in insertion order, oldest first
+    await Promise.all(keys.slice(0, Math.max(0, keys.length - MAX_CACHED_CHAPTERS)).map(key => cache.delete(key)));
+}
+
+async function rangeResponse(response, range) {
+    const body = await response.blob();
+    const match = /^bytes=(\d*)-(\d*)$/.exec(range.trim());
+    let start = 0;
+    let end = body.size - 1;
+    if (match && match[1] !== '') {
+        start = Number(match[1]);
+        if (match[2] !== '') end = Math.min(Number(match[2]), end);
+    } else if (match && match[2] !== '') {
+        start = Math.max(0, body.size - Number(match[2]));
+    }
+    if (start > end) {
+        return new Response(null, { status: 416, headers: { 'Content-Range': `bytes */${body.size}` } });
+    }
+    return new Response(body.slice(start, end + 1), {
+        status: 206,
+        headers: {
+            'Content-Type': response.headers.get('Content-Type') || 'audio/mpeg',
+            'Content-Range': `bytes ${start}-${end}/${body.size}`,
+            'Content-Length': String(end - start + 1),
+            'Accept-Ranges': 'bytes',
+        },
+    });
+}
+
+async function chapterSegment(request) {
+    const cache = await caches.open(CHAPTER_CACHE);
+    const cached = await cache.match(request.url);
+    const range = request.headers.get('range');
+    if (cached) {
+        return range ? rangeResponse(cached, range) : cached;
+    }
+    // The audio element asks for ranges; those go to the network so playback starts at once.
+    // Whole-segment fetches (the player's prefetch of the next chapter) are kept.
+    const response = await fetch(request);
+    if (!range && response.status === 200) {
+        await cache.put(request.url, response.clone());
+        await trimChapterCache(cache);
+    }
+    return response;
+}
+
 self.addEventListener('fetch', event => {
+    const url = new URL(event.request.url);
+    if (event.request.method === 'GET' && isChapterSegment(url)) {
+        event.respondWith(chapterSegment(event.request));
+        return;
+    }
     event.respondWith(
         caches.match(event.request)
             .then(response => response || fetch(event.request))
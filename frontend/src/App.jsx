@@ -15,29 +15,36 @@ function App() {
   const [view, setView] = useState('home'); // 'home' or 'player'
   const [conversionStatus, setConversionStatus] = useState({});
 
-  const fetchConversionStatus = async (filename) => {
-    try {
-      const response = await axios.get(`${API_URL}/conversion-status/${filename}`);
-      setConversionStatus(prev => ({
-        ...prev,
-        [filename]: response.data
-      }));
-    } catch (error) {
-      console.error(`Error fetching status for ${filename}:`, error);
-    }
-  };
-
-  // Poll for conversion status
+  // Progress and library changes are pushed by the server over Server-Sent Events
   React.useEffect(() => {
-    const interval = setInterval(() => {
-      books.forEach(book => {
-        if (book.status === 'converting' || (conversionStatus[book.filename] && conversionStatus[book.filename].status !== 'completed')) {
-          fetchConversionStatus(book.filename);
-        }
+    const source = new EventSource(`${API_URL}/events`);
+    let libraryRefresh = null;
+
+    source.addEventListener('progress', (event) => {
+      const { filename, ...status } = JSON.parse(event.data);
+      setConversionStatus(prev => ({ ...prev, [filename]: status }));
+    });
+
+    source.addEventListener('removed', (event) => {
+      const { filename } = JSON.parse(event.data);
+      setConversionStatus(prev => {
+        const next = { ...prev };
+        delete next[filename];
+        return next;
       });
-    }, 2000);
-    return () => clearInterval(interval);
-  }, [books, conversionStatus]);
+    });
+
+    source.addEventListener('library', () => {
+      // Several changes often arrive together; refetch once
+      clearTimeout(libraryRefresh);
+      libraryRefresh = setTimeout(() => fetchBooks(), 300);
+    });
+
+    return () => {
+      clearTimeout(libraryRefresh);
+      source.close();
+    };
+  }, []);
 
   const handleUploadSuccess = () => {
     setTimeout(() => {
@@ -94,6 +101,7 @@ function App() {
         <PlayerView
           filename={currentAudio}
           onBack={handleBackToHome}
+          converting={books.some(book => book.filename === currentAudio && book.status === 'converting' && conversionStatus[book.filename]?.status !== 'completed')}
         />
       ) : (
         // Home View
@@ -205,7 +213,9 @@ function App() {
                               {!isConverting && (
                                 <div className="mt-1">
                                   <span className="text-xs text-slate-400">
-                                    {book.status === 'completed' ? 'Ready to play' : book.status}
+                                    {book.status === 'completed' ? 'Ready to play'
+                                      : book.status === 'on_demand' ? (status?.message || 'Converts as you listen')
+                                      : book.status}
                                   </span>
                                 </div>
                               )}
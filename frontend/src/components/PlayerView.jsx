@@ -3,14 +3,38 @@ import { ArrowLeft, Play, Pause, SkipBack, SkipForward, List } from 'lucide-reac
 import { API_URL } from '../config';
 import axios from 'axios';
 
-const PlayerView = ({ filename, onBack }) => {
+// Index of the segment that plays at `time` seconds into the book
+const segmentAt = (manifest, time) => {
+    let index = 0;
+    while (index + 1 < manifest.segments.length && manifest.segments[index + 1].start <= time) {
+        index++;
+    }
+    return index;
+};
+
+const PlayerView = ({ filename, onBack, converting = false }) => {
     const audioRef = useRef(null);
+    // While a book is still converting, the server only has its finished prefix;
+    // reload the source when playback catches up so newly generated audio is picked up
+    const [sourceVersion, setSourceVersion] = useState(0);
+    const resumeAtRef = useRef(null);
+    const partialSourceRef = useRef(false);
     const [chapters, setChapters] = useState([]);
     const [isPlaying, setIsPlaying] = useState(false);
     const [currentTime, setCurrentTime] = useState(0);
     const [duration, setDuration] = useState(0);
     const [currentChapterIndex, setCurrentChapterIndex] = useState(0);
     const [showChapters, setShowChapters] = useState(true);
+    // Finished books with a segment manifest play chapter by chapter, so jumping far ahead
+    // fetches one chapter rather than a range of the whole file, and the next one is prefetched
+    const [segments, setSegments] = useState(null);
+    const [segmentIndex, setSegmentIndex] = useState(0);
+    const segmentOffset = segments ? segments.segments[segmentIndex].start : 0;
+    // On-demand books convert chapters as they are reached: the player reports where it is,
+    // and plays what has been generated of a chapter that is not ready yet
+    const onDemand = Boolean(segments?.on_demand);
+    const currentSegment = segments ? segments.segments[segmentIndex] : null;
+    const lastReportRef = useRef(0);
 
     useEffect(() => {
         if (filename) {
@@ -25,6 +49,69 @@ const PlayerView = ({ filename, onBack }) => {
         }
     }, [filename]);
 
+    useEffect(() => {
+        setSegments(null);
+        setSegmentIndex(0);
+        if (filename && !converting) {
+            axios.get(`${API_URL}/segments/${filename}`)
+                .then(res => {
+                    if (res.data.segments && res.data.segments.length > 0) {
+                        // Carry on from where the whole-file source had got to
+                        const time = audioRef.current ? audioRef.current.currentTime : 0;
+                        const index = segmentAt(res.data, time);
+                        resumeAtRef.current = time - res.data.segments[index].start;
+                        setSegmentIndex(index);
+                        setSegments(res.data);
+                    }
+                })
+                .catch(() => { /* no segments yet: play the whole file */ });
+        }
+    }, [filename, converting]);
+
+    const refreshSegments = () => {
+        axios.get(`${API_URL}/segments/${filename}`)
+            .then(res => {
+                const becameReady = currentSegment && !currentSegment.ready && res.data.segments[segmentIndex]?.ready;
+                if (becameReady && audioRef.current) {
+                    // The source switches to the finished chapter; keep the place in it
+                    resumeAtRef.current = audioRef.current.currentTime;
+                }
+                setSegments(res.data);
+            })
+            .catch(() => { /* keep the manifest we have */ });
+    };
+
+    const reportPlayback = (index, position) => {
+        lastReportRef.current = Date.now();
+        axios.post(`${API_URL}/playback/${filename}`, { chapter: index, position })
+            .catch(err => console.error("Error reporting playback:", err));
+    };
+
+    useEffect(() => {
+        // Entering a chapter queues it (if need be) and the chapters after it
+        if (onDemand) {
+            reportPlayback(segmentIndex, resumeAtRef.current || 0);
+        }
+    }, [onDemand, segmentIndex]);
+
+    useEffect(() => {
+        // Watch for the chapter being played, or the next one, to finish converting
+        const next = segments?.segments[segmentIndex + 1];
+        if (!onDemand || (currentSegment.ready && (!next || next.ready))) return;
+        const timer = setInterval(refreshSegments, 5000);
+        return () => clearInterval(timer);
+    }, [segments, segmentIndex]);
+
+    useEffect(() => {
+        // Segment URLs are immutable; fetching the next one lets the service worker keep it
+        const next = segments?.segments[segmentIndex + 1];
+        if (next?.url) {
+            fetch(`${API_URL}${next.url}`)
+                .then(res => res.blob())
+                .catch(() => { /* prefetch only */ });
+        }
+    }, [segments, segmentIndex]);
+
     useEffect(() => {
         if (audioRef.current && filename) {
             audioRef.current.play();
@@ -45,11 +132,19 @@ const PlayerView = ({ filename, onBack }) => {
 
     const handleTimeUpdate = () => {
         if (audioRef.current) {
-            setCurrentTime(audioRef.current.currentTime);
+            const time = segmentOffset + audioRef.current.currentTime;
+            setCurrentTime(time);
 
+            if (segments) {
+                setCurrentChapterIndex(segmentIndex);
+                if (onDemand && Date.now() - lastReportRef.current > 30000) {
+                    reportPlayback(segmentIndex, audioRef.current.currentTime);
+                }
+                return;
+            }
             // Find current chapter
             for (let i = chapters.length - 1; i >= 0; i--) {
-                if (audioRef.current.currentTime >= chapters[i].timestamp) {
+                if (time >= chapters[i].timestamp) {
                     setCurrentChapterIndex(i);
                     break;
                 }
@@ -57,18 +152,83 @@ const PlayerView = ({ filename, onBack }) => {
         }
     };
 
+    // Seek to a time in the whole book, switching segments if it lies in another chapter
+    const seekTo = (time) => {
+        if (!audioRef.current) return;
+        if (!segments) {
+            audioRef.current.currentTime = time;
+            return;
+        }
+        const index = segmentAt(segments, time);
+        const offset = time - segments.segments[index].start;
+        if (index === segmentIndex) {
+            audioRef.current.currentTime = offset;
+        } else {
+            resumeAtRef.current = offset;
+            setSegmentIndex(index);
+        }
+    };
+
     const handleLoadedMetadata = () => {
         if (audioRef.current) {
-            setDuration(audioRef.current.duration);
+            setDuration(segments ? segments.duration : audioRef.current.duration);
+            partialSourceRef.current = onDemand ? !currentSegment.ready : converting;
+            if (resumeAtRef.current !== null) {
+                audioRef.current.currentTime = resumeAtRef.current;
+                resumeAtRef.current = null;
+                audioRef.current.play().then(() => setIsPlaying(true)).catch(() => setIsPlaying(false));
+            }
         }
     };
 
-    const jumpToChapter = async (timestamp) => {
+    const reloadGrowingSource = (delay) => {
+        if (audioRef.current) {
+            resumeAtRef.current = audioRef.current.currentTime;
+        }
+        setTimeout(() => setSourceVersion(v => v + 1), delay);
+    };
+
+    const handleEnded = () => {
+        if (onDemand && partialSourceRef.current) {
+            // Played all that had been generated of this chapter; it may be finished by now
+            refreshSegments();
+            reloadGrowingSource(3000);
+        } else if (segments && segmentIndex + 1 < segments.segments.length) {
+            resumeAtRef.current = 0;
+            setSegmentIndex(segmentIndex + 1);
+        } else if (partialSourceRef.current) {
+            // Reached the end of what had been generated when the source was loaded
+            reloadGrowingSource(3000);
+        } else {
+            setIsPlaying(false);
+        }
+    };
+
+    const handleError = () => {
+        if (onDemand && !currentSegment.ready) {
+            // Chapter not started yet, or being converted by another server process
+            refreshSegments();
+            reloadGrowingSource(3000);
+        } else if (converting) {
+            // Nothing generated yet; try again shortly
+            reloadGrowingSource(5000);
+        }
+    };
+
+    const jumpToChapter = async (index) => {
+        if (segments && segments.segments[index]) {
+            resumeAtRef.current = 0;
+            if (index !== segmentIndex) {
+                setSegmentIndex(index);
+                return;
+            }
+        }
         if (audioRef.current) {
             try {
                 // Ensure timestamp is a number
-                const time = parseFloat(timestamp);
+                const time = segments ? 0 : parseFloat(chapters[index]?.timestamp);
                 if (!isNaN(time)) {
+                    resumeAtRef.current = null;
                     audioRef.current.currentTime = time;
                     const playPromise = audioRef.current.play();
                     if (playPromise !== undefined) {
@@ -84,15 +244,11 @@ const PlayerView = ({ filename, onBack }) => {
     };
 
     const skipForward = () => {
-        if (audioRef.current) {
-            audioRef.current.currentTime = Math.min(audioRef.current.currentTime + 30, duration);
-        }
+        seekTo(Math.min(currentTime + 30, duration));
     };
 
     const skipBackward = () => {
-        if (audioRef.current) {
-            audioRef.current.currentTime = Math.max(audioRef.current.currentTime - 30, 0);
-        }
+        seekTo(Math.max(currentTime - 30, 0));
     };
 
     const formatTime = (seconds) => {
@@ -115,6 +271,12 @@ const PlayerView = ({ filename, onBack }) => {
                     <ArrowLeft className="w-6 h-6" />
                 </button>
                 <h1 className="text-lg font-bold truncate flex-1">{filename}</h1>
+                {converting && (
+                    <span className="text-xs text-blue-300 whitespace-nowrap">Still converting</span>
+                )}
+                {onDemand && !currentSegment.ready && (
+                    <span className="text-xs text-blue-300 whitespace-nowrap">Converting this chapter...</span>
+                )}
                 {chapters.length > 0 && (
                     <button
                         onClick={() => setShowChapters(!showChapters)}
@@ -142,12 +304,10 @@ const PlayerView = ({ filename, onBack }) => {
                     <div className="w-full max-w-md mb-8">
                         <div className="bg-slate-700 h-2 rounded-full overflow-hidden cursor-pointer"
                             onClick={(e) => {
-                                if (audioRef.current) {
-                                    const rect = e.currentTarget.getBoundingClientRect();
-                                    const x = e.clientX - rect.left;
-                                    const percentage = x / rect.width;
-                                    audioRef.current.currentTime = percentage * duration;
-                                }
+                                const rect = e.currentTarget.getBoundingClientRect();
+                                const x = e.clientX - rect.left;
+                                const percentage = x / rect.width;
+                                seekTo(percentage * duration);
                             }}
                         >
                             <div
@@ -220,7 +380,7 @@ const PlayerView = ({ filename, onBack }) => {
                                         <li key={index}>
                                             <button
                                                 onClick={() => {
-                                                    jumpToChapter(chapter.timestamp);
+                                                    jumpToChapter(index);
                                                     // Close sidebar on mobile after selection
                                                     if (window.innerWidth < 768) {
                                                         setShowChapters(false);
@@ -253,10 +413,15 @@ const PlayerView = ({ filename, onBack }) => {
             {/* Hidden Audio Element */}
             <audio
                 ref={audioRef}
-                src={`${API_URL}/audio/${filename}`}
+                src={segments
+                    ? (currentSegment.url
+                        ? `${API_URL}${currentSegment.url}`
+                        : `${API_URL}/audio/${filename}/chapters/${segmentIndex}?attempt=${sourceVersion}`)
+                    : `${API_URL}/audio/${filename}${sourceVersion ? `?v=${sourceVersion}` : ''}`}
                 onTimeUpdate={handleTimeUpdate}
                 onLoadedMetadata={handleLoadedMetadata}
-                onEnded={() => setIsPlaying(false)}
+                onEnded={handleEnded}
+                onError={handleError}
                 className="hidden"
             />
         </div>
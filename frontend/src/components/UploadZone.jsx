@@ -10,6 +10,8 @@ const UploadZone = ({ onUploadSuccess }) => {
     const [narratorVoice, setNarratorVoice] = useState('en-US-GuyNeural');
     const [dialogueVoice, setDialogueVoice] = useState('en-US-JennyNeural');
     const [emphasisVoice, setEmphasisVoice] = useState('en-US-DavisNeural');
+    // Convert each chapter when it is played instead of the whole book up front
+    const [onDemand, setOnDemand] = useState(false);
     const [uploadedFile, setUploadedFile] = useState(null);
     const [previewUrl, setPreviewUrl] = useState(null);
     const [generatingPreview, setGeneratingPreview] = useState(false);
@@ -97,6 +99,7 @@ const UploadZone = ({ onUploadSuccess }) => {
                 narrator_voice_id: narratorVoice,
                 dialogue_voice_id: dialogueVoice,
                 emphasis_voice_id: emphasisVoice,
+                on_demand: onDemand,
             });
 
             setConversionStage('done');
@@ -226,6 +229,20 @@ const UploadZone = ({ onUploadSuccess }) => {
                 </select>
             </div>
 
+            <label className="mb-4 flex items-start gap-2 text-sm text-slate-300 cursor-pointer">
+                <input
+                    type="checkbox"
+                    checked={onDemand}
+                    onChange={(e) => setOnDemand(e.target.checked)}
+                    className="mt-0.5 accent-blue-500"
+                    disabled={uploading}
+                />
+                <span>
+                    Convert as I listen
+                    <span className="block text-xs text-slate-500">Chapters are converted when you get to them, so playback starts in seconds</span>
+                </span>
+            </label>
+
             <div className="relative border-2 border-dashed border-slate-600 rounded-lg p-8 text-center hover:border-blue-500 transition-colors">
                 <input
                     type="file"